@@ -0,0 +1,466 @@
+"""
+Benchmark harness for the feature extraction, training and inference paths.
+
+Run from the project root:
+
+    python -m benchmarks.run [--quick] [--only PREFIX] [--output FILE]
+                             [--baseline FILE] [--threshold 0.2]
+
+Results are written as JSON, by default to out/benchmarks. Passing the JSON
+file of an earlier run as baseline compares the median latencies and exits
+with 1 if any benchmark got slower than the threshold allows.
+"""
+
+import argparse
+import concurrent.futures
+import datetime
+import http.client
+import json
+import pathlib
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from benchmarks import synthetic
+from bothunting import definitions
+from bothunting.core import cache
+from bothunting.core import dataset
+from bothunting.core import featurestore
+from bothunting.core import inference
+from bothunting.core import master
+from bothunting.core import modelstore
+from bothunting.core import records
+from bothunting.core import service
+from bothunting.core import timeline
+from bothunting.utils import fileutil
+from bothunting.utils import osutil
+from bothunting.utils import pathutil
+
+
+BENCHMARKS = {}
+
+
+class Context:
+    """Shared state of a benchmark run.
+
+    Files written by benchmarks go to tmp_dir, which is removed when the
+    context is closed or its with block exits.
+
+    Args:
+        quick (bool): Use smaller inputs and fewer repetitions.
+        seed (int): Seed of the random number generator.
+    """
+
+    def __init__(self, quick: bool = False, seed: int = 42):
+        self.quick = quick
+        self.rng = np.random.default_rng(seed)
+        self._tmp = tempfile.TemporaryDirectory(prefix="bothunting-bench-")
+        self.tmp_dir = pathlib.Path(self._tmp.name)
+        self._model = None
+
+    def __enter__(self) -> "Context":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._tmp.cleanup()
+
+    def repeat(self, n: int) -> int:
+        return max(1, n // 10) if self.quick else n
+
+    @property
+    def model(self) -> modelstore.Model:
+        """Model fitted on a synthetic training table, shared by the inference benchmarks."""
+        if self._model is None:
+            path = self.tmp_dir / "complete_data.csv"
+            synthetic.make_training_table(self.rng, 11000).to_csv(
+                path, index=False
+            )
+            self._model = master.setup_classifier(path=path)
+        return self._model
+
+
+def benchmark(name: str) -> Callable:
+    """Register a benchmark function taking a Context and returning stats."""
+
+    def decorator(fn: Callable[[Context], Dict[str, Any]]) -> Callable:
+        BENCHMARKS[name] = fn
+        return fn
+
+    return decorator
+
+
+def measure(
+    fn: Callable[[], Any], repeat: int, items: int = 1, warmup: int = 1
+) -> Dict[str, float]:
+    """Time repeated calls of fn.
+
+    Args:
+        fn (Callable[[], Any]): Function to time.
+        repeat (int): Number of timed calls.
+        items (int): Number of items, e.g. accounts, processed per call.
+        warmup (int): Number of untimed calls before timing.
+
+    Returns:
+        Dict[str, float]: Latency percentiles in seconds and throughput in
+            items per second.
+    """
+    for _ in range(warmup):
+        fn()
+    times = np.empty(repeat)
+    for i in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times[i] = time.perf_counter() - start
+    return {
+        "repeat": repeat,
+        "items": items,
+        "mean_s": float(times.mean()),
+        "min_s": float(times.min()),
+        "p50_s": float(np.percentile(times, 50)),
+        "p90_s": float(np.percentile(times, 90)),
+        "p99_s": float(np.percentile(times, 99)),
+        "throughput_per_s": float(items / times.mean()),
+    }
+
+
+@benchmark("features.tweet_list")
+def bench_features_tweet_list(ctx: Context) -> Dict[str, float]:
+    """Tweet-based features of a 10 year old account from a list of 3,200 tweets."""
+    acc = synthetic.make_account(ctx.rng, years=10)
+    tweets = synthetic.make_timeline(ctx.rng, acc, n_tweets=3200)
+
+    def run():
+        master.get_inactive_days(tweets, acc)
+        master.get_average(tweets, acc)
+
+    return measure(run, ctx.repeat(50))
+
+
+@benchmark("features.streaming")
+def bench_features_streaming(ctx: Context) -> Dict[str, float]:
+    """All features of a 10 year old account streamed from 16 timeline pages."""
+    acc = synthetic.make_account(ctx.rng, years=10)
+    pages = synthetic.pages(synthetic.make_timeline(ctx.rng, acc, n_tweets=3200))
+
+    def run():
+        accumulator = timeline.TimelineAccumulator()
+        for page in pages:
+            accumulator.update(page)
+        master.compute_features(acc, accumulator)
+
+    return measure(run, ctx.repeat(50))
+
+
+@benchmark("features.dataset_accounts")
+def bench_features_dataset_accounts(ctx: Context) -> Dict[str, float]:
+    """Per-account features of the rows of a bundled dataset file."""
+    df = dataset.read_dataset(dataset.get_dataset_paths()[0])
+    if ctx.quick:
+        df = df.head(200)
+
+    def run():
+        for user_id, row in df.iterrows():
+            master.compute_features(
+                records.AccountRecord.from_csv_row(row, user_id=user_id)
+            )
+
+    return measure(run, ctx.repeat(5), items=len(df))
+
+
+@benchmark("training_table.build")
+def bench_training_table_build(ctx: Context) -> Dict[str, float]:
+    """Offline training table of all bundled dataset files."""
+    paths = dataset.get_dataset_paths()
+    n = len(dataset.build_training_table(paths))
+    return measure(
+        lambda: dataset.build_training_table(paths), ctx.repeat(5), items=n
+    )
+
+
+@benchmark("training_table.read_csv")
+def bench_training_table_read_csv(ctx: Context) -> Dict[str, float]:
+    """Training data read from a 100,000 row CSV file."""
+    n = 10000 if ctx.quick else 100000
+    path = ctx.tmp_dir / "read_csv.csv"
+    synthetic.make_training_table(ctx.rng, n).to_csv(path, index=False)
+    return measure(lambda: master.read_training_data(path), ctx.repeat(10), items=n)
+
+
+@benchmark("training_table.read_store")
+def bench_training_table_read_store(ctx: Context) -> Dict[str, float]:
+    """Training data read from a 100,000 row feature store."""
+    n = 10000 if ctx.quick else 100000
+    table = synthetic.make_training_table(ctx.rng, n)
+    table["source"] = np.where(table["result"] == 0, "genuine", "bots")
+    root = featurestore.write(table, ctx.tmp_dir / "read_store")
+    return measure(lambda: master.read_training_data(root), ctx.repeat(10), items=n)
+
+
+@benchmark("model.fit")
+def bench_model_fit(ctx: Context) -> Dict[str, float]:
+    """Fit of the classifier on an 11,000 row training table."""
+    ctx.model
+    path = ctx.tmp_dir / "complete_data.csv"
+    return measure(
+        lambda: master.setup_classifier(path=path), ctx.repeat(3), warmup=0
+    )
+
+
+@benchmark("model.load")
+def bench_model_load(ctx: Context) -> Dict[str, float]:
+    """Load of the stored model artifact."""
+    path = ctx.tmp_dir / "classifier.joblib"
+    modelstore.save(ctx.model, path)
+    return measure(lambda: modelstore.load(path), ctx.repeat(20))
+
+
+@benchmark("predict.batch")
+def bench_predict_batch(ctx: Context) -> Dict[str, float]:
+    """Prediction of 100,000 accounts in one call."""
+    n = 10000 if ctx.quick else 100000
+    X = synthetic.make_training_table(ctx.rng, n)[ctx.model.columns].to_numpy(
+        dtype=np.float64
+    )
+    return measure(
+        lambda: master.predict_proba(ctx.model, X), ctx.repeat(5), items=n
+    )
+
+
+@benchmark("predict.single")
+def bench_predict_single(ctx: Context) -> Dict[str, float]:
+    """Prediction of a single account."""
+    X = synthetic.make_training_table(ctx.rng, 1)[ctx.model.columns].to_numpy(
+        dtype=np.float64
+    )
+    return measure(lambda: master.predict(ctx.model, X), ctx.repeat(200))
+
+
+def _exported(
+    ctx: Context,
+    name: str,
+    max_depth: Optional[int] = None,
+    max_trees: Optional[int] = None,
+) -> inference.InferenceModel:
+    """:returns: ctx.model saved with modelstore and loaded as exported arrays"""
+    path = ctx.tmp_dir / f"{name}.joblib"
+    modelstore.save(ctx.model, path, max_depth=max_depth, max_trees=max_trees)
+    return modelstore.load_inference(path)
+
+
+@benchmark("predict.single_exported")
+def bench_predict_single_exported(ctx: Context) -> Dict[str, float]:
+    """Prediction of a single account with the random forest exported for inference.py."""
+    model = _exported(ctx, "exported")
+    X = synthetic.make_training_table(ctx.rng, 1)[model.columns].to_numpy(
+        dtype=np.float64
+    )
+    stats = measure(lambda: master.predict(model, X), ctx.repeat(2000))
+    stats["max_deviation"] = inference.deviation(
+        ctx.model, inference.export(ctx.model)
+    )
+    return stats
+
+
+@benchmark("predict.single_pruned")
+def bench_predict_single_pruned(ctx: Context) -> Dict[str, float]:
+    """Prediction of a single account with the first 50 trees of the forest pruned to depth 12."""
+    model = _exported(ctx, "pruned", max_depth=12, max_trees=50)
+    table = synthetic.make_training_table(ctx.rng, 10000)
+    X = table[model.columns].to_numpy(dtype=np.float64)
+    stats = measure(lambda: master.predict(model, X[:1]), ctx.repeat(2000))
+    stats["agreement"] = float(
+        np.mean(
+            master.predict_proba(model, X)[0]
+            == master.predict_proba(ctx.model, X)[0]
+        )
+    )
+    return stats
+
+
+def _python(code: str) -> None:
+    """Run code in a fresh interpreter with the project root on the path."""
+    subprocess.run(
+        [sys.executable, "-c", code],
+        check=True,
+        cwd=definitions.get_prj_root(),
+    )
+
+
+@benchmark("startup.import_master")
+def bench_startup_import_master(ctx: Context) -> Dict[str, float]:
+    """Start of an interpreter that imports master, without pandas, scikit-learn or tweepy."""
+    code = (
+        "import sys\n"
+        "from bothunting.core import master\n"
+        "assert not {'pandas.core', 'sklearn', 'tweepy.api'} & set(sys.modules)\n"
+    )
+    return measure(lambda: _python(code), ctx.repeat(10))
+
+
+@benchmark("startup.joblib_model")
+def bench_startup_joblib_model(ctx: Context) -> Dict[str, float]:
+    """Start of an interpreter that loads the model artifact and predicts one account."""
+    path = ctx.tmp_dir / "classifier.joblib"
+    modelstore.save(ctx.model, path)
+    code = (
+        "import numpy as np\n"
+        "from bothunting.core import master, modelstore\n"
+        f"model = modelstore.load({str(path)!r})\n"
+        "master.predict(model, np.zeros((1, len(model.columns))))\n"
+    )
+    return measure(lambda: _python(code), ctx.repeat(10))
+
+
+@benchmark("startup.inference")
+def bench_startup_inference(ctx: Context) -> Dict[str, float]:
+    """Start of an interpreter that loads the exported arrays and predicts one account."""
+    path = ctx.tmp_dir / "classifier.joblib"
+    modelstore.save(ctx.model, path)
+    code = (
+        "import numpy as np\n"
+        "from bothunting.core import inference\n"
+        f"model = inference.load({str(modelstore.get_inference_path(path))!r})\n"
+        "X = model.scaler.transform(np.zeros((1, len(model.columns))))\n"
+        "model.classifier.predict_proba(X)\n"
+    )
+    return measure(lambda: _python(code), ctx.repeat(10))
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str):
+        super().__init__("localhost")
+        self.path = path
+
+    def connect(self) -> None:
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+
+
+@benchmark("service.classify")
+def bench_service_classify(ctx: Context) -> Dict[str, float]:
+    """64 concurrent requests to the classification service on a Unix socket, against a stub API."""
+    n = 64
+    api = synthetic.StubAPI(n_tweets=400)
+    service_ = service.ClassificationService(
+        api, model=ctx.model, cache_=cache.Cache(":memory:")
+    )
+    path = str(ctx.tmp_dir / "service.sock")
+    server = service.make_server(service_, socket_path=path)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    round_ = [0]
+
+    def classify(username: str) -> None:
+        connection = _UnixHTTPConnection(path)
+        connection.request("GET", f"/classify?username={username}")
+        connection.getresponse().read()
+        connection.close()
+
+    def run():
+        # New names every round, so accounts are fetched and not cached.
+        round_[0] += 1
+        names = [f"user{round_[0]}_{i}" for i in range(n)]
+        with concurrent.futures.ThreadPoolExecutor(16) as pool:
+            list(pool.map(classify, names))
+
+    try:
+        return measure(run, ctx.repeat(10), items=n)
+    finally:
+        server.shutdown()
+        server.server_close()
+        service_.close()
+
+
+def compare(
+    results: Dict[str, Dict[str, float]],
+    baseline: Dict[str, Dict[str, float]],
+    threshold: float,
+) -> List[str]:
+    """:returns: names of benchmarks whose median latency grew by more than threshold"""
+    regressions = []
+    for name, stats in results.items():
+        if name not in baseline:
+            continue
+        before, after = baseline[name]["p50_s"], stats["p50_s"]
+        change = after / before - 1.0
+        print(f"{name}: {before:.6f}s -> {after:.6f}s ({change:+.1%})")
+        if change > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def _default_output() -> pathlib.Path:
+    stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    return definitions.get_out_dir() / "benchmarks" / f"bench-{stamp}.json"
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run benchmarks.")
+    parser.add_argument(
+        "--quick", action="store_true", help="Smaller inputs, fewer repetitions."
+    )
+    parser.add_argument(
+        "--only", default="", help="Run benchmarks whose name starts with this."
+    )
+    parser.add_argument("--output", help="JSON file to write results to.")
+    parser.add_argument("--baseline", help="JSON file of an earlier run.")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="Allowed relative growth of the median latency.",
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    results = {}
+    with Context(quick=args.quick, seed=args.seed) as ctx:
+        for name, fn in BENCHMARKS.items():
+            if not name.startswith(args.only):
+                continue
+            results[name] = fn(ctx)
+            stats = results[name]
+            print(
+                f"{name}: p50={stats['p50_s'] * 1e3:.3f}ms "
+                f"p99={stats['p99_s'] * 1e3:.3f}ms "
+                f"throughput={stats['throughput_per_s']:.1f}/s"
+            )
+
+    output = pathutil.str_to_path(args.output or _default_output())
+    if not pathutil.is_dir(output.parent):
+        osutil.mkdir(output.parent)
+    report = {
+        "meta": {
+            "timestamp": datetime.datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "quick": args.quick,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    with fileutil.atomic_write(output) as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote results to '{output}'.")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"Regressions: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
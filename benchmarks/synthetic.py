@@ -0,0 +1,188 @@
+"""
+Generators of synthetic accounts, timelines and training tables.
+
+All generators take a numpy.random.Generator so benchmark runs are
+reproducible.
+"""
+
+import datetime
+import threading
+import time
+import types
+import zlib
+from typing import Any, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from bothunting.core import constants as const
+from bothunting.core import records
+
+
+DAY = datetime.timedelta(days=1)
+
+
+def make_account(
+    rng: np.random.Generator, years: float = 10.0, user_id: int = 1
+) -> records.AccountRecord:
+    """Create an account that was created the given number of years ago."""
+    created_at = datetime.datetime.now(datetime.timezone.utc) - years * 365 * DAY
+    return records.AccountRecord(
+        id=user_id,
+        screen_name=f"user{user_id}",
+        created_at=created_at,
+        description="" if rng.random() < 0.3 else "bio",
+        profile_image_url="http://pbs.twimg.com/profile_images/1/x_normal.jpg",
+        followers_count=int(rng.integers(0, 5000)),
+        friends_count=int(rng.integers(0, 5000)),
+        statuses_count=int(rng.integers(0, 50000)),
+    )
+
+
+def make_timeline(
+    rng: np.random.Generator,
+    account: records.AccountRecord,
+    n_tweets: int = 3200,
+) -> List[types.SimpleNamespace]:
+    """Create a timeline, newest tweet first, spread over the account's lifetime.
+
+    Tweets mimic tweepy Status models with the attributes the feature code
+    reads.
+    """
+    now = datetime.datetime.now(datetime.timezone.utc)
+    lifetime = (now - account.created_at).total_seconds()
+    ages = np.sort(rng.random(n_tweets)) * lifetime
+    base_id = 10 ** 15
+    words = np.array(["hello", "world", "@user", "#tag", "http://t.co/x"])
+    return [
+        types.SimpleNamespace(
+            id=base_id - i,
+            id_str=str(base_id - i),
+            created_at=now - datetime.timedelta(seconds=float(age)),
+            text=" ".join(rng.choice(words, size=6)),
+        )
+        for i, age in enumerate(ages)
+    ]
+
+
+def pages(timeline: list, size: int = 200) -> List[list]:
+    """Split a timeline into pages as returned by user_timeline."""
+    return [timeline[i:i + size] for i in range(0, len(timeline), size)]
+
+
+def make_training_table(rng: np.random.Generator, n: int) -> pd.DataFrame:
+    """Create a labelled training table in the layout of complete_data.csv."""
+    result = rng.integers(0, 3, size=n)
+    table = pd.DataFrame(
+        {
+            "id": np.arange(n, dtype=np.int64),
+            "is_protected": rng.random(n) < 0.05,
+            "time_of_existence": rng.integers(0, 5000, size=n),
+            "average_daily_tweets": rng.gamma(1.0 + result, 2.0),
+            "inactive_days": rng.integers(0, 5000, size=n),
+            "has_default_image": rng.random(n) < 0.1 * (1 + result),
+            "bio_is_empty": rng.random(n) < 0.2 * (1 + result),
+            "friends_followers_ratio": rng.gamma(1.0 + result, 1.0),
+            "is_verified": rng.random(n) < 0.01,
+            "link_ratio": rng.beta(1.0 + 2 * result, 2.0),
+            "unique_domains": rng.poisson(5.0 / (1 + result)),
+            "duplicate_ratio": rng.beta(1.0 + result, 4.0),
+            "mention_rate": rng.gamma(1.0, 0.5, size=n),
+            "hashtag_rate": rng.gamma(1.0 + result, 0.3),
+        }
+    )
+    table["result"] = result
+    return table[["id"] + const.FEATURE_COLUMNS + ["result"]]
+
+
+class StubAPI:
+    """Offline stand-in for tweepy.API serving synthetic accounts and timelines.
+
+    Every screen name maps to a fixed account and timeline, generated on
+    first use from a seed derived from the name. Screen names starting with
+    "missing" raise like unknown users do.
+
+    Args:
+        seed (int): Seed of all generated accounts and timelines.
+        n_tweets (int): Number of tweets per timeline.
+        latency (float): Seconds every request sleeps, to mimic the network.
+    """
+
+    def __init__(self, seed: int = 42, n_tweets: int = 400, latency: float = 0.0):
+        self.seed = seed
+        self.n_tweets = n_tweets
+        self.latency = latency
+        self.calls = 0
+        self._accounts = {}
+        self._timelines = {}
+        self._lock = threading.Lock()
+
+    def _request(self) -> None:
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _account(self, user_id: int) -> records.AccountRecord:
+        with self._lock:
+            account = self._accounts.get(user_id)
+            if account is None:
+                rng = np.random.default_rng([self.seed, user_id])
+                account = make_account(
+                    rng, years=float(rng.uniform(0.5, 12.0)), user_id=user_id
+                )
+                account.verified = bool(rng.random() < 0.02)
+                account.protected = bool(rng.random() < 0.05)
+                self._accounts[user_id] = account
+                self._timelines[user_id] = make_timeline(
+                    rng, account, int(rng.integers(1, self.n_tweets + 1))
+                )
+            return account
+
+    def get_user(
+        self, id: Optional[int] = None, screen_name: Optional[str] = None, **kwargs
+    ) -> types.SimpleNamespace:
+        self._request()
+        if screen_name is not None and screen_name.startswith("missing"):
+            import tweepy
+
+            raise tweepy.errors.TweepyException(f"User '{screen_name}' not found.")
+        if id is None:
+            id = zlib.crc32(screen_name.lower().encode())
+        payload = self._account(int(id)).to_dict()
+        user = types.SimpleNamespace(**payload)
+        user._json = payload
+        return user
+
+    def post(self, user_id: int, text: str = "hello world") -> types.SimpleNamespace:
+        """Add a tweet posted now to the top of the user's timeline."""
+        self._account(int(user_id))
+        with self._lock:
+            tweets = self._timelines[int(user_id)]
+            tweet_id = tweets[0].id + 1 if tweets else 10 ** 15
+            tweet = types.SimpleNamespace(
+                id=tweet_id,
+                id_str=str(tweet_id),
+                created_at=datetime.datetime.now(datetime.timezone.utc),
+                text=text,
+            )
+            tweets.insert(0, tweet)
+        return tweet
+
+    def user_timeline(
+        self,
+        id: int,
+        count: int = 200,
+        max_id: Optional[int] = None,
+        since_id: Optional[int] = None,
+        **kwargs,
+    ) -> List[Any]:
+        self._request()
+        self._account(int(id))
+        tweets = [
+            tweet
+            for tweet in self._timelines[int(id)]
+            if (max_id is None or tweet.id <= max_id)
+            and (since_id is None or tweet.id > since_id)
+        ]
+        return tweets[:count]
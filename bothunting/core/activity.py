@@ -0,0 +1,179 @@
+"""
+Day-resolution tweet activity histogram.
+
+Tweets are reduced to day ordinals once and counted with ``numpy.bincount``.
+All activity features (inactive days, average tweets per day, average tweets
+per active day) are derived from that single array, so their cost depends on
+the number of tweets instead of the number of days an account exists.
+"""
+
+import datetime
+from typing import Dict, Iterable, Optional, Union
+
+import numpy as np
+
+
+DateLike = Union[datetime.date, datetime.datetime]
+
+
+def to_ordinal(value: DateLike) -> int:
+    """Convert date or datetime to its proleptic Gregorian day ordinal."""
+    if isinstance(value, datetime.datetime):
+        value = value.date()
+    return value.toordinal()
+
+
+class ActivityHistogram:
+    """Number of tweets per calendar day from an origin date up to today.
+
+    Attributes:
+        origin (int): Day ordinal of the first day in the histogram.
+        counts (numpy.ndarray): Tweets per day. ``counts[i]`` holds the number
+            of tweets on day ``origin + i``.
+    """
+
+    __slots__ = ("origin", "counts")
+
+    def __init__(self, origin: int, counts: np.ndarray):
+        self.origin = origin
+        self.counts = counts
+
+    @classmethod
+    def from_ordinals(
+        cls,
+        ordinals: np.ndarray,
+        origin: Optional[int] = None,
+        today: Optional[int] = None,
+    ) -> "ActivityHistogram":
+        """Build histogram from day ordinals of tweets.
+
+        Args:
+            ordinals (numpy.ndarray): Day ordinal of every tweet.
+            origin (Optional[int]): Day ordinal of the first day. Defaults to
+                the day of the oldest tweet.
+            today (Optional[int]): Day ordinal of the last day. Defaults to
+                today's date.
+
+        Returns:
+            ActivityHistogram: Histogram covering ``origin`` to ``today``.
+        """
+        ordinals = np.asarray(ordinals, dtype=np.int64)
+        if today is None:
+            today = datetime.date.today().toordinal()
+        if origin is None:
+            origin = int(ordinals.min()) if ordinals.size else today
+        offsets = ordinals - origin
+        # Tweets older than the origin cannot be attributed to a day of the
+        # account's existence and are dropped.
+        offsets = offsets[offsets >= 0]
+        counts = np.bincount(offsets, minlength=max(today - origin + 1, 0))
+        return cls(origin, counts)
+
+    @classmethod
+    def from_day_counts(
+        cls,
+        ordinals: np.ndarray,
+        counts: np.ndarray,
+        origin: Optional[int] = None,
+        today: Optional[int] = None,
+    ) -> "ActivityHistogram":
+        """Build histogram from distinct day ordinals and their tweet counts.
+
+        Args:
+            ordinals (numpy.ndarray): Distinct day ordinals.
+            counts (numpy.ndarray): Number of tweets per day in ordinals.
+            origin (Optional[int]): Day ordinal of the first day. Defaults to
+                the oldest day in ordinals.
+            today (Optional[int]): Day ordinal of the last day. Defaults to
+                today's date.
+
+        Returns:
+            ActivityHistogram: Histogram covering ``origin`` to ``today``.
+        """
+        ordinals = np.asarray(ordinals, dtype=np.int64)
+        counts = np.asarray(counts, dtype=np.int64)
+        if today is None:
+            today = datetime.date.today().toordinal()
+        if origin is None:
+            origin = int(ordinals.min()) if ordinals.size else today
+        offsets = ordinals - origin
+        keep = offsets >= 0
+        offsets, counts = offsets[keep], counts[keep]
+        size = today - origin + 1
+        if offsets.size:
+            size = max(size, int(offsets.max()) + 1)
+        size = max(size, 0)
+        histogram = np.zeros(size, dtype=np.int64)
+        histogram[offsets] = counts
+        return cls(origin, histogram)
+
+    @classmethod
+    def from_datetimes(
+        cls,
+        datetimes: Iterable[DateLike],
+        origin: Optional[DateLike] = None,
+        today: Optional[DateLike] = None,
+    ) -> "ActivityHistogram":
+        """Build histogram from creation dates of tweets.
+
+        Args:
+            datetimes (Iterable[DateLike]): Creation date of every tweet.
+            origin (Optional[DateLike]): First day, e.g. the account's
+                creation date. Defaults to the day of the oldest tweet.
+            today (Optional[DateLike]): Last day. Defaults to today's date.
+
+        Returns:
+            ActivityHistogram: Histogram covering ``origin`` to ``today``.
+        """
+        ordinals = np.fromiter(
+            (to_ordinal(x) for x in datetimes), dtype=np.int64
+        )
+        return cls.from_ordinals(
+            ordinals,
+            origin=None if origin is None else to_ordinal(origin),
+            today=None if today is None else to_ordinal(today),
+        )
+
+    @property
+    def n_days(self) -> int:
+        return int(self.counts.size)
+
+    @property
+    def n_tweets(self) -> int:
+        return int(self.counts.sum())
+
+    @property
+    def active_days(self) -> int:
+        return int(np.count_nonzero(self.counts))
+
+    @property
+    def inactive_days(self) -> int:
+        return self.n_days - self.active_days
+
+    def average(self, mode: str = "all") -> Optional[float]:
+        """Average tweets per day.
+
+        Args:
+            mode (str): "all" averages over all days, "active" over days with
+                at least one tweet.
+
+        Returns:
+            Optional[float]: Average or None if there is no day to average
+                over.
+        """
+        if mode == "all":
+            days = self.n_days
+        elif mode == "active":
+            days = self.active_days
+        else:
+            raise ValueError(f"Unknown mode '{mode}'")
+        if days == 0:
+            return None
+        return self.n_tweets / days
+
+    def to_dict(self) -> Dict[datetime.date, int]:
+        """Convert histogram to a mapping from date to number of tweets."""
+        return {
+            datetime.date.fromordinal(self.origin + i): int(c)
+            for i, c in enumerate(self.counts)
+        }
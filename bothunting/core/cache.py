@@ -0,0 +1,205 @@
+"""
+Local cache of Twitter API payloads and derived features.
+
+Entries live in a single SQLite database. Every entry is addressed by a kind
+("user", "timeline", "features", "screen_name") and a key, the numeric user
+id for everything but the screen name aliases. Values are stored as
+compressed JSON blobs addressed by their SHA-256 digest, so identical
+payloads are stored once. Entries expire after a configurable time to live,
+and the least recently used entries are evicted once the blobs exceed a
+configurable size.
+"""
+
+import hashlib
+import json
+import pathlib
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Callable, Optional, Tuple, Union
+
+import numpy as np
+
+from bothunting import definitions
+from bothunting.core import instrumentation
+from bothunting.utils import osutil
+from bothunting.utils import pathutil
+
+
+DEFAULT_TTL = 7 * 24 * 3600.0
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    digest TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entries (
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL,
+    PRIMARY KEY (kind, key)
+);
+CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed);
+"""
+
+
+def get_cache_path() -> pathlib.Path:
+    return definitions.get_out_dir() / "cache" / "cache.sqlite3"
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(
+        f"Object of type {type(value).__name__} is not JSON serializable"
+    )
+
+
+class Cache:
+    """SQLite-backed cache with time to live and LRU eviction.
+
+    Args:
+        path (Optional[Union[str, pathlib.Path]]): Database file. Defaults to
+            get_cache_path(). ":memory:" keeps the cache in memory.
+        ttl (float): Seconds after which entries expire.
+        max_bytes (int): Upper bound of the size of all stored blobs.
+        clock (Callable[[], float]): Wall clock.
+    """
+
+    def __init__(
+        self,
+        path: Optional[Union[str, pathlib.Path]] = None,
+        ttl: float = DEFAULT_TTL,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        clock: Callable[[], float] = time.time,
+    ):
+        if path is None:
+            path = get_cache_path()
+        if str(path) != ":memory:":
+            path = pathutil.str_to_path(path)
+            if not pathutil.is_dir(path.parent):
+                osutil.mkdir(path.parent)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(path), check_same_thread=False)
+        if str(path) != ":memory:":
+            self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        self._bytes = self._size()
+
+    def __enter__(self) -> "Cache":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def get(self, kind: str, key: Any) -> Optional[Any]:
+        """Retrieve value or None if it is not cached or expired."""
+        entry = self.get_entry(kind, key)
+        return None if entry is None else entry[0]
+
+    def get_entry(self, kind: str, key: Any) -> Optional[Tuple[Any, float]]:
+        """Retrieve value and the time it was stored or None if it is not cached or expired."""
+        key = str(key)
+        now = self.clock()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT e.created, b.value FROM entries e "
+                "JOIN blobs b ON b.digest = e.digest "
+                "WHERE e.kind = ? AND e.key = ?",
+                (kind, key),
+            ).fetchone()
+            if row is None or now - row[0] > self.ttl:
+                if row is not None:
+                    self._db.execute(
+                        "DELETE FROM entries WHERE kind = ? AND key = ?",
+                        (kind, key),
+                    )
+                    self._db.commit()
+                self.misses += 1
+                instrumentation.incr("cache_misses", kind=kind)
+                return None
+            self._db.execute(
+                "UPDATE entries SET accessed = ? WHERE kind = ? AND key = ?",
+                (now, kind, key),
+            )
+            self._db.commit()
+            self.hits += 1
+        instrumentation.incr("cache_hits", kind=kind)
+        return json.loads(zlib.decompress(row[1])), row[0]
+
+    def put(self, kind: str, key: Any, value: Any) -> None:
+        """Store JSON serializable value and evict entries if the cache is full."""
+        data = json.dumps(value, default=_json_default, separators=(",", ":"))
+        data = zlib.compress(data.encode())
+        digest = hashlib.sha256(data).hexdigest()
+        now = self.clock()
+        with self._lock:
+            inserted = self._db.execute(
+                "INSERT OR IGNORE INTO blobs (digest, value, size) "
+                "VALUES (?, ?, ?)",
+                (digest, data, len(data)),
+            ).rowcount
+            self._bytes += inserted * len(data)
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries "
+                "(kind, key, digest, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (kind, str(key), digest, now, now),
+            )
+            if self._bytes > self.max_bytes:
+                self._evict()
+            self._db.commit()
+
+    def delete(self, kind: str, key: Any) -> None:
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM entries WHERE kind = ? AND key = ?",
+                (kind, str(key)),
+            )
+            self._collect_garbage()
+            self._db.commit()
+
+    def size(self) -> int:
+        """Size of all stored blobs in bytes."""
+        with self._lock:
+            return self._bytes
+
+    def _size(self) -> int:
+        return self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM blobs"
+        ).fetchone()[0]
+
+    def _collect_garbage(self) -> None:
+        self._db.execute(
+            "DELETE FROM blobs WHERE digest NOT IN (SELECT digest FROM entries)"
+        )
+        self._bytes = self._size()
+
+    def _evict(self) -> None:
+        """Drop expired entries, then the least recently used ones until the blobs fit into max_bytes."""
+        self._db.execute(
+            "DELETE FROM entries WHERE created < ?", (self.clock() - self.ttl,)
+        )
+        self._collect_garbage()
+        while self._bytes > self.max_bytes:
+            # Evict in batches so a full cache is not swept once per entry.
+            deleted = self._db.execute(
+                "DELETE FROM entries WHERE rowid IN "
+                "(SELECT rowid FROM entries ORDER BY accessed LIMIT 64)"
+            ).rowcount
+            self._collect_garbage()
+            if deleted == 0:
+                break
@@ -4,6 +4,52 @@ ACCESS_TOKEN = ""
 ACCESS_TOKEN_SECRET = ""
 
 
+DEFAULT_PROFILE_IMAGE_URL = (
+    "http://abs.twimg.com/sticky/default_profile_images/default_profile_normal.png"
+)
+
+ACCOUNT_FEATURES = [
+    "is_protected",
+    "time_of_existence",
+    "has_default_image",
+    "bio_is_empty",
+    "friends_followers_ratio",
+    "is_verified",
+]
+
+TEXT_FEATURES = [
+    "link_ratio",
+    "unique_domains",
+    "duplicate_ratio",
+    "mention_rate",
+    "hashtag_rate",
+]
+
+TWEET_FEATURES = [
+    "average_daily_tweets",
+    "inactive_days",
+] + TEXT_FEATURES
+
+# Column order of the feature table as written by compute_row.
+FEATURE_COLUMNS = [
+    "is_protected",
+    "time_of_existence",
+    "average_daily_tweets",
+    "inactive_days",
+    "has_default_image",
+    "bio_is_empty",
+    "friends_followers_ratio",
+    "is_verified",
+] + TEXT_FEATURES
+
+# Class labels per dataset file name prefix.
+DATASET_LABELS = {
+    "genuine_accounts": 0,
+    "Traditional_Spambots": 1,
+    "Social_Spambots": 2,
+}
+
+
 TEST_SET = [
     "DanieleMaraldi",
     "GianlucaPriopi",
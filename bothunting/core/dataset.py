@@ -0,0 +1,610 @@
+"""
+Offline feature extraction from the bundled account datasets.
+
+The CSV files in ``bothunting/datasets/original_datasets`` already contain
+every account attribute the account-level features of
+``master.compute_row`` are computed from. This module computes those features
+for whole files at once with vectorized pandas operations and assembles the
+labelled training table read by ``master.setup_classifier``, without a single
+Twitter API call.
+
+Dataset files are streamed in chunks of CHUNK_SIZE rows. Only the columns in
+DATASET_DTYPES (and feature columns written by ``master.expand_rows``) are
+parsed, with the dtypes given there, and every chunk is reduced to its
+feature block before the next one is read. Memory use therefore depends on
+the chunk size, not on the size of the files, and the feature blocks of
+several chunks can be computed on a process pool.
+
+The same account may be listed in several dataset files. The blocks are
+merged on an index of the int64 account ids (see deduplicate), so every
+account is one row of the training table: duplicate rows are folded into the
+first one and accounts labelled differently by different files are dropped.
+The test_set_* flags of the files are kept in the "test_set" column and
+split_train_test holds those accounts out together, so no account ends up on
+both sides of the split. schedule_fetches assigns every account to the first
+file listing it, so ``master.expand_datasets`` fetches it only once.
+"""
+
+from __future__ import annotations
+
+import argparse
+import collections
+import concurrent.futures
+import logging
+import os
+import pathlib
+import sys
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+from bothunting import definitions
+from bothunting.core import constants as const
+from bothunting.core import featurestore
+from bothunting.utils import fileutil
+from bothunting.utils import importutil
+
+pd = importutil.lazy_import("pandas")
+
+
+log = logging.getLogger(__name__)
+here = pathlib.Path(__file__).resolve().parent
+
+CREATED_AT_FORMAT = "%a %b %d %H:%M:%S %z %Y"
+
+# Number of rows of a dataset file parsed at once.
+CHUNK_SIZE = 50000
+
+# Columns of the dataset files the account features are computed from and
+# the dtypes they are parsed as. Profile image URLs are categorical, as many
+# accounts share the default images.
+DATASET_DTYPES = {
+    "id": "int64",
+    "created_at": "object",
+    "followers_count": "float64",
+    "friends_count": "float64",
+    "description": "object",
+    "profile_image_url": "category",
+    "protected": "float32",
+    "default_profile_image": "float32",
+    "verified": "float32",
+}
+
+# Dtypes of the numeric feature columns of files enriched by expand_rows.
+# Boolean feature columns may hold empty cells and are left to be inferred.
+FEATURE_DTYPES = {
+    column: "float64"
+    for column in const.FEATURE_COLUMNS
+    if column
+    not in ("is_protected", "has_default_image", "bio_is_empty", "is_verified")
+}
+
+# Prefix of the columns flagging accounts of the published test sets, e.g.
+# "test_set_1". The flags may be empty and are parsed as float32.
+TEST_SET_PREFIX = "test_set_"
+
+# Ways deduplicate resolves an account labelled differently by different files.
+LABEL_CONFLICTS = ("drop", "first")
+
+
+def get_dataset_paths(
+    datasets_dir: Optional[Union[str, pathlib.Path]] = None,
+) -> List[pathlib.Path]:
+    """Retrieve paths of all labelled dataset files.
+
+    Args:
+        datasets_dir (Optional[Union[str, pathlib.Path]]): Directory holding
+            the dataset files. Defaults to the bundled original datasets.
+
+    Returns:
+        List[pathlib.Path]: Sorted paths of CSV files with a known label.
+    """
+    if datasets_dir is None:
+        datasets_dir = definitions.get_datasets_dir()
+    datasets_dir = pathlib.Path(datasets_dir)
+    return sorted(
+        x for x in datasets_dir.glob("*.csv") if get_label(x) is not None
+    )
+
+
+def get_source(path: Union[str, pathlib.Path]) -> str:
+    """Retrieve the dataset source name of a file, e.g. 'Social_Spambots_users_1'."""
+    return pathlib.Path(path).stem
+
+
+def get_label(path: Union[str, pathlib.Path]) -> Optional[int]:
+    """Retrieve class label of dataset file from its name.
+
+    Returns:
+        Optional[int]: 0 for humans, 1 for traditional bots, 2 for social bots
+            or None if the file name is unknown.
+    """
+    source = get_source(path)
+    for prefix, label in const.DATASET_LABELS.items():
+        if source.startswith(prefix):
+            return label
+    return None
+
+
+def read_dataset(path: Union[str, pathlib.Path]) -> pd.DataFrame:
+    """Read dataset file indexed by account id, the same way expand_rows does."""
+    return pd.read_csv(path, index_col=0)
+
+
+def iter_dataset_chunks(
+    path: Union[str, pathlib.Path], chunksize: int = CHUNK_SIZE
+) -> Iterator[pd.DataFrame]:
+    """Read the columns of a dataset file the features are computed from, chunksize rows at a time.
+
+    Yields:
+        pandas.DataFrame: Chunks indexed by account id, with the columns of
+            DATASET_DTYPES and const.FEATURE_COLUMNS and the test set flags
+            found in the file.
+    """
+    header = pd.read_csv(path, nrows=0).columns.tolist()
+    index = header[0]
+    test_sets = [c for c in header if c.startswith(TEST_SET_PREFIX)]
+    dtypes = {
+        **DATASET_DTYPES,
+        **FEATURE_DTYPES,
+        **dict.fromkeys(test_sets, "float32"),
+        index: "int64",
+    }
+    usecols = [
+        c
+        for c in header
+        if c == index
+        or c in DATASET_DTYPES
+        or c in const.FEATURE_COLUMNS
+        or c in test_sets
+    ]
+    yield from pd.read_csv(
+        path,
+        usecols=usecols,
+        dtype={c: dtypes[c] for c in usecols if c in dtypes},
+        index_col=index,
+        chunksize=chunksize,
+    )
+
+
+def read_ids(path: Union[str, pathlib.Path]) -> np.ndarray:
+    """Read the account ids of a dataset file, its first column, in file order."""
+    return pd.read_csv(path, usecols=[0]).iloc[:, 0].to_numpy(dtype=np.int64)
+
+
+def parse_created_at(created_at: pd.Series) -> pd.Series:
+    """Parse account creation dates to UTC timestamps.
+
+    Most files store Twitter's "Tue Jun 11 11:20:35 +0000 2013" format, some
+    store epoch milliseconds with a trailing "L".
+    """
+    created_at = created_at.astype("string")
+    parsed = pd.to_datetime(
+        created_at, format=CREATED_AT_FORMAT, utc=True, errors="coerce"
+    )
+    millis = pd.to_numeric(
+        created_at.str.rstrip("L"), errors="coerce"
+    )
+    epoch = pd.to_datetime(millis, unit="ms", utc=True, errors="coerce")
+    return parsed.fillna(epoch)
+
+
+def _flag(df: pd.DataFrame, column: str) -> pd.Series:
+    if column not in df.columns:
+        return pd.Series(False, index=df.index)
+    return pd.to_numeric(df[column], errors="coerce").fillna(0).astype(bool)
+
+
+def get_test_set(df: pd.DataFrame) -> pd.Series:
+    """Retrieve the test set of every account from the test_set_* flags of a dataset.
+
+    Returns:
+        pandas.Series: int8 number of the first test set an account is
+            flagged in, e.g. 1 for test_set_1, or 0 if it is in none.
+    """
+    columns = sorted(
+        (int(c[len(TEST_SET_PREFIX):]), c)
+        for c in df.columns
+        if c.startswith(TEST_SET_PREFIX)
+    )
+    test_set = np.zeros(len(df), dtype=np.int8)
+    for number, column in reversed(columns):
+        test_set[_flag(df, column).to_numpy()] = number
+    return pd.Series(test_set, index=df.index, name="test_set")
+
+
+def compute_account_features(
+    df: pd.DataFrame, now: Optional[pd.Timestamp] = None
+) -> pd.DataFrame:
+    """Compute account-level features for all rows of a dataset.
+
+    Vectorized counterpart of the account-level functions used by
+    ``master.compute_row``.
+
+    Args:
+        df (pandas.DataFrame): Dataset indexed by account id.
+        now (Optional[pandas.Timestamp]): Reference time for
+            ``time_of_existence``. Defaults to the current time.
+
+    Returns:
+        pandas.DataFrame: One column per entry of ``const.ACCOUNT_FEATURES``.
+    """
+    if now is None:
+        now = pd.Timestamp.now(tz="UTC")
+    created_at = parse_created_at(df["created_at"])
+    followers = pd.to_numeric(df["followers_count"], errors="coerce")
+    friends = pd.to_numeric(df["friends_count"], errors="coerce")
+    description = df["description"]
+
+    fts = pd.DataFrame(index=df.index)
+    fts["is_protected"] = _flag(df, "protected")
+    fts["time_of_existence"] = (now - created_at).dt.days
+    fts["has_default_image"] = (
+        df["profile_image_url"] == const.DEFAULT_PROFILE_IMAGE_URL
+    ) | _flag(df, "default_profile_image")
+    fts["bio_is_empty"] = description.isnull() | (description == "")
+    fts["friends_followers_ratio"] = friends / followers.replace(0, np.nan)
+    fts["is_verified"] = _flag(df, "verified")
+    return fts[const.ACCOUNT_FEATURES]
+
+
+def build_features(
+    df: pd.DataFrame, now: Optional[pd.Timestamp] = None
+) -> pd.DataFrame:
+    """Build the full feature table of a dataset.
+
+    Values already present in the dataset, e.g. written by
+    ``master.expand_rows``, take precedence over the offline computation.
+    Tweet-based features cannot be derived from account attributes and stay
+    empty unless the dataset was enriched before.
+
+    Returns:
+        pandas.DataFrame: One column per entry of ``const.FEATURE_COLUMNS``.
+    """
+    computed = compute_account_features(df, now=now)
+    fts = pd.DataFrame(index=df.index)
+    for column in const.FEATURE_COLUMNS:
+        present = df[column] if column in df.columns else None
+        if column in computed.columns:
+            fts[column] = (
+                computed[column]
+                if present is None
+                else present.astype(object).where(
+                    present.notnull(), computed[column].astype(object)
+                )
+            )
+        else:
+            fts[column] = np.nan if present is None else present
+    return fts
+
+
+def build_training_table(
+    paths: Optional[Iterable[Union[str, pathlib.Path]]] = None,
+    now: Optional[pd.Timestamp] = None,
+    chunksize: int = CHUNK_SIZE,
+    processes: Optional[int] = 1,
+    on_conflict: str = "drop",
+) -> pd.DataFrame:
+    """Build the labelled training table from dataset files.
+
+    Args:
+        paths (Optional[Iterable[Union[str, pathlib.Path]]]): Dataset files.
+            Defaults to all bundled original datasets.
+        now (Optional[pandas.Timestamp]): Reference time for
+            ``time_of_existence``.
+        chunksize (int): Number of rows of a dataset file parsed at once.
+        processes (Optional[int]): Number of processes computing features,
+            see iter_feature_blocks.
+        on_conflict (str): How accounts labelled differently by different
+            files are resolved, see deduplicate.
+
+    Returns:
+        pandas.DataFrame: Columns "id", "source", "test_set", the feature
+            columns and "result", one row per account, as expected by
+            ``master.setup_classifier``.
+    """
+    table = pd.concat(
+        iter_feature_blocks(paths, now=now, chunksize=chunksize, processes=processes),
+        ignore_index=True,
+    )
+    table["source"] = table["source"].astype("category")
+    table, stats = deduplicate(table, on_conflict=on_conflict)
+    for source, row in stats.iterrows():
+        log.info(
+            "%s: %d rows, %d duplicates, %d label conflicts, %d kept, %d in test sets",
+            source,
+            row["rows"],
+            row["duplicates"],
+            row["conflicts"],
+            row["kept"],
+            row["test_set"],
+        )
+    return table
+
+
+def deduplicate(
+    table: pd.DataFrame, on_conflict: str = "drop"
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Merge rows of the same account, found by a hash index on "id".
+
+    Rows repeating the id of an earlier row are folded into it: features
+    missing in the first row are taken from the later ones, and the account
+    is in the lowest test set any of its rows is flagged in.
+
+    Args:
+        table (pandas.DataFrame): Training table as built by
+            iter_feature_blocks.
+        on_conflict (str): "drop" removes accounts whose rows have different
+            labels, "first" keeps the label of the first row.
+
+    Returns:
+        Tuple[pandas.DataFrame, pandas.DataFrame]: Table with one row per
+            account, in the order of the first rows, and per source (in
+            order of appearance) the number of "rows", of "duplicates" of an
+            earlier row, of rows with "conflicts"ing labels, of rows "kept"
+            and of kept rows in a "test_set".
+    """
+    if on_conflict not in LABEL_CONFLICTS:
+        raise ValueError(f"Unknown label conflict resolution '{on_conflict}'.")
+    ids = table["id"]
+    repeated = ids.duplicated()
+    conflict = pd.Series(False, index=table.index)
+    if repeated.any():
+        shared = ids.duplicated(keep=False)
+        labels = table.loc[shared, "result"].groupby(ids[shared]).nunique()
+        conflict = ids.isin(labels.index[labels > 1])
+
+    dropped = conflict if on_conflict == "drop" else pd.Series(False, index=table.index)
+    out = table[~repeated & ~dropped]
+    merge = repeated & ~dropped
+    if merge.any():
+        rows = table[ids.duplicated(keep=False) & ~dropped]
+        by_id = rows.groupby("id", sort=False)
+        first = by_id[const.FEATURE_COLUMNS].first()
+        out = out.copy()
+        out_ids = out["id"].to_numpy()
+        for column in const.FEATURE_COLUMNS:
+            filled = first[column].reindex(out_ids).to_numpy()
+            missing = out[column].isnull().to_numpy() & pd.notnull(filled)
+            if missing.any():
+                out[column] = out[column].where(~missing, filled)
+        if "test_set" in out.columns:
+            flagged = rows["test_set"].where(rows["test_set"] > 0)
+            lowest = flagged.groupby(rows["id"]).min()
+            merged = lowest.reindex(out_ids).to_numpy()
+            out["test_set"] = np.where(
+                np.isnan(merged), out["test_set"].to_numpy(), merged
+            ).astype(np.int8)
+    out = out.reset_index(drop=True)
+
+    sources = pd.unique(table["source"])
+    counts = {
+        "rows": table["source"],
+        "duplicates": table.loc[repeated, "source"],
+        "conflicts": table.loc[conflict, "source"],
+        "kept": out["source"],
+        "test_set": out.loc[out["test_set"] > 0, "source"]
+        if "test_set" in out.columns
+        else out["source"].iloc[:0],
+    }
+    stats = pd.DataFrame(
+        {
+            name: column.value_counts(sort=False).reindex(sources, fill_value=0)
+            for name, column in counts.items()
+        },
+        index=pd.Index(sources, name="source"),
+    ).astype(np.int64)
+    return out, stats
+
+
+def split_train_test(
+    table: pd.DataFrame, test_size: float = 0.25, random_state: int = 42
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Split the rows of a training table without putting an account on both sides.
+
+    Accounts flagged in a test set of the dataset files ("test_set" > 0) are
+    tested. Of the classes no test set covers, e.g. traditional bots, a
+    test_size fraction of the accounts is drawn at random. All rows of an
+    account, should there be several, end up in the same split.
+
+    Args:
+        table (pandas.DataFrame): Columns "id", "result" and optionally
+            "test_set".
+        test_size (float): Fraction of the accounts of uncovered classes
+            that is tested. Without test set flags, this is every class.
+        random_state (int): Seed of the draw.
+
+    Returns:
+        Tuple[numpy.ndarray, numpy.ndarray]: Positions of the training and
+            of the test rows.
+    """
+    _, group = np.unique(table["id"].to_numpy(), return_inverse=True)
+    labels = table["result"].to_numpy()
+    if "test_set" in table.columns:
+        flagged = table["test_set"].to_numpy() > 0
+    else:
+        flagged = np.zeros(len(table), dtype=bool)
+    tested = np.zeros(group.max() + 1 if len(group) else 0, dtype=bool)
+    tested[group[flagged]] = True
+    uncovered = ~np.isin(labels, labels[flagged]) & ~tested[group]
+    candidates = np.unique(group[uncovered])
+    rng = np.random.default_rng(random_state)
+    n_test = int(round(test_size * candidates.size))
+    tested[rng.choice(candidates, size=n_test, replace=False)] = True
+    test = tested[group]
+    return np.flatnonzero(~test), np.flatnonzero(test)
+
+
+def schedule_fetches(
+    paths: Optional[Iterable[Union[str, pathlib.Path]]] = None,
+) -> Dict[pathlib.Path, np.ndarray]:
+    """Assign every account to the first dataset file listing it.
+
+    Args:
+        paths (Optional[Iterable[Union[str, pathlib.Path]]]): Dataset files.
+            Defaults to all bundled original datasets.
+
+    Returns:
+        Dict[pathlib.Path, numpy.ndarray]: Per file, in order, the ids of the
+            accounts fetched while expanding it. Together they list every
+            account once.
+    """
+    if paths is None:
+        paths = get_dataset_paths()
+    paths = [pathlib.Path(path) for path in paths]
+    ids = [read_ids(path) for path in paths]
+    if not ids:
+        return {}
+    first = ~pd.Series(np.concatenate(ids)).duplicated().to_numpy()
+    offsets = np.cumsum([0] + [x.size for x in ids])
+    return {
+        path: x[first[start:end]]
+        for path, x, start, end in zip(paths, ids, offsets[:-1], offsets[1:])
+    }
+
+
+def _build_block(
+    chunk: pd.DataFrame, source: str, label: int, now: pd.Timestamp
+) -> pd.DataFrame:
+    fts = build_features(chunk, now=now)
+    fts.insert(0, "test_set", get_test_set(chunk))
+    fts.insert(0, "source", source)
+    fts["result"] = label
+    fts.index.name = "id"
+    return fts.reset_index()
+
+
+def iter_feature_blocks(
+    paths: Optional[Iterable[Union[str, pathlib.Path]]] = None,
+    now: Optional[pd.Timestamp] = None,
+    chunksize: int = CHUNK_SIZE,
+    processes: Optional[int] = 1,
+) -> Iterator[pd.DataFrame]:
+    """Stream the labelled training table block by block.
+
+    Args:
+        paths (Optional[Iterable[Union[str, pathlib.Path]]]): Dataset files.
+            Defaults to all bundled original datasets.
+        now (Optional[pandas.Timestamp]): Reference time for
+            ``time_of_existence``.
+        chunksize (int): Number of rows per block.
+        processes (Optional[int]): Number of processes computing blocks, None
+            for one per core. 1 computes them in the calling process.
+
+    Yields:
+        pandas.DataFrame: Blocks of the training table in file order, see
+            build_training_table.
+    """
+    if paths is None:
+        paths = get_dataset_paths()
+    if now is None:
+        now = pd.Timestamp.now(tz="UTC")
+    chunks = (
+        (chunk, get_source(path), get_label(path), now)
+        for path in paths
+        for chunk in iter_dataset_chunks(path, chunksize)
+    )
+    if processes == 1:
+        for args in chunks:
+            yield _build_block(*args)
+        return
+    max_pending = 2 * (processes or os.cpu_count() or 1)
+    with concurrent.futures.ProcessPoolExecutor(processes) as pool:
+        # Bound the number of chunks in flight, blocks are yielded in order.
+        pending = collections.deque()
+        for args in chunks:
+            pending.append(pool.submit(_build_block, *args))
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def write_training_table(
+    path: Optional[Union[str, pathlib.Path]] = None,
+    paths: Optional[Iterable[Union[str, pathlib.Path]]] = None,
+    chunksize: int = CHUNK_SIZE,
+    processes: Optional[int] = 1,
+    on_conflict: str = "drop",
+) -> pathlib.Path:
+    """Build the training table and save it as complete_data.csv."""
+    if path is None:
+        path = here / "complete_data.csv"
+    table = build_training_table(
+        paths, chunksize=chunksize, processes=processes, on_conflict=on_conflict
+    )
+    with fileutil.atomic_write(path, newline="") as f:
+        table.to_csv(f, index=False)
+    return pathlib.Path(path)
+
+
+def write_feature_store(
+    root: Optional[Union[str, pathlib.Path]] = None,
+    paths: Optional[Iterable[Union[str, pathlib.Path]]] = None,
+    chunksize: int = CHUNK_SIZE,
+    processes: Optional[int] = 1,
+    on_conflict: str = "drop",
+) -> pathlib.Path:
+    """Build the training table and save it as feature store, partitioned by dataset file."""
+    return featurestore.write(
+        build_training_table(
+            paths, chunksize=chunksize, processes=processes, on_conflict=on_conflict
+        ),
+        root=root,
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Build the training table from the bundled datasets."
+    )
+    parser.add_argument(
+        "--csv",
+        action="store_true",
+        help="Write complete_data.csv instead of the feature store.",
+    )
+    parser.add_argument(
+        "--chunksize",
+        type=int,
+        default=CHUNK_SIZE,
+        help="Rows of a dataset file parsed at once.",
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=1,
+        help="Processes computing features, 0 for one per core.",
+    )
+    parser.add_argument(
+        "--on-conflict",
+        choices=LABEL_CONFLICTS,
+        default="drop",
+        help="Drop accounts labelled differently by different files or keep "
+        "the label of the first file.",
+    )
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        action="store_true",
+        help="Log the number of rows, duplicates and conflicts per file.",
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format="%(asctime)s %(name)s %(levelname)s %(message)s",
+    )
+    kwargs = {
+        "chunksize": args.chunksize,
+        "processes": args.processes or None,
+        "on_conflict": args.on_conflict,
+    }
+    if args.csv:
+        path = write_training_table(**kwargs)
+    else:
+        path = write_feature_store(**kwargs)
+    print(f"Wrote training table to '{path}'.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,373 @@
+"""
+Columnar on-disk store of the labelled feature table.
+
+The store replaces complete_data.csv as the training data of
+``master.setup_classifier``. Every column has an explicit dtype (see SCHEMA),
+so reading it neither parses text nor infers types, and rows are partitioned
+by the dataset file they come from:
+
+    out/features/
+        schema.json
+        Social_Spambots_users_1/
+        ...
+        genuine_accounts_users/
+
+With pyarrow installed, a partition is one uncompressed Feather (Arrow IPC)
+file. Without it, a partition is a directory with one .npy file per column.
+Both are memory-mapped on read and only the requested columns are read.
+
+Booleans are stored as bits: natively by Arrow, with numpy.packbits in .npy
+files. Missing booleans are recorded in a validity bitmap and read back as
+NaN in a float32 column, like missing numbers.
+
+Usage:
+
+    python -m bothunting.core.featurestore [CSV] [--root DIR] [--format npy]
+
+converts a training table such as complete_data.csv into a store.
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import importlib.util
+import json
+import pathlib
+import shutil
+import sys
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+
+from bothunting import definitions
+from bothunting.core import constants as const
+from bothunting.utils import fileutil
+from bothunting.utils import importutil
+from bothunting.utils import osutil
+from bothunting.utils import pathutil
+
+pd = importutil.lazy_import("pandas")
+
+
+# Increase whenever the layout of the store changes.
+FORMAT_VERSION = 1
+
+# Dtype of every column of the store, in column order.
+SCHEMA = {
+    "id": "int64",
+    "test_set": "int8",
+    "is_protected": "bool",
+    "time_of_existence": "float32",
+    "average_daily_tweets": "float32",
+    "inactive_days": "float32",
+    "has_default_image": "bool",
+    "bio_is_empty": "bool",
+    "friends_followers_ratio": "float32",
+    "is_verified": "bool",
+    "link_ratio": "float32",
+    "unique_domains": "float32",
+    "duplicate_ratio": "float32",
+    "mention_rate": "float32",
+    "hashtag_rate": "float32",
+    "result": "int8",
+}
+
+# Partition of tables without a "source" column.
+DEFAULT_PARTITION = "complete_data"
+
+SCHEMA_FILE = "schema.json"
+FEATHER_FILE = "part.feather"
+
+
+def get_store_dir() -> pathlib.Path:
+    return definitions.get_out_dir() / "features"
+
+
+def exists(root: Optional[Union[str, pathlib.Path]] = None) -> bool:
+    """:returns: whether root, get_store_dir() by default, holds a store"""
+    if root is None:
+        root = get_store_dir()
+    return pathutil.is_file(pathutil.str_to_path(root) / SCHEMA_FILE)
+
+
+def _has_pyarrow() -> bool:
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def _to_bool(series: pd.Series) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """:returns: values and validity mask, None if no value is missing"""
+    valid = series.notnull().to_numpy()
+    if series.dtype == object:
+        series = series.map(
+            lambda v: v.strip().lower() in ("1", "true")
+            if isinstance(v, str)
+            else bool(v),
+            na_action="ignore",
+        )
+    values = series.where(series.notnull(), False).to_numpy(dtype=bool)
+    return values, None if valid.all() else valid
+
+
+def _to_array(series: pd.Series, dtype: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    if dtype == "bool":
+        return _to_bool(series)
+    if dtype.startswith("float"):
+        return pd.to_numeric(series, errors="coerce").to_numpy(dtype=dtype), None
+    return series.to_numpy(dtype=dtype), None
+
+
+def _save(path: pathlib.Path, array: np.ndarray) -> None:
+    with fileutil.atomic_write(path, "wb", compression=None) as f:
+        np.save(f, array)
+
+
+def _write_npy(
+    path: pathlib.Path, arrays: Dict[str, Tuple[np.ndarray, Optional[np.ndarray]]]
+) -> None:
+    osutil.mkdir(path)
+    for column, (values, valid) in arrays.items():
+        if values.dtype == bool:
+            _save(path / f"{column}.bits.npy", np.packbits(values))
+        else:
+            _save(path / f"{column}.npy", values)
+        if valid is not None:
+            _save(path / f"{column}.valid.npy", np.packbits(valid))
+
+
+def _write_feather(
+    path: pathlib.Path, arrays: Dict[str, Tuple[np.ndarray, Optional[np.ndarray]]]
+) -> None:
+    import pyarrow as pa
+    from pyarrow import feather
+
+    osutil.mkdir(path)
+    table = pa.table(
+        {
+            column: pa.array(values, mask=None if valid is None else ~valid)
+            for column, (values, valid) in arrays.items()
+        }
+    )
+    # Uncompressed on purpose: only uncompressed files can be memory-mapped.
+    feather.write_feather(table, str(path / FEATHER_FILE), compression="uncompressed")
+
+
+def write(
+    table: pd.DataFrame,
+    root: Optional[Union[str, pathlib.Path]] = None,
+    format: Optional[str] = None,
+) -> pathlib.Path:
+    """Write a training table to a store, replacing the store in root.
+
+    Args:
+        table (pandas.DataFrame): Training table, e.g. the result of
+            dataset.build_training_table. Columns not in SCHEMA are dropped,
+            rows are partitioned by the "source" column if there is one.
+        root (Optional[Union[str, pathlib.Path]]): Directory of the store.
+            Defaults to get_store_dir().
+        format (Optional[str]): "feather" or "npy". Defaults to "feather" if
+            pyarrow is installed.
+
+    Returns:
+        pathlib.Path: Directory of the store.
+    """
+    if root is None:
+        root = get_store_dir()
+    root = pathutil.str_to_path(root)
+    if format is None:
+        format = "feather" if _has_pyarrow() else "npy"
+    if format not in ("feather", "npy"):
+        raise ValueError(f"Unknown feature store format '{format}'.")
+    columns = {c: dtype for c, dtype in SCHEMA.items() if c in table.columns}
+    if "source" in table.columns:
+        groups = table.groupby("source", sort=True, observed=True)
+    else:
+        groups = [(DEFAULT_PARTITION, table)]
+
+    if exists(root):
+        # Stores of an outdated format are replaced as well.
+        for partition in _read_schema(root).get("partitions", ()):
+            shutil.rmtree(root / partition, ignore_errors=True)
+        (root / SCHEMA_FILE).unlink()
+    if not pathutil.is_dir(root):
+        osutil.mkdir(root)
+    digest = hashlib.sha256()
+    partitions = {}
+    for source, part in groups:
+        arrays = {c: _to_array(part[c], dtype) for c, dtype in columns.items()}
+        for column, (values, valid) in arrays.items():
+            digest.update(column.encode())
+            digest.update(values.tobytes())
+            if valid is not None:
+                digest.update(valid.tobytes())
+        if format == "feather":
+            _write_feather(root / str(source), arrays)
+        else:
+            _write_npy(root / str(source), arrays)
+        partitions[str(source)] = {"rows": len(part)}
+    schema = {
+        "format_version": FORMAT_VERSION,
+        "format": format,
+        "columns": columns,
+        "partitions": partitions,
+        "fingerprint": digest.hexdigest(),
+    }
+    with fileutil.atomic_write(root / SCHEMA_FILE) as f:
+        json.dump(schema, f, indent=2)
+    return root
+
+
+def _read_schema(root: pathlib.Path) -> Dict[str, Any]:
+    with open(root / SCHEMA_FILE, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_schema(root: Optional[Union[str, pathlib.Path]] = None) -> Dict[str, Any]:
+    """:returns: content of schema.json of the store in root, get_store_dir() by default"""
+    if root is None:
+        root = get_store_dir()
+    schema = _read_schema(pathutil.str_to_path(root))
+    if schema.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"Feature store '{root}' was written in an outdated format.")
+    return schema
+
+
+def fingerprint(root: Optional[Union[str, pathlib.Path]] = None) -> str:
+    """:returns: hash of the content of the store, computed when it was written"""
+    return load_schema(root)["fingerprint"]
+
+
+def _with_nulls(values: np.ndarray, valid: Optional[np.ndarray]) -> np.ndarray:
+    if valid is None:
+        return values
+    return np.where(valid, values, np.nan).astype(np.float32)
+
+
+def _read_npy(
+    path: pathlib.Path, columns: Dict[str, str], n: int, mmap: bool
+) -> Dict[str, np.ndarray]:
+    mmap_mode = "r" if mmap else None
+    arrays = {}
+    for column, dtype in columns.items():
+        valid_path = path / f"{column}.valid.npy"
+        valid = None
+        if valid_path.is_file():
+            valid = np.unpackbits(np.load(valid_path), count=n).astype(bool)
+        if dtype == "bool":
+            bits = np.load(path / f"{column}.bits.npy")
+            values = np.unpackbits(bits, count=n).astype(bool)
+        else:
+            values = np.load(path / f"{column}.npy", mmap_mode=mmap_mode)
+        arrays[column] = _with_nulls(values, valid)
+    return arrays
+
+
+def _read_feather(
+    path: pathlib.Path, columns: Dict[str, str], mmap: bool
+) -> Dict[str, np.ndarray]:
+    from pyarrow import feather
+
+    table = feather.read_table(
+        str(path / FEATHER_FILE), columns=list(columns), memory_map=mmap
+    )
+    arrays = {}
+    for column in columns:
+        chunked = table.column(column)
+        if chunked.null_count:
+            valid = chunked.is_valid().to_numpy(zero_copy_only=False)
+            values = chunked.fill_null(False if columns[column] == "bool" else 0)
+            arrays[column] = _with_nulls(
+                values.to_numpy(zero_copy_only=False), valid
+            )
+        else:
+            arrays[column] = chunked.to_numpy(zero_copy_only=False)
+    return arrays
+
+
+def read(
+    root: Optional[Union[str, pathlib.Path]] = None,
+    columns: Optional[Iterable[str]] = None,
+    sources: Optional[Iterable[str]] = None,
+    mmap: bool = True,
+) -> pd.DataFrame:
+    """Read columns of the store.
+
+    Args:
+        root (Optional[Union[str, pathlib.Path]]): Directory of the store.
+            Defaults to get_store_dir().
+        columns (Optional[Iterable[str]]): Columns to read, all by default.
+            "source" adds the partition of every row as a categorical column.
+        sources (Optional[Iterable[str]]): Partitions to read, all by default.
+        mmap (bool): Memory-map the column files instead of reading them.
+            Columns of a single partition are then backed by the files.
+
+    Returns:
+        pandas.DataFrame: Requested columns in the requested order.
+    """
+    if root is None:
+        root = get_store_dir()
+    root = pathutil.str_to_path(root)
+    schema = load_schema(root)
+    if columns is None:
+        columns = list(schema["columns"])
+    columns = list(columns)
+    unknown = [c for c in columns if c not in schema["columns"] and c != "source"]
+    if unknown:
+        raise KeyError(f"Columns not in feature store: {unknown}")
+    stored = {c: schema["columns"][c] for c in columns if c != "source"}
+    partitions = list(schema["partitions"]) if sources is None else list(sources)
+
+    parts = []
+    for partition in partitions:
+        path = root / partition
+        if schema["format"] == "feather":
+            parts.append(_read_feather(path, stored, mmap))
+        else:
+            n = schema["partitions"][partition]["rows"]
+            parts.append(_read_npy(path, stored, n, mmap))
+    if len(parts) == 1:
+        arrays = parts[0]
+    else:
+        arrays = {c: np.concatenate([p[c] for p in parts]) for c in stored}
+    df = pd.DataFrame(arrays, columns=list(stored), copy=False)
+    if "source" in columns:
+        rows = [schema["partitions"][p]["rows"] for p in partitions]
+        df["source"] = pd.Categorical.from_codes(
+            np.repeat(np.arange(len(partitions)), rows), categories=partitions
+        )
+    return df[columns]
+
+
+def read_training_table(
+    root: Optional[Union[str, pathlib.Path]] = None,
+    columns: Optional[List[str]] = None,
+) -> pd.DataFrame:
+    """:returns: "id", "test_set" (unless the store predates it), the feature columns of the store (or the given ones) and "result" of all rows"""
+    schema = load_schema(root)
+    if columns is None:
+        columns = [c for c in const.FEATURE_COLUMNS if c in schema["columns"]]
+    if "test_set" in schema["columns"]:
+        columns = ["test_set"] + columns
+    return read(root, ["id"] + columns + ["result"])
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Convert a training table CSV into a feature store."
+    )
+    parser.add_argument(
+        "csv",
+        nargs="?",
+        default=str(pathlib.Path(__file__).resolve().parent / "complete_data.csv"),
+        help="Training table, complete_data.csv by default.",
+    )
+    parser.add_argument("--root", help="Store directory, out/features by default.")
+    parser.add_argument("--format", choices=["feather", "npy"])
+    args = parser.parse_args(argv)
+    root = write(pd.read_csv(args.csv), root=args.root, format=args.format)
+    print(f"Wrote feature store to '{root}'.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
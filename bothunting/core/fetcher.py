@@ -0,0 +1,476 @@
+"""
+Concurrent, rate-limit-aware fetching of accounts and timelines.
+
+Every request to the Twitter API takes a slot from the token bucket of its
+endpoint. The buckets are shared by all worker threads of a Fetcher, so while
+one thread pages through a long timeline, the remaining capacity of the rate
+limit window is handed to the other users in flight instead of idling.
+
+The API connector is only used through its ``get_user`` and ``user_timeline``
+methods, so any object providing them, e.g. a local stub, can stand in for
+``tweepy.API``. Connectors passed to a Fetcher should be created with
+``wait_on_rate_limit=False``, otherwise tweepy blocks the calling thread
+before the scheduler can reschedule it.
+
+Cached timeline summaries double as watermarks: once a summary is older than
+REFRESH_AFTER, only the tweets newer than its newest tweet are fetched (with
+``since_id``) and merged into it, instead of paging through the whole
+timeline again.
+"""
+
+from __future__ import annotations
+
+import concurrent.futures
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from bothunting.core import cache
+from bothunting.core import instrumentation
+from bothunting.core import records
+from bothunting.core import timeline
+from bothunting.utils import importutil
+
+# Imported on first use, callers passing a stand-in connector never load it.
+tweepy = importutil.lazy_import("tweepy")
+
+
+PAGE_SIZE = 200
+
+# Age in seconds after which a cached timeline summary is refreshed with the
+# tweets posted since.
+REFRESH_AFTER = 24 * 3600.0
+
+# User id or screen name, account data and timeline summary.
+FetchResult = Tuple[
+    Any,
+    Optional[records.AccountRecord],
+    Optional[timeline.TimelineAccumulator],
+]
+
+# Requests per 15 minute window of the Twitter API v1.1 with user
+# authentication.
+RATE_LIMITS = {
+    "get_user": (900, 15 * 60.0),
+    "user_timeline": (900, 15 * 60.0),
+}
+
+
+class TokenBucket:
+    """Thread-safe token bucket.
+
+    Args:
+        capacity (int): Number of requests per window.
+        period (float): Length of window in seconds.
+        clock (Callable[[], float]): Monotonic clock.
+        sleep (Callable[[float], None]): Function to wait with.
+    """
+
+    def __init__(
+        self,
+        capacity: int,
+        period: float,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.clock = clock
+        self.sleep = sleep
+        self._tokens = float(capacity)
+        self._updated = clock()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        elapsed = max(now - max(self._updated, self._blocked_until), 0.0)
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+        self._updated = max(now, self._updated)
+
+    def try_acquire(self) -> float:
+        """Take a token if one is available.
+
+        Returns:
+            float: 0 if a token was taken, otherwise the number of seconds
+                until the next token becomes available.
+        """
+        with self._lock:
+            now = self.clock()
+            if now < self._blocked_until:
+                return self._blocked_until - now
+            self._refill(now)
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return 0.0
+            return (1.0 - self._tokens) / self.rate
+
+    def acquire(self) -> float:
+        """Take a token, waiting until one is available.
+
+        Returns:
+            float: Number of seconds waited.
+        """
+        waited = 0.0
+        while True:
+            delay = self.try_acquire()
+            if delay == 0.0:
+                return waited
+            self.sleep(delay)
+            waited += delay
+
+    def block_for(self, seconds: float) -> None:
+        """Hand out no tokens for the given number of seconds.
+
+        Used when the API reports an exhausted window, e.g. because another
+        process shares the same credentials.
+        """
+        with self._lock:
+            self._tokens = 0.0
+            self._blocked_until = max(
+                self._blocked_until, self.clock() + max(seconds, 0.0)
+            )
+
+
+class RateLimitScheduler:
+    """Token buckets of all endpoints of the Twitter API.
+
+    Args:
+        limits (Optional[Dict[str, Tuple[int, float]]]): Requests per window
+            and window length in seconds per endpoint. Defaults to
+            RATE_LIMITS.
+    """
+
+    def __init__(
+        self,
+        limits: Optional[Dict[str, Tuple[int, float]]] = None,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        if limits is None:
+            limits = RATE_LIMITS
+        self.buckets = {
+            endpoint: TokenBucket(capacity, period, clock=clock, sleep=sleep)
+            for endpoint, (capacity, period) in limits.items()
+        }
+        self.waited = 0.0
+        self._lock = threading.Lock()
+
+    def call(self, endpoint: str, fn: Callable, *args, **kwargs) -> Any:
+        """Call fn as soon as endpoint has capacity left.
+
+        Calls rejected with HTTP 429 block the endpoint until the reset time
+        reported by the API and are retried.
+        """
+        bucket = self.buckets[endpoint]
+        while True:
+            waited = bucket.acquire()
+            if waited:
+                with self._lock:
+                    self.waited += waited
+                instrumentation.incr("rate_limit_waits", endpoint=endpoint)
+                instrumentation.observe("rate_limit.wait", waited)
+            try:
+                return fn(*args, **kwargs)
+            except tweepy.errors.TooManyRequests as e:
+                instrumentation.incr("rate_limited", endpoint=endpoint)
+                bucket.block_for(_seconds_until_reset(e))
+
+
+def _seconds_until_reset(error: tweepy.errors.TooManyRequests) -> float:
+    try:
+        reset = float(error.response.headers["x-rate-limit-reset"])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return RATE_LIMITS["user_timeline"][1]
+    return reset - time.time() + 1.0
+
+
+def _request(endpoint, fn, *args, **kwargs):
+    instrumentation.incr("api_calls", endpoint=endpoint)
+    with instrumentation.span(f"api.{endpoint}"):
+        return fn(*args, **kwargs)
+
+
+def _call(scheduler, endpoint, fn, *args, **kwargs):
+    if scheduler is None:
+        return _request(endpoint, fn, *args, **kwargs)
+    return scheduler.call(endpoint, _request, endpoint, fn, *args, **kwargs)
+
+
+def fetch_user(
+    api: tweepy.API,
+    user_id: int,
+    scheduler: Optional[RateLimitScheduler] = None,
+    cache_: Optional[cache.Cache] = None,
+) -> Optional[records.AccountRecord]:
+    """:returns: account data of user or None if the account does not exist"""
+    if cache_ is not None:
+        payload = cache_.get("user", user_id)
+        if payload is not None:
+            return records.AccountRecord.from_json(payload)
+    try:
+        user = _call(scheduler, "get_user", api.get_user, id=user_id)
+    except tweepy.errors.TweepyException:
+        return None
+    if cache_ is not None:
+        cache_.put("user", user.id, user._json)
+    return records.AccountRecord.from_tweepy(user)
+
+
+def fetch_user_by_screen_name(
+    api: tweepy.API,
+    screen_name: str,
+    scheduler: Optional[RateLimitScheduler] = None,
+    cache_: Optional[cache.Cache] = None,
+) -> records.AccountRecord:
+    """Get account data of user by screen name.
+
+    Errors of the API connector, e.g. for unknown users, are raised to the
+    caller.
+    """
+    if cache_ is not None:
+        user_id = cache_.get("screen_name", screen_name.lower())
+        payload = None if user_id is None else cache_.get("user", user_id)
+        if payload is not None:
+            return records.AccountRecord.from_json(payload)
+    user = _call(scheduler, "get_user", api.get_user, screen_name=screen_name)
+    if cache_ is not None:
+        cache_.put("screen_name", screen_name.lower(), user.id)
+        cache_.put("user", user.id, user._json)
+    return records.AccountRecord.from_tweepy(user)
+
+
+def iter_timeline(
+    api: tweepy.API,
+    user_id: int,
+    scheduler: Optional[RateLimitScheduler] = None,
+    since_id: Optional[int] = None,
+) -> Iterator[List[Any]]:
+    """Page through a user's timeline from the newest tweet backwards.
+
+    Only the current page is held in memory. Errors of the API connector
+    are raised to the caller.
+
+    Args:
+        since_id (Optional[int]): Stop at this tweet, only newer tweets are
+            fetched. Defaults to the whole timeline.
+
+    Yields:
+        List[Any]: Pages of up to PAGE_SIZE tweets.
+    """
+    max_id = None
+    while True:
+        kwargs = {"id": user_id, "count": PAGE_SIZE}
+        if max_id is not None:
+            kwargs["max_id"] = max_id
+        if since_id is not None:
+            kwargs["since_id"] = since_id
+        page = _call(scheduler, "user_timeline", api.user_timeline, **kwargs)
+        if len(page) == 0:
+            return
+        max_id = page[-1].id - 1
+        instrumentation.incr("pages_fetched")
+        yield page
+
+
+def fetch_timeline(
+    api: tweepy.API,
+    user_id: int,
+    scheduler: Optional[RateLimitScheduler] = None,
+) -> Optional[List[Any]]:
+    """:returns: list of all tweets of the passed user or None if the timeline is not accessible"""
+    all_tweets = []
+    try:
+        for page in iter_timeline(api, user_id, scheduler):
+            all_tweets.extend(page)
+        return all_tweets
+    except tweepy.errors.TweepyException:
+        return None
+
+
+def summarize_timeline(
+    api: tweepy.API,
+    user_id: int,
+    scheduler: Optional[RateLimitScheduler] = None,
+    cache_: Optional[cache.Cache] = None,
+    refresh_after: float = REFRESH_AFTER,
+) -> Optional[timeline.TimelineAccumulator]:
+    """Stream a user's timeline into a TimelineAccumulator, dropping each page once it is accumulated.
+
+    A cached summary is returned as it is while it is younger than
+    refresh_after seconds. An older one is refreshed: only the tweets posted
+    after its newest tweet are fetched and added to it.
+
+    Returns:
+        Optional[timeline.TimelineAccumulator]: Summary of the timeline or
+            None if the timeline is not accessible.
+    """
+    accumulator = None
+    if cache_ is not None:
+        entry = cache_.get_entry("timeline", user_id)
+        if entry is not None and entry[0].get("version") == timeline.STATE_VERSION:
+            state, stored = entry
+            accumulator = timeline.TimelineAccumulator.from_dict(state)
+            if cache_.clock() - stored < refresh_after:
+                return accumulator
+    if accumulator is None:
+        accumulator = timeline.TimelineAccumulator()
+        mode = "full"
+    else:
+        mode = "incremental"
+    try:
+        with instrumentation.span("fetch.timeline"):
+            for page in iter_timeline(
+                api, user_id, scheduler, since_id=accumulator.newest_id
+            ):
+                accumulator.update(records.TweetBatch.from_statuses(page))
+    except tweepy.errors.TweepyException:
+        return None
+    instrumentation.incr("timeline_fetches", mode=mode)
+    if cache_ is not None:
+        cache_.put("timeline", user_id, accumulator.to_dict())
+    return accumulator
+
+
+class Fetcher:
+    """Fetch accounts and timelines of many users concurrently.
+
+    Args:
+        api (tweepy.API): Twitter API connector or a stand-in with the same
+            get_user and user_timeline methods.
+        scheduler (Optional[RateLimitScheduler]): Shared rate limit
+            scheduler. Defaults to a new scheduler with RATE_LIMITS.
+        max_workers (int): Number of users in flight at once.
+        cache_ (Optional[cache.Cache]): Cache of API payloads. Cached users
+            and timelines are not fetched again.
+        refresh_after (float): Age in seconds after which cached timelines
+            are refreshed with the tweets posted since.
+    """
+
+    def __init__(
+        self,
+        api: tweepy.API,
+        scheduler: Optional[RateLimitScheduler] = None,
+        max_workers: int = 16,
+        cache_: Optional[cache.Cache] = None,
+        refresh_after: float = REFRESH_AFTER,
+    ):
+        self.api = api
+        self.scheduler = RateLimitScheduler() if scheduler is None else scheduler
+        self.max_workers = max_workers
+        self.cache = cache_
+        self.refresh_after = refresh_after
+
+    def get_user(self, user_id: int) -> Optional[records.AccountRecord]:
+        return fetch_user(self.api, user_id, self.scheduler, self.cache)
+
+    def get_timeline(
+        self, user_id: int
+    ) -> Optional[timeline.TimelineAccumulator]:
+        return summarize_timeline(
+            self.api, user_id, self.scheduler, self.cache, self.refresh_after
+        )
+
+    def fetch(
+        self, user_id: int, timeline_: bool = True
+    ) -> FetchResult:
+        """Fetch account and, unless it is protected, the timeline of a user.
+
+        Returns:
+            FetchResult: User id, account data or None and timeline summary
+                or None.
+        """
+        account = self.get_user(user_id)
+        summary = None
+        if timeline_ and account is not None and not account.protected:
+            summary = self.get_timeline(user_id)
+        return user_id, account, summary
+
+    def fetch_by_screen_name(
+        self,
+        screen_name: str,
+        needs_timeline: Optional[Callable[[records.AccountRecord], bool]] = None,
+    ) -> FetchResult:
+        """Fetch account and, unless it is protected, the timeline of a user by screen name.
+
+        Args:
+            screen_name (str): Screen name of the user.
+            needs_timeline (Optional[Callable[[records.AccountRecord], bool]]):
+                Whether the timeline of a fetched account is needed.
+                Defaults to always.
+
+        Returns:
+            FetchResult: Screen name, account data or None if the user could
+                not be found and timeline summary or None.
+        """
+        try:
+            account = fetch_user_by_screen_name(
+                self.api, screen_name, self.scheduler, self.cache
+            )
+        except tweepy.errors.TweepyException:
+            return screen_name, None, None
+        summary = None
+        if not account.protected and (
+            needs_timeline is None or needs_timeline(account)
+        ):
+            summary = self.get_timeline(account.id)
+        return screen_name, account, summary
+
+    def fetch_many(
+        self,
+        user_ids: Iterable[int],
+        needs_timeline: Callable[[int], bool] = lambda user_id: True,
+    ) -> Iterator[FetchResult]:
+        """Fetch many users concurrently.
+
+        Args:
+            user_ids (Iterable[int]): Users to fetch.
+            needs_timeline (Callable[[int], bool]): Whether the timeline of
+                a user is needed.
+
+        Yields:
+            FetchResult: Results of fetch in the order they complete.
+        """
+        return self._map(
+            lambda user_id: self.fetch(user_id, needs_timeline(user_id)),
+            user_ids,
+        )
+
+    def fetch_many_by_screen_name(
+        self,
+        screen_names: Iterable[str],
+        needs_timeline: Optional[Callable[[records.AccountRecord], bool]] = None,
+    ) -> Iterator[FetchResult]:
+        """Fetch many users by screen name concurrently.
+
+        Args:
+            screen_names (Iterable[str]): Screen names of the users.
+            needs_timeline (Optional[Callable[[records.AccountRecord], bool]]):
+                Whether the timeline of a fetched account is needed. Called
+                on the fetch threads. Defaults to always.
+
+        Yields:
+            FetchResult: Results of fetch_by_screen_name in the order they
+                complete.
+        """
+        return self._map(
+            lambda screen_name: self.fetch_by_screen_name(
+                screen_name, needs_timeline
+            ),
+            screen_names,
+        )
+
+    def _map(self, fn: Callable, items: Iterable) -> Iterator:
+        """Apply fn to items on the thread pool with a bounded number of pending items."""
+        with concurrent.futures.ThreadPoolExecutor(self.max_workers) as pool:
+            pending = set()
+            for item in items:
+                pending.add(pool.submit(fn, item))
+                if len(pending) < 2 * self.max_workers:
+                    continue
+                done, pending = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                for future in done:
+                    yield future.result()
+            for future in concurrent.futures.as_completed(pending):
+                yield future.result()
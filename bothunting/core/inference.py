@@ -0,0 +1,490 @@
+"""
+Inference with the stored model using NumPy only.
+
+Loading the joblib model artifact unpickles scikit-learn estimators and with
+them most of scikit-learn, which takes longer than classifying an account.
+Next to the artifact, modelstore.save therefore exports the fitted scaler and
+classifier as plain arrays into an .npz file. This module loads that file and
+evaluates it without importing scikit-learn, pandas or tweepy, so short-lived
+workers and CLI calls that only score features start quickly.
+
+Random forests and logistic regressions can be exported; for other
+estimators export returns None and callers fall back to modelstore.load.
+
+A random forest is flattened into one array per node attribute over all
+trees. Leaves point to themselves, so all trees are walked down for a whole
+batch at once in as many vectorized steps as the deepest tree is deep,
+without per-tree Python loops or scikit-learn's input validation.
+Thresholds are stored as float32, rounded down: scikit-learn compares
+float32 features against float64 thresholds, which gives the same decisions
+as comparing against the largest float32 not above the threshold. Forests
+can be pruned to fewer trees or a maximum depth on export, see export.
+
+The exported objects mimic the scikit-learn interface used by master
+(scaler.transform, classifier.predict_proba and classifier.classes_), so
+master.predict and master.predict_proba accept an InferenceModel as well as a
+modelstore.Model.
+"""
+
+import pathlib
+from typing import Any, Dict, List, Optional, Union
+
+import numpy as np
+
+from bothunting.utils import fileutil
+
+
+# Increase whenever the layout of the exported arrays changes.
+FORMAT_VERSION = 3
+
+# Value of children_left of leaves in scikit-learn, see
+# sklearn.tree._tree.TREE_LEAF.
+TREE_LEAF = -1
+
+# Rows walked down the trees at once, bounding the memory of large batches.
+BLOCK_ROWS = 4096
+
+# Largest difference of class probabilities between an exported model and
+# the model it was exported from, see deviation.
+MAX_DEVIATION = 1e-9
+
+
+class Scaler:
+    """Standardization with the mean and scale of a fitted StandardScaler."""
+
+    __slots__ = ("mean", "scale")
+
+    def __init__(self, mean: np.ndarray, scale: np.ndarray):
+        self.mean = mean
+        self.scale = scale
+
+    def transform(self, X: np.ndarray) -> np.ndarray:
+        return (np.asarray(X, dtype=np.float64) - self.mean) / self.scale
+
+
+class Forest:
+    """Random forest with the nodes of all trees in concatenated arrays.
+
+    Attributes:
+        classes_ (numpy.ndarray): Class labels.
+        roots (numpy.ndarray): Index of the root of every tree.
+        children_left, children_right (numpy.ndarray): Indices of the
+            children of every node; leaves are their own children.
+        feature (numpy.ndarray): Feature tested at every node, 0 at leaves.
+        threshold (numpy.ndarray): float32 threshold tested at every node,
+            infinity at leaves and at splits of missing from present values.
+        missing_go_to_left (numpy.ndarray): Whether rows missing the tested
+            feature (NaN) go to the left child, as recorded by scikit-learn.
+        value (numpy.ndarray): Class probabilities at every leaf; leaves
+            are numbered before inner nodes.
+        max_depth (int): Depth of the deepest leaf.
+    """
+
+    __slots__ = (
+        "classes_",
+        "roots",
+        "children_left",
+        "children_right",
+        "feature",
+        "threshold",
+        "missing_go_to_left",
+        "value",
+        "max_depth",
+    )
+
+    def __init__(
+        self,
+        classes_: np.ndarray,
+        roots: np.ndarray,
+        children_left: np.ndarray,
+        children_right: np.ndarray,
+        feature: np.ndarray,
+        threshold: np.ndarray,
+        missing_go_to_left: np.ndarray,
+        value: np.ndarray,
+        max_depth: int,
+    ):
+        self.classes_ = classes_
+        # Indices are stored as int32; indexing with anything but intp
+        # converts the index array on every step.
+        self.roots = roots.astype(np.intp)
+        self.children_left = children_left.astype(np.intp)
+        self.children_right = children_right.astype(np.intp)
+        self.feature = feature.astype(np.intp)
+        self.threshold = threshold
+        self.missing_go_to_left = missing_go_to_left
+        self.value = value
+        self.max_depth = max_depth
+
+    @property
+    def n_trees(self) -> int:
+        return self.roots.size
+
+    def apply(self, X: np.ndarray) -> np.ndarray:
+        """:returns: index of the leaf every row of X reaches in every tree, shape (rows, trees)"""
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        n, n_features = X.shape
+        # NaN fails every comparison and would always go right; only
+        # batches with missing values pay for looking up their direction.
+        missing = bool(np.isnan(X).any())
+        if n == 1:
+            return self._apply_row(X[0], missing)[None]
+        X = X.ravel()
+        n_leaves = self.value.shape[0]
+        node = np.tile(self.roots, n)
+        offset = np.repeat(np.arange(n, dtype=np.intp) * n_features, self.n_trees)
+        leaves = node.copy()
+        # Walks still descending. Walks that reached a leaf stay there and
+        # are only dropped once half of them did, which costs less than
+        # dropping them at every step.
+        active = np.arange(node.size)
+        for _ in range(self.max_depth):
+            values = X[offset + self.feature[node]]
+            go_left = values <= self.threshold[node]
+            if missing:
+                go_left |= np.isnan(values) & self.missing_go_to_left[node]
+            node = np.where(
+                go_left, self.children_left[node], self.children_right[node]
+            )
+            # Leaves are numbered first.
+            inner = node >= n_leaves
+            if np.count_nonzero(inner) * 2 <= active.size:
+                leaves[active] = node
+                active, node, offset = active[inner], node[inner], offset[inner]
+                if not active.size:
+                    break
+        leaves[active] = node
+        return leaves.reshape(n, self.n_trees)
+
+    def _apply_row(self, x: np.ndarray, missing: bool) -> np.ndarray:
+        # A single row, as classify_account predicts, takes as long as the
+        # number of NumPy calls: every tree takes max_depth steps, checking
+        # whether all reached a leaf would cost more than it saves.
+        node = self.roots
+        for _ in range(self.max_depth):
+            values = x[self.feature[node]]
+            go_left = values <= self.threshold[node]
+            if missing:
+                go_left |= np.isnan(values) & self.missing_go_to_left[node]
+            node = np.where(
+                go_left, self.children_left[node], self.children_right[node]
+            )
+        return node
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        X = np.asarray(X)
+        return np.concatenate(
+            [
+                self.value[self.apply(X[i : i + BLOCK_ROWS])].mean(axis=1)
+                for i in range(0, max(X.shape[0], 1), BLOCK_ROWS)
+            ]
+        )
+
+
+class Linear:
+    """Logistic regression with the coefficients of a fitted LogisticRegression."""
+
+    __slots__ = ("classes_", "coef", "intercept")
+
+    def __init__(
+        self, classes_: np.ndarray, coef: np.ndarray, intercept: np.ndarray
+    ):
+        self.classes_ = classes_
+        self.coef = coef
+        self.intercept = intercept
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        scores = np.asarray(X, dtype=np.float64) @ self.coef.T + self.intercept
+        if self.coef.shape[0] == 1:
+            p = 1.0 / (1.0 + np.exp(-scores[:, 0]))
+            return np.column_stack([1.0 - p, p])
+        scores -= scores.max(axis=1, keepdims=True)
+        proba = np.exp(scores)
+        return proba / proba.sum(axis=1, keepdims=True)
+
+
+class InferenceModel:
+    """Exported counterpart of modelstore.Model."""
+
+    __slots__ = (
+        "classifier",
+        "scaler",
+        "columns",
+        "data_hash",
+        "fast_path",
+        "threshold",
+    )
+
+    def __init__(
+        self,
+        classifier: Union[Forest, Linear],
+        scaler: Scaler,
+        columns: List[str],
+        data_hash: str,
+        fast_path: Optional["InferenceModel"] = None,
+        threshold: Optional[float] = None,
+    ):
+        self.classifier = classifier
+        self.scaler = scaler
+        self.columns = list(columns)
+        self.data_hash = data_hash
+        self.fast_path = fast_path
+        self.threshold = threshold
+
+
+def _floor_float32(threshold: np.ndarray) -> np.ndarray:
+    """:returns: largest float32 values not above the float64 thresholds"""
+    rounded = threshold.astype(np.float32)
+    above = rounded.astype(np.float64) > threshold
+    rounded[above] = np.nextafter(rounded[above], np.float32(-np.inf))
+    return rounded
+
+
+def _export_forest(
+    classifier: Any,
+    max_depth: Optional[int] = None,
+    max_trees: Optional[int] = None,
+) -> Dict[str, np.ndarray]:
+    trees = [e.tree_ for e in classifier.estimators_[:max_trees]]
+    sizes = [t.node_count for t in trees]
+    roots = np.cumsum([0] + sizes[:-1])
+    offsets = np.repeat(roots, sizes)
+    left = np.concatenate([t.children_left for t in trees]).astype(np.intp)
+    right = np.concatenate([t.children_right for t in trees]).astype(np.intp)
+    leaf = left == TREE_LEAF
+    left = np.where(leaf, TREE_LEAF, left + offsets)
+    right = np.where(leaf, TREE_LEAF, right + offsets)
+
+    # Depth of every node, level by level over all trees at once.
+    depth = np.full(left.size, -1, dtype=np.intp)
+    level, frontier = 0, roots
+    while frontier.size and (max_depth is None or level <= max_depth):
+        depth[frontier] = level
+        inner = frontier[~leaf[frontier]]
+        frontier = np.concatenate([left[inner], right[inner]])
+        level += 1
+    # Inner nodes at max_depth become leaves predicting the class
+    # distribution of their training samples, deeper nodes are dropped.
+    # Leaves are numbered first, so only they need a row in value.
+    kept = depth >= 0
+    if max_depth is not None:
+        leaf |= depth == max_depth
+    leaf &= kept
+    order = np.concatenate([np.flatnonzero(leaf), np.flatnonzero(kept & ~leaf)])
+    index = np.full(left.size, TREE_LEAF, dtype=np.intp)
+    index[order] = np.arange(order.size)
+    n_leaves = np.count_nonzero(leaf)
+    inner = order[n_leaves:]
+    children_left = np.arange(order.size)
+    children_right = np.arange(order.size)
+    children_left[n_leaves:] = index[left[inner]]
+    children_right[n_leaves:] = index[right[inner]]
+    feature = np.zeros(order.size, dtype=np.int32)
+    feature[n_leaves:] = np.concatenate([t.feature for t in trees])[inner]
+    threshold = np.full(order.size, np.inf, dtype=np.float32)
+    threshold[n_leaves:] = _floor_float32(
+        np.concatenate([t.threshold for t in trees])[inner]
+    )
+    missing_go_to_left = np.zeros(order.size, dtype=bool)
+    if all(hasattr(t, "missing_go_to_left") for t in trees):
+        # Recorded since scikit-learn 1.3, older trees reject NaN.
+        missing_go_to_left[n_leaves:] = np.concatenate(
+            [t.missing_go_to_left for t in trees]
+        )[inner]
+    value = np.concatenate([t.value[:, 0, :] for t in trees])[order[:n_leaves]]
+    return {
+        "kind": np.array("forest"),
+        "classes": np.asarray(classifier.classes_),
+        "roots": index[roots].astype(np.int32),
+        "children_left": children_left.astype(np.int32),
+        "children_right": children_right.astype(np.int32),
+        "feature": feature,
+        "threshold": threshold,
+        "missing_go_to_left": missing_go_to_left,
+        "value": value / value.sum(axis=1, keepdims=True),
+        "max_depth": np.array(int(depth[leaf].max())),
+    }
+
+
+def _export_classifier(
+    classifier: Any,
+    max_depth: Optional[int] = None,
+    max_trees: Optional[int] = None,
+) -> Optional[Dict[str, np.ndarray]]:
+    if hasattr(classifier, "estimators_") and hasattr(
+        classifier.estimators_[0], "tree_"
+    ):
+        return _export_forest(classifier, max_depth=max_depth, max_trees=max_trees)
+    if hasattr(classifier, "coef_") and hasattr(classifier, "predict_proba"):
+        return {
+            "kind": np.array("linear"),
+            "classes": np.asarray(classifier.classes_),
+            "coef": np.asarray(classifier.coef_, dtype=np.float64),
+            "intercept": np.asarray(classifier.intercept_, dtype=np.float64),
+        }
+    return None
+
+
+def export(
+    model: Any,
+    prefix: str = "",
+    max_depth: Optional[int] = None,
+    max_trees: Optional[int] = None,
+) -> Optional[Dict[str, np.ndarray]]:
+    """Export a modelstore.Model to arrays.
+
+    Args:
+        model: Model to export.
+        prefix (str): Prefix of the array names.
+        max_depth (Optional[int]): Prune the trees of random forests to this
+            depth; inner nodes at max_depth become leaves.
+        max_trees (Optional[int]): Keep only the first max_trees trees of
+            random forests.
+
+    Returns:
+        Optional[Dict[str, numpy.ndarray]]: Arrays to store with save or None
+            if the classifier of model or of its fast path is not supported.
+    """
+    arrays = _export_classifier(
+        model.classifier, max_depth=max_depth, max_trees=max_trees
+    )
+    if arrays is None:
+        return None
+    arrays = {prefix + k: v for k, v in arrays.items()}
+    arrays[prefix + "scaler_mean"] = np.asarray(model.scaler.mean_)
+    arrays[prefix + "scaler_scale"] = np.asarray(model.scaler.scale_)
+    arrays[prefix + "columns"] = np.array(model.columns)
+    arrays[prefix + "data_hash"] = np.array(model.data_hash)
+    if model.fast_path is not None:
+        fast_path = export(
+            model.fast_path,
+            prefix + "fast_path.",
+            max_depth=max_depth,
+            max_trees=max_trees,
+        )
+        if fast_path is None:
+            return None
+        arrays.update(fast_path)
+        arrays[prefix + "fast_path_threshold"] = np.array(model.threshold)
+    return arrays
+
+
+def _probe_rows(
+    classifier: Union[Forest, Linear], n_features: int, n: int, seed: int
+) -> np.ndarray:
+    """Draw scaled feature rows for comparing an exported classifier with the original.
+
+    Features tested by a forest take the values of its thresholds and the
+    next larger float32 values, so both sides of every split are reached and
+    rounding of thresholds would show. In the second half of the rows of a
+    forest, every value is missing (NaN) with probability 0.2.
+    """
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n, n_features)).astype(np.float32)
+    if isinstance(classifier, Forest):
+        # Leaves and splits of missing from present values test infinity.
+        finite = np.isfinite(classifier.threshold)
+        for j in range(n_features):
+            below = classifier.threshold[finite & (classifier.feature == j)]
+            if below.size:
+                above = np.nextafter(below, np.float32(np.inf))
+                X[:, j] = rng.choice(np.concatenate([below, above]), size=n)
+        missing = rng.random(size=X.shape) < 0.2
+        missing[: n // 2] = False
+        X[missing] = np.nan
+    return X
+
+
+def deviation(
+    model: Any, arrays: Dict[str, np.ndarray], n: int = 1000, seed: int = 0
+) -> float:
+    """Compare exported arrays with the model they were exported from.
+
+    Args:
+        model: modelstore.Model passed to export.
+        arrays (Dict[str, numpy.ndarray]): Result of export.
+        n (int): Number of rows compared.
+        seed (int): Seed of the rows.
+
+    Returns:
+        float: Largest difference between the class probabilities of model
+            and of the exported classifier, of the fast path included.
+    """
+    return _deviation(model, _build(arrays), n, seed)
+
+
+def _deviation(model: Any, exported: InferenceModel, n: int, seed: int) -> float:
+    X = _probe_rows(exported.classifier, len(exported.columns), n, seed)
+    # Rows with and without missing values take different paths of Forest.
+    result = max(
+        float(
+            np.abs(
+                model.classifier.predict_proba(part)
+                - exported.classifier.predict_proba(part)
+            ).max()
+        )
+        for part in (X[: n // 2], X[n // 2 :])
+    )
+    if model.fast_path is not None:
+        result = max(result, _deviation(model.fast_path, exported.fast_path, n, seed))
+    return result
+
+
+def save(arrays: Dict[str, np.ndarray], path: Union[str, pathlib.Path]) -> None:
+    """Save the result of export."""
+    with fileutil.atomic_write(path, "wb", compression=None) as f:
+        np.savez(f, format_version=np.array(FORMAT_VERSION), **arrays)
+
+
+def _build(arrays: Any, prefix: str = "") -> InferenceModel:
+    kind = str(arrays[prefix + "kind"])
+    classes_ = arrays[prefix + "classes"]
+    if kind == "forest":
+        classifier = Forest(
+            classes_,
+            arrays[prefix + "roots"],
+            arrays[prefix + "children_left"],
+            arrays[prefix + "children_right"],
+            arrays[prefix + "feature"],
+            arrays[prefix + "threshold"],
+            arrays[prefix + "missing_go_to_left"],
+            arrays[prefix + "value"],
+            int(arrays[prefix + "max_depth"]),
+        )
+    else:
+        classifier = Linear(
+            classes_, arrays[prefix + "coef"], arrays[prefix + "intercept"]
+        )
+    model = InferenceModel(
+        classifier=classifier,
+        scaler=Scaler(
+            arrays[prefix + "scaler_mean"], arrays[prefix + "scaler_scale"]
+        ),
+        columns=arrays[prefix + "columns"].tolist(),
+        data_hash=str(arrays[prefix + "data_hash"]),
+    )
+    if prefix + "fast_path.kind" in arrays:
+        model.fast_path = _build(arrays, prefix + "fast_path.")
+        model.threshold = float(arrays[prefix + "fast_path_threshold"])
+    return model
+
+
+def load(path: Union[str, pathlib.Path]) -> Optional[InferenceModel]:
+    """Load exported model.
+
+    Args:
+        path (Union[str, pathlib.Path]): Exported model, see
+            modelstore.get_inference_path.
+
+    Returns:
+        Optional[InferenceModel]: Exported model or None if there is none or
+            it was written in an outdated format.
+    """
+    path = pathlib.Path(path)
+    if not path.is_file():
+        return None
+    with np.load(path, allow_pickle=False) as arrays:
+        arrays = dict(arrays)
+    if int(arrays.get("format_version", -1)) != FORMAT_VERSION:
+        return None
+    return _build(arrays)
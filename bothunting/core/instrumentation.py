@@ -0,0 +1,316 @@
+"""
+Timing spans, counters and profiling of the classification pipeline.
+
+Instrumentation is disabled by default. While disabled, ``span`` returns a
+shared no-op context manager and ``incr`` returns immediately, so the
+instrumented hot paths pay for little more than a function call.
+
+Usage:
+
+    from bothunting.core import instrumentation
+
+    instrumentation.enable()
+    with instrumentation.span("predict"):
+        ...
+    instrumentation.incr("api_calls", endpoint="get_user")
+    print(instrumentation.to_prometheus())
+"""
+
+import collections
+import contextlib
+import cProfile
+import io
+import json
+import pathlib
+import pstats
+import threading
+import time
+from typing import Any, ContextManager, Dict, Iterator, Optional, Union
+
+import numpy as np
+
+from bothunting.utils import fileutil
+
+
+# Number of most recent durations per span kept for percentiles.
+MAX_SAMPLES = 4096
+
+PROMETHEUS_PREFIX = "bothunting"
+
+
+class _NullSpan:
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("registry", "name", "start")
+
+    def __init__(self, registry: "Instrumentation", name: str):
+        self.registry = registry
+        self.name = name
+
+    def __enter__(self) -> "_Span":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.registry.observe(self.name, time.perf_counter() - self.start)
+
+
+class SpanStats:
+    """Aggregated durations of a span."""
+
+    __slots__ = ("count", "total", "max", "samples")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = collections.deque(maxlen=MAX_SAMPLES)
+
+    def add(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.samples.append(seconds)
+
+    def merge(self, other: "SpanStats") -> None:
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        self.samples.extend(other.samples)
+
+    def to_dict(self) -> Dict[str, float]:
+        samples = np.asarray(self.samples)
+        p50, p90, p99 = (
+            np.percentile(samples, [50, 90, 99]) if samples.size else (0, 0, 0)
+        )
+        return {
+            "count": self.count,
+            "total_s": self.total,
+            "max_s": self.max,
+            "p50_s": float(p50),
+            "p90_s": float(p90),
+            "p99_s": float(p99),
+        }
+
+
+class Instrumentation:
+    """Registry of timing spans and counters.
+
+    Args:
+        enabled (bool): Record spans and counters.
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.spans = {}
+        self.counters = {}
+        self.profile_stats = None
+        self._lock = threading.Lock()
+
+    def span(self, name: str) -> Union[_Span, _NullSpan]:
+        """Context manager timing the enclosed block as span name."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    def observe(self, name: str, seconds: float) -> None:
+        """Record a duration of span name measured elsewhere."""
+        if not self.enabled:
+            return
+        with self._lock:
+            stats = self.spans.get(name)
+            if stats is None:
+                stats = self.spans[name] = SpanStats()
+            stats.add(seconds)
+
+    def incr(self, name: str, value: float = 1, **labels: Any) -> None:
+        """Increase counter name with the given labels by value."""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def reset(self) -> None:
+        with self._lock:
+            self.spans = {}
+            self.counters = {}
+            self.profile_stats = None
+
+    def drain(self) -> Dict[str, Any]:
+        """Remove the recorded spans and counters and return them for merge.
+
+        Worker processes drain their registry after each task and send the
+        result back to the parent, which merges it into its own registry.
+        """
+        with self._lock:
+            recorded = {"spans": self.spans, "counters": self.counters}
+            self.spans = {}
+            self.counters = {}
+        return recorded
+
+    def merge(self, recorded: Dict[str, Any]) -> None:
+        """Add spans and counters returned by drain of another registry."""
+        if not self.enabled:
+            return
+        with self._lock:
+            for name, other in recorded["spans"].items():
+                stats = self.spans.get(name)
+                if stats is None:
+                    stats = self.spans[name] = SpanStats()
+                stats.merge(other)
+            for key, value in recorded["counters"].items():
+                self.counters[key] = self.counters.get(key, 0) + value
+
+    @contextlib.contextmanager
+    def profile(
+        self, path: Optional[Union[str, pathlib.Path]] = None
+    ) -> Iterator[cProfile.Profile]:
+        """Run the enclosed block under cProfile.
+
+        The statistics are kept in profile_stats and, if path is passed,
+        dumped to it for pstats or snakeviz.
+        """
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield profiler
+        finally:
+            profiler.disable()
+            self.profile_stats = pstats.Stats(profiler, stream=io.StringIO())
+            if path is not None:
+                profiler.dump_stats(str(path))
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Current spans and counters as a JSON serializable dictionary."""
+        with self._lock:
+            return {
+                "spans": {
+                    name: stats.to_dict() for name, stats in self.spans.items()
+                },
+                "counters": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in self.counters.items()
+                ],
+            }
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self) -> str:
+        """Spans and counters in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        lines = []
+        counters = collections.defaultdict(list)
+        for counter in snapshot["counters"]:
+            counters[counter["name"]].append(counter)
+        for name, series in sorted(counters.items()):
+            metric = f"{PROMETHEUS_PREFIX}_{_metric_name(name)}_total"
+            lines.append(f"# TYPE {metric} counter")
+            for counter in series:
+                lines.append(
+                    f"{metric}{_labels(counter['labels'])} {counter['value']}"
+                )
+        if snapshot["spans"]:
+            metric = f"{PROMETHEUS_PREFIX}_span_seconds"
+            lines.append(f"# TYPE {metric} summary")
+            for name, stats in sorted(snapshot["spans"].items()):
+                for quantile in ("50", "90", "99"):
+                    labels = _labels(
+                        {"span": name, "quantile": f"0.{quantile}"}
+                    )
+                    lines.append(f"{metric}{labels} {stats[f'p{quantile}_s']}")
+                labels = _labels({"span": name})
+                lines.append(f"{metric}_sum{labels} {stats['total_s']}")
+                lines.append(f"{metric}_count{labels} {stats['count']}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: Union[str, pathlib.Path]) -> None:
+        """Write spans and counters to path, as Prometheus text if it ends with .prom, else as JSON."""
+        path = pathlib.Path(path)
+        text = self.to_prometheus() if path.suffix == ".prom" else self.to_json()
+        with fileutil.atomic_write(path, compression=None) as f:
+            f.write(text)
+
+
+def _metric_name(name: str) -> str:
+    return "".join(c if c.isalnum() else "_" for c in name)
+
+
+def _escape(value: Any) -> str:
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace('"', '\\"')
+        .replace("\n", "\\n")
+    )
+
+
+def _labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    inner = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+    return "{" + inner + "}"
+
+
+# Process-wide registry used by the bothunting modules.
+registry = Instrumentation()
+
+
+def enable() -> None:
+    registry.enabled = True
+
+
+def disable() -> None:
+    registry.enabled = False
+
+
+def is_enabled() -> bool:
+    return registry.enabled
+
+
+def span(name: str) -> Union[_Span, _NullSpan]:
+    return registry.span(name)
+
+
+def incr(name: str, value: float = 1, **labels: Any) -> None:
+    registry.incr(name, value, **labels)
+
+
+def observe(name: str, seconds: float) -> None:
+    registry.observe(name, seconds)
+
+
+def drain() -> Dict[str, Any]:
+    return registry.drain()
+
+
+def merge(recorded: Dict[str, Any]) -> None:
+    registry.merge(recorded)
+
+
+def profile(
+    path: Optional[Union[str, pathlib.Path]] = None,
+) -> ContextManager[cProfile.Profile]:
+    return registry.profile(path)
+
+
+def snapshot() -> Dict[str, Any]:
+    return registry.snapshot()
+
+
+def to_prometheus() -> str:
+    return registry.to_prometheus()
+
+
+def write(path: Union[str, pathlib.Path]) -> None:
+    registry.write(path)
@@ -0,0 +1,157 @@
+"""
+Append-only journal of computed feature rows.
+
+``master.expand_rows`` appends one JSON line per processed account instead of
+rewriting the whole dataset file. From time to time the journal is compacted:
+the dataset file is rewritten once and the journal is reset to a single
+checkpoint line recording which accounts of the current pass are done.
+Replaying the journal after a crash restores every computed value and the
+exact position of the interrupted run.
+
+Record layouts:
+
+* ``{"id": 123, "pass": 1, "values": {"is_protected": false, ...}}``
+* ``{"checkpoint": true, "pass": 1, "done": [123, 456]}``
+"""
+
+from __future__ import annotations
+
+import json
+import math
+import os
+import pathlib
+from typing import Any, Dict, Iterable, Set, Tuple, Union
+
+import numpy as np
+
+from bothunting.utils import fileutil
+from bothunting.utils import importutil
+
+pd = importutil.lazy_import("pandas")
+
+
+def get_journal_path(csv_file: Union[str, pathlib.Path]) -> pathlib.Path:
+    csv_file = pathlib.Path(csv_file)
+    return csv_file.with_name(csv_file.name + ".journal.jsonl")
+
+
+def to_json_value(value: Any) -> Any:
+    """Convert a DataFrame cell to a JSON serializable value, None for missing values."""
+    if value is None:
+        return None
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, (float, np.floating)):
+        return None if math.isnan(value) else float(value)
+    return value
+
+
+class Journal:
+    """Append-only JSONL journal next to a dataset file.
+
+    Args:
+        path (Union[str, pathlib.Path]): Journal file.
+    """
+
+    def __init__(self, path: Union[str, pathlib.Path]):
+        self.path = pathlib.Path(path)
+        self.n_records = 0
+        self._file = None
+
+    def __enter__(self) -> "Journal":
+        self._file = open(self.path, "a", encoding="utf-8")
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+
+    def append(self, user_id: int, pass_: int, values: Dict[str, Any]) -> None:
+        """Record the feature values of an account processed in pass_."""
+        self._write(
+            {
+                "id": int(user_id),
+                "pass": pass_,
+                "values": {k: to_json_value(v) for k, v in values.items()},
+            }
+        )
+        self.n_records += 1
+
+    def replay(self, df: pd.DataFrame) -> Tuple[int, Set[int]]:
+        """Write all journaled values into df.
+
+        A truncated last line, as left behind by a crash, is cut off so new
+        records are appended after the last complete one.
+
+        Returns:
+            Tuple[int, Set[int]]: Pass the journal ends in and ids of the
+                accounts already processed in that pass.
+        """
+        pass_ = 1
+        done = set()
+        if not self.path.is_file():
+            return pass_, done
+        offset = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("Truncated record")
+                    record = json.loads(line)
+                except ValueError:
+                    os.truncate(self.path, offset)
+                    break
+                offset += len(line)
+                if record["pass"] != pass_:
+                    pass_ = record["pass"]
+                    done = set()
+                if record.get("checkpoint"):
+                    done.update(record["done"])
+                    continue
+                user_id = record["id"]
+                for column, value in record["values"].items():
+                    if value is not None and user_id in df.index:
+                        df.at[user_id, column] = value
+                done.add(user_id)
+                self.n_records += 1
+        return pass_, done
+
+    def checkpoint(self, pass_: int, done: Iterable[int]) -> None:
+        """Reset the journal to a checkpoint once its values are saved elsewhere."""
+        self.close()
+        with fileutil.atomic_write(self.path, compression=None) as f:
+            f.write(
+                json.dumps(
+                    {
+                        "checkpoint": True,
+                        "pass": pass_,
+                        "done": sorted(int(x) for x in done),
+                    }
+                )
+                + "\n"
+            )
+        self.n_records = 0
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def remove(self) -> None:
+        self.close()
+        if self.path.is_file():
+            self.path.unlink()
+
+
+def write_csv_atomic(
+    df: pd.DataFrame, path: Union[str, pathlib.Path], **kwargs
+) -> None:
+    """Write df to a temporary file and rename it to path."""
+    with fileutil.atomic_write(path, newline="") as f:
+        df.to_csv(f, **kwargs)
@@ -1,28 +1,51 @@
+from __future__ import annotations
+
+import argparse
+import concurrent.futures
 import csv
 import datetime
+import json
+import logging
 import pathlib
 import sys
-from typing import Union
-
-import pandas as pd
-import sklearn
-import tweepy
-from sklearn.metrics import (
-    confusion_matrix,
-    classification_report,
-)
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import StandardScaler
-from sklearn.ensemble import RandomForestClassifier
+import threading
+from typing import Iterable, Iterator, List, Tuple, Union
+
+import numpy as np
+from bothunting.core import activity
+from bothunting.core import cache
+from bothunting.core import featurestore
 from bothunting.core import constants as const
+from bothunting.core import dataset
+from bothunting.core import fetcher
+from bothunting.core import inference
+from bothunting.core import instrumentation
+from bothunting.core import journal
+from bothunting.core import modelstore
+from bothunting.core import records
+from bothunting.core import textfeatures
+from bothunting.core import timeline
 
 from bothunting import definitions
+from bothunting.utils import fileutil
 from bothunting.utils import pathutil
+from bothunting.utils import importutil
 from bothunting.utils import osutil
 
+# The Twitter client, pandas and scikit-learn are only needed to fetch
+# accounts, to handle feature tables and to train. They are imported on first
+# use, so scoring features with the stored model (see inference.py) starts
+# without them.
+pd = importutil.lazy_import("pandas")
+tweepy = importutil.lazy_import("tweepy")
 
+
+log = logging.getLogger(__name__)
 here = pathlib.Path(__file__).resolve().parent
-classifier = None
+model = None
+api_cache = None
+
+CLASS_NAMES = {0: "Human", 1: "Traditional Bot", 2: "Social Bot", -1: "Error"}
 
 
 def api_setup(
@@ -30,6 +53,7 @@ def api_setup(
     consumer_secret: str,
     access_token: str,
     access_token_secret: str,
+    wait_on_rate_limit: bool = True,
 ) -> tweepy.API:
     """Connect to Twitter API.
 
@@ -38,16 +62,21 @@ def api_setup(
         consumer_secret (str): Consumer secret.
         access_token (str): Access token.
         access_token_secret (str): Access token secret.
+        wait_on_rate_limit (bool): Block until the rate limit window resets.
+            Disable for connectors used by a fetcher.Fetcher, which
+            schedules requests itself.
 
     Returns:
         tweepy.API: Connector to Twitter API.
     """
     auth = tweepy.OAuthHandler(consumer_key, consumer_secret)
     auth.set_access_token(access_token, access_token_secret)
-    return tweepy.API(auth, wait_on_rate_limit=True)
+    return tweepy.API(auth, wait_on_rate_limit=wait_on_rate_limit)
 
 
-def get_user(user_id: str, api: tweepy.API) -> Union[None, str]:
+def get_user(
+    user_id: str, api: tweepy.API
+) -> Union[None, records.AccountRecord]:
     """Get account data of Twitter user.
 
     Args:
@@ -55,39 +84,31 @@ def get_user(user_id: str, api: tweepy.API) -> Union[None, str]:
         api ([type]): Twitter API connector.
 
     Returns:
-        Union[None, str]: Account data of user or None if the user account does not exist
-            or is protected.
+        Union[None, records.AccountRecord]: Account data of user or None if the user account
+            does not exist or is protected.
     """
 
     try:
         user_data = api.get_user(id=user_id)
-        return user_data
+        return records.AccountRecord.from_tweepy(user_data)
     except:
         return None
 
 
 def get_all_tweets(user_id, api):
     """:returns: list of all tweets of the passed user"""
-    all_tweets = []
-    try:
-        new_tweets = api.user_timeline(id=user_id, count=200)
-        all_tweets.extend(new_tweets)
-        if len(all_tweets) > 0:
-            oldest = all_tweets[-1].id - 1
-            while len(new_tweets) > 0:
-                new_tweets = api.user_timeline(
-                    id=user_id, count=200, max_id=oldest
-                )  # , tweet_mode='extended'
-                all_tweets.extend(new_tweets)
-                oldest = all_tweets[-1].id - 1
-        return all_tweets
-    except tweepy.errors.TweepyException:
-        return None
+    return fetcher.fetch_timeline(api=api, user_id=user_id)
+
+
+def get_timeline(user_id, api, cache_=None):
+    """:returns: timeline.TimelineAccumulator summarizing all tweets of the passed user, streamed page by page;
+    with a cache.Cache, a stored summary is refreshed with the newer tweets only"""
+    return fetcher.summarize_timeline(api=api, user_id=user_id, cache_=cache_)
 
 
 def write_tweets_to_csv(tweets, file_name):
     """writes a csv file that contains a row for every tweet in tweets"""
-    with open(f"{file_name}.csv", "w") as f:
+    with fileutil.atomic_write(f"{file_name}.csv", newline="") as f:
         writer = csv.writer(f)
         writer.writerow(["id", "created_at", "text"])
         writer.writerows(
@@ -97,11 +118,8 @@ def write_tweets_to_csv(tweets, file_name):
 
 def get_links_in_tweet(tweet_text):
     """:returns: (list of links in tweet_text, count of links in tweet_text)"""
-    # print(re.search("(?P<url>https?://[^\s]+)", myString).group("url"))
-    tweet_text = tweet_text.replace("https://pbs.twimg.com/", "")
-    return [t for t in tweet_text.split(" ") if "http" in t], tweet_text.count(
-        "http"
-    )
+    links = textfeatures.find_links(tweet_text)
+    return links, len(links)
 
 
 def get_account_creation_datetime(account_object):
@@ -114,75 +132,72 @@ def get_account_creation_datetime(account_object):
 def get_time_of_existence(account_object):
     """:returns: None if the account does not exist or else the amount of days since the account's creation"""
     if account_object is not None:
-        return (
-            datetime.datetime.now()
-            - get_account_creation_datetime(account_object)
-        ).days
+        created_at = get_account_creation_datetime(account_object)
+        return (datetime.datetime.now(tz=created_at.tzinfo) - created_at).days
     return None
 
 
+def get_activity_histogram(tweet_list, account_object=None):
+    """:returns: ActivityHistogram of tweet_list (a records.TweetBatch or a list of tweets) covering all days
+    since the account's creation or, if no account is passed, since the oldest tweet's creation"""
+    if tweet_list is None:
+        return None
+    origin = None
+    if account_object is not None:
+        origin = records.parse_created_at(
+            get_account_creation_datetime(account_object)
+        )
+    if isinstance(tweet_list, records.TweetBatch):
+        return activity.ActivityHistogram.from_ordinals(
+            tweet_list.day_ordinals(),
+            origin=None if origin is None else activity.to_ordinal(origin),
+        )
+    # Only the creation dates are needed, so the tweets are not analyzed into
+    # a records.TweetBatch.
+    return activity.ActivityHistogram.from_datetimes(
+        (records.parse_created_at(tweet.created_at) for tweet in tweet_list),
+        origin=origin,
+    )
+
+
 def get_tweet_distribution(tweet_list, account_object=None):
     """:returns: dictionary with all days as dates since the first tweet's creation (date='date_of_first_tweet') or the
     passed date (datetime object) as keys and the amount of tweets tweeted on that day from tweet_list
     (e.g. get_all_tweets(account_object.screen_name)) as values"""
     if tweet_list is None:
         return None
-    counter = {}
-    if account_object is None:
-        first_date = tweet_list[0].created_at
-    else:
-        first_date = get_account_creation_datetime(account_object)
-    first_date = datetime.date(
-        year=first_date.year, month=first_date.month, day=first_date.day
-    )
-    today = datetime.date.today()
-    for i in range(0, (today - first_date).days + 1):
-        counter[first_date + datetime.timedelta(days=i)] = 0
-    for tweet in tweet_list:
-        date = tweet.created_at
-        counter[
-            datetime.date(year=date.year, month=date.month, day=date.day)
-        ] += 1
-    return counter
-
-
-def get_inactive_days(tweet_list, account_object=None):
+    return get_activity_histogram(
+        tweet_list=tweet_list, account_object=account_object
+    ).to_dict()
+
+
+def get_inactive_days(tweet_list, account_object=None, histogram=None):
     """:returns: number of days since the account's creation or the first tweet's date on which was not tweeted"""
-    if tweet_list is None:
+    if tweet_list is None and histogram is None:
         return None
-    return len(
-        [
-            d
-            for d in get_tweet_distribution(
-                tweet_list=tweet_list, account_object=account_object
-            ).values()
-            if d == 0
-        ]
-    )
+    if histogram is None:
+        histogram = get_activity_histogram(
+            tweet_list=tweet_list, account_object=account_object
+        )
+    return histogram.inactive_days
 
 
-def get_average(tweet_list, account_object=None, mode="all"):
+def get_average(tweet_list, account_object=None, mode="all", histogram=None):
     """:returns: average tweets per day (mode="all") or per day with tweet output (mode="active")"""
-    if tweet_list is not None:
-        counter = get_tweet_distribution(
+    if tweet_list is None and histogram is None:
+        return None
+    if histogram is None:
+        histogram = get_activity_histogram(
             tweet_list=tweet_list, account_object=account_object
         )
-        if mode == "all":
-            return sum(counter.values()) / len(counter)
-        elif mode == "active":
-            return sum(counter.values()) / len(
-                [v for v in counter.values() if v > 0]
-            )
-    else:
-        return None
+    return histogram.average(mode=mode)
 
 
 def has_default_image(account_object):
     if account_object is None:
         return None
-    elif (
-        account_object.profile_image_url
-        == "http://abs.twimg.com/sticky/default_profile_images/default_profile_normal.png"
+    elif account_object.profile_image_url == const.DEFAULT_PROFILE_IMAGE_URL or getattr(
+        account_object, "default_profile_image", False
     ):
         return True
     else:
@@ -231,137 +246,328 @@ def geo_is_enabled(account_object):
     return False
 
 
-def compute_row(df, user_id, api):
-    print("--", user_id, "--")
+def get_link_ratio(timeline_):
+    """:returns: fraction of tweets with at least one link"""
+    if timeline_ is None:
+        return None
+    return timeline_.link_ratio
+
+
+def get_unique_domains(timeline_):
+    """:returns: number of distinct domains linked to"""
+    if timeline_ is None:
+        return None
+    return timeline_.unique_domains
+
+
+def get_duplicate_ratio(timeline_):
+    """:returns: fraction of tweets repeating the text of another tweet, ignoring links and mentions"""
+    if timeline_ is None:
+        return None
+    return timeline_.duplicate_ratio
+
+
+def get_mention_rate(timeline_):
+    """:returns: mentions per tweet"""
+    if timeline_ is None:
+        return None
+    return timeline_.mention_rate
+
+
+def get_hashtag_rate(timeline_):
+    """:returns: hashtags per tweet"""
+    if timeline_ is None:
+        return None
+    return timeline_.hashtag_rate
+
+
+# (function, column, 0 for account-based, 1 for tweet-based features of the
+# activity histogram and 2 for text-based features of the timeline summary)
+FEATURE_FUNCTIONS = [
+    (is_protected, "is_protected", 0),
+    (get_time_of_existence, "time_of_existence", 0),
+    (get_average, "average_daily_tweets", 1),
+    (get_inactive_days, "inactive_days", 1),
+    (has_default_image, "has_default_image", 0),
+    (bio_is_empty, "bio_is_empty", 0),
+    (friends_followers_ratio, "friends_followers_ratio", 0),
+    (is_verified, "is_verified", 0),
+    (get_link_ratio, "link_ratio", 2),
+    (get_unique_domains, "unique_domains", 2),
+    (get_duplicate_ratio, "duplicate_ratio", 2),
+    (get_mention_rate, "mention_rate", 2),
+    (get_hashtag_rate, "hashtag_rate", 2),
+]  # TODO: ,(geo_is_enabled, "geo_is_enabled", 0)
+
+
+def compute_features(account_object, timeline_=None):
+    """:returns: dictionary with all features of the account; tweet-based features are None if timeline_
+    (a timeline.TimelineAccumulator) is None or the account is protected"""
+    features = {}
+    hist = None
+    if timeline_ is not None and not is_protected(account_object):
+        hist = timeline_.histogram(
+            origin=get_account_creation_datetime(account_object)
+        )
+    for function, column, kind in FEATURE_FUNCTIONS:
+        if kind == 0:
+            features[column] = function(account_object=account_object)
+        elif hist is None:
+            features[column] = None
+        elif kind == 1:
+            features[column] = function(
+                tweet_list=None, account_object=account_object, histogram=hist
+            )
+        else:
+            features[column] = function(timeline_=timeline_)
+    return features
+
+
+def compute_row_values(values, user_id, api, account=None, timeline_=None):
+    """Compute missing features of a row given as a dictionary of its feature values.
+
+    values maps the columns of FEATURE_FUNCTIONS to their current values and
+    is updated in place. account and timeline_ (a timeline.TimelineAccumulator)
+    may be passed if they were fetched beforehand, e.g. by a fetcher.Fetcher;
+    otherwise they are fetched on demand.
+
+    :returns: whether a feature got a new, non-null value
+    """
+    log.debug("-- %s --", user_id)
     changed = False
-    acc = None
-    twl = None
-    functions = [
-        (is_protected, "is_protected", 0),
-        (get_time_of_existence, "time_of_existence", 0),
-        (get_average, "average_daily_tweets", 1),
-        (get_inactive_days, "inactive_days", 1),
-        (has_default_image, "has_default_image", 0),
-        (bio_is_empty, "bio_is_empty", 0),
-        (friends_followers_ratio, "friends_followers_ratio", 0),
-        (is_verified, "is_verified", 0),
-    ]  # TODO: ,(geo_is_enabled, "geo_is_enabled", 0)
-    for f in functions:
-        if pd.isnull(df[f[1]][user_id]):
+    acc = account
+    tl = timeline_
+    hist = None
+    for function, column, kind in FEATURE_FUNCTIONS:
+        temp = values[column]
+        if not pd.isnull(temp):
+            continue
+        if acc is None:
+            acc = get_user(user_id=user_id, api=api)
             if acc is None:
-                acc = get_user(user_id=user_id, api=api)
-                if acc is None:
-                    break
-            temp = df[f[1]][user_id]
-            if f[2] == 0:
-                df.at[user_id, f[1]] = f[0](account_object=acc)
-            elif f[2] == 1 and not df["is_protected"][user_id]:
-                if twl is None:
-                    twl = get_all_tweets(user_id=user_id, api=api)
-                    if twl is None:
-                        continue
-                df.at[user_id, f[1]] = f[0](tweet_list=twl, account_object=acc)
-            print(user_id, "-", f[1] + ":", temp, "->", df[f[1]][user_id])
-            if temp != df[f[1]][user_id] and pd.notnull(df[f[1]][user_id]):
-                changed = True
+                break
+        if kind == 0:
+            values[column] = function(account_object=acc)
+        elif not values["is_protected"]:
+            if tl is None:
+                tl = get_timeline(user_id=user_id, api=api)
+                if tl is None:
+                    continue
+            if kind == 2:
+                values[column] = function(timeline_=tl)
+            else:
+                if hist is None:
+                    hist = tl.histogram(origin=get_account_creation_datetime(acc))
+                values[column] = function(
+                    tweet_list=None, account_object=acc, histogram=hist
+                )
+        value = values[column]
+        log.debug("%s - %s: %s -> %s", user_id, column, temp, value)
+        if temp != value and pd.notnull(value):
+            changed = True
+    return changed
+
+
+def compute_row(df, user_id, api, account=None, timeline_=None):
+    """Compute missing features of a row in df, see compute_row_values."""
+    before = {c: df.at[user_id, c] for c in const.FEATURE_COLUMNS}
+    values = dict(before)
+    changed = compute_row_values(
+        values, user_id, api, account=account, timeline_=timeline_
+    )
+    for column, value in values.items():
+        if value is not before[column]:
+            df.at[user_id, column] = value
     return df, changed
 
 
-def expand_rows(csv_file, api):
+class FeatureRows:
+    """Feature values of the rows of a DataFrame, read once and written back in blocks.
+
+    Accessing a DataFrame cell by cell costs an index lookup and dtype checks
+    per access. The feature columns are therefore copied into an object
+    array once; rows are read and updated as dictionaries and the updated
+    rows are assigned back to the DataFrame every flush_every rows and on
+    flush.
+
+    Args:
+        df (pandas.DataFrame): Table indexed by account id.
+        flush_every (int): Number of updated rows written back at once.
+    """
+
+    def __init__(self, df: pd.DataFrame, flush_every: int = 500):
+        self.df = df
+        self.columns = list(const.FEATURE_COLUMNS)
+        self.flush_every = flush_every
+        self._values = df[self.columns].to_numpy(dtype=object)
+        self._positions = {user_id: i for i, user_id in enumerate(df.index)}
+        self._pending = set()
+
+    def get(self, user_id) -> dict:
+        """:returns: feature values of the row of user_id"""
+        return dict(zip(self.columns, self._values[self._positions[user_id]]))
+
+    def put(self, user_id, values: dict) -> None:
+        """Update the row of user_id with values, a dictionary as returned by get."""
+        i = self._positions[user_id]
+        self._values[i] = [values[c] for c in self.columns]
+        self._pending.add(i)
+        if len(self._pending) >= self.flush_every:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write the updated rows to the DataFrame."""
+        if not self._pending:
+            return
+        rows = np.fromiter(sorted(self._pending), dtype=np.intp)
+        self._pending = set()
+        for j, column in enumerate(self.columns):
+            loc = self.df.columns.get_loc(column)
+            block = self._values[rows, j]
+            if self.df[column].dtype != object:
+                block = pd.Series(block).infer_objects().to_numpy()
+            try:
+                self.df.iloc[rows, loc] = block
+            except TypeError:
+                # e.g. booleans in a column read as float64 because it was empty
+                self.df[column] = self.df[column].astype(object)
+                self.df.iloc[rows, loc] = self._values[rows, j]
+
+
+def _is_missing(values, columns):
+    return any(pd.isnull(values[c]) for c in columns)
+
+
+def _compute_rows(rows, user_ids, api, fetcher_=None):
+    """Run compute_row_values for all user_ids, prefetching users concurrently if a fetcher is passed.
+
+    :returns: generator of (user_id, values, changed) in the order the rows are finished;
+        the values are not yet stored in rows (a FeatureRows)"""
+    if fetcher_ is None:
+        for user_id in user_ids:
+            user_id = int(user_id)
+            values = rows.get(user_id)
+            changed = compute_row_values(values, user_id, api)
+            yield user_id, values, changed
+        return
+    to_fetch = {}
+    for user_id in user_ids:
+        user_id = int(user_id)
+        values = rows.get(user_id)
+        if _is_missing(values, const.FEATURE_COLUMNS):
+            to_fetch[user_id] = values
+        else:
+            yield user_id, values, False
+
+    def needs_timeline(user_id):
+        values = to_fetch[user_id]
+        return (
+            _is_missing(values, const.TWEET_FEATURES)
+            and values["is_protected"] != True
+        )
+
+    for user_id, acc, tl in fetcher_.fetch_many(list(to_fetch), needs_timeline):
+        values = to_fetch.pop(user_id)
+        changed = compute_row_values(values, user_id, api, account=acc, timeline_=tl)
+        yield user_id, values, changed
+
+
+def _is_wrong_row(values):
+    """:returns: True if the row has a time_of_existence value but no average_daily_tweets value"""
+    return (
+        pd.notnull(values["time_of_existence"])
+        and pd.isnull(values["average_daily_tweets"])
+        and values["is_protected"] != True
+    )
+
+
+def expand_rows(csv_file, api, fetcher_=None, compact_every=500, ids=None):
+    """Compute missing features of all rows of csv_file and save them to it.
+
+    Every processed row is appended to a journal next to csv_file, which is
+    folded into csv_file every compact_every rows. An interrupted run
+    resumes where it stopped. Pass a fetcher.Fetcher to fetch users
+    concurrently, and ids to expand only the rows of these accounts, e.g.
+    the ones dataset.schedule_fetches assigns to csv_file.
+    """
     df = pd.read_csv(csv_file, index_col=0)
-    wrong_rows = []
     # add the columns to the dataframe
-    for column_name in [
-        "is_protected",
-        "time_of_existence",
-        "average_daily_tweets",
-        "inactive_days",
-        "has_default_image",
-        "bio_is_empty",
-        "friends_followers_ratio",
-        "is_verified",
-    ]:  # TODO: , "geo_is_enabled"
+    for column_name in const.FEATURE_COLUMNS:  # TODO: , "geo_is_enabled"
         if column_name not in df.columns:
             df[column_name] = None
-    # print and save the amount of rows with a time_of_existence value but no average_daily_tweets value
-    print(
-        1,
-        "-",
-        len(
-            df.loc[
-                df["time_of_existence"].notnull()
-                & df["average_daily_tweets"].isnull()
-                & (df["is_protected"] != True)
-            ].index
-        ),
-        "rows wrong",
-    )
-    wrong_rows.append(
-        len(
-            df.loc[
-                df["time_of_existence"].notnull()
-                & df["average_daily_tweets"].isnull()
-                & (df["is_protected"] != True)
-            ].index
-        )
-    )
-    # try to expand all rows in df
-    for user_id in list(df.index.values):
-        (df, changed) = compute_row(df, int(user_id), api)
-        if changed:
-            df.to_csv(csv_file)
-    # expand rows with a time_of_existence value but no average_daily_tweets value until there are no left
-    i = 2
-    while (
-        len(
-            df.loc[
-                df["time_of_existence"].notnull()
-                & df["average_daily_tweets"].isnull()
-                & (df["is_protected"] != True)
-            ].index
+    with journal.Journal(journal.get_journal_path(csv_file)) as journal_:
+        pass_, done = journal_.replay(df)
+        dirty = journal_.n_records > 0
+        rows = FeatureRows(df, flush_every=compact_every)
+        # rows with a time_of_existence value but no average_daily_tweets
+        # value, computed once and updated as rows are finished
+        scheduled = (
+            np.ones(len(df), dtype=bool) if ids is None else df.index.isin(ids)
         )
-        > 0
-    ):
-        print(
-            i,
-            "-",
-            len(
-                df.loc[
-                    df["time_of_existence"].notnull()
-                    & df["average_daily_tweets"].isnull()
-                    & (df["is_protected"] != True)
-                ].index
-            ),
-            "rows wrong",
+        mask = (
+            df["time_of_existence"].notnull()
+            & df["average_daily_tweets"].isnull()
+            & (df["is_protected"] != True)
+            & scheduled
         )
-        wrong_rows.append(
-            len(
-                df.loc[
-                    df["time_of_existence"].notnull()
-                    & df["average_daily_tweets"].isnull()
-                    & (df["is_protected"] != True)
-                ].index
-            )
+        wrong = set(df.index[mask])
+        wrong_rows = []
+        # the first pass tries to expand all rows, further passes expand
+        # the wrong rows until there are none left; an account listed twice
+        # is expanded once
+        user_ids = (
+            list(dict.fromkeys(df.index.values[scheduled]))
+            if pass_ == 1
+            else sorted(wrong)
         )
-        for user_id in list(
-            df.loc[
-                df["time_of_existence"].notnull()
-                & df["average_daily_tweets"].isnull()
-                & (df["is_protected"] != True)
-            ].index.values
-        ):
-            (df, changed) = compute_row(df, int(user_id), api)
-            if changed:
-                df.to_csv(csv_file)
-        i += 1
-    print(wrong_rows)
+        while user_ids:
+            log.info("%d - %d rows wrong", pass_, len(wrong))
+            wrong_rows.append(len(wrong))
+            user_ids = [x for x in user_ids if x not in done]
+            for user_id, values, changed in _compute_rows(
+                rows, user_ids, api, fetcher_
+            ):
+                journal_.append(user_id, pass_, values)
+                done.add(user_id)
+                if changed:
+                    rows.put(user_id, values)
+                    dirty = True
+                if _is_wrong_row(values):
+                    wrong.add(user_id)
+                else:
+                    wrong.discard(user_id)
+                if journal_.n_records >= compact_every:
+                    if dirty:
+                        rows.flush()
+                        journal.write_csv_atomic(df, csv_file)
+                        dirty = False
+                    journal_.checkpoint(pass_, done)
+            pass_ += 1
+            done = set()
+            user_ids = sorted(wrong)
+        if dirty:
+            rows.flush()
+            journal.write_csv_atomic(df, csv_file)
+        journal_.remove()
+    log.info("wrong rows per pass: %s", wrong_rows)
+
+
+def expand_datasets(api, paths=None, fetcher_=None, compact_every=500):
+    """Run expand_rows on all dataset files, fetching accounts listed in several files once.
+
+    An account is expanded in the first file listing it, see
+    dataset.schedule_fetches; dataset.deduplicate fills the other rows of
+    the account from that one when the training table is built.
+    """
+    for path, ids in dataset.schedule_fetches(paths).items():
+        log.info("expanding %d accounts of '%s'", len(ids), path)
+        expand_rows(path, api, fetcher_=fetcher_, compact_every=compact_every, ids=ids)
 
 
 def filter_columns(df: pd.DataFrame, debug: bool = False) -> pd.DataFrame:
-    df = df.copy()
     header = list(df.columns)
     idx = header.index("is_protected")
-    new_header = ["id"] + header[idx:]
+    new_header = ["id"] + [c for c in header[:idx] if c == "test_set"] + header[idx:]
     if debug:
         print(f"header={header}")
         print(f"new_header={new_header}")
@@ -369,64 +575,279 @@ def filter_columns(df: pd.DataFrame, debug: bool = False) -> pd.DataFrame:
 
 
 def filter_removed_accounts(df: pd.DataFrame):
-    df = df.copy()
-    return df[~pd.isnull(df["time_of_existence"])]
+    return df[df["time_of_existence"].notnull()]
+
+
+def _feature_matrix(
+    model: modelstore.Model, fts: Union[pd.DataFrame, np.ndarray]
+) -> np.ndarray:
+    """:returns: fts as float matrix with the columns in the order the model was trained with"""
+    if isinstance(fts, pd.DataFrame):
+        fts = fts[model.columns].to_numpy(dtype=np.float64)
+    fts = np.asarray(fts, dtype=np.float64)
+    if fts.ndim == 1:
+        fts = fts.reshape(1, -1)
+    return model.scaler.transform(fts)
+
+
+def predict_proba(
+    model: modelstore.Model, fts: Union[pd.DataFrame, np.ndarray]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Predict classes and class probabilities for many accounts at once.
+
+    Args:
+        model (modelstore.Model): Fitted classifier and scaler.
+        fts (Union[pandas.DataFrame, numpy.ndarray]): Feature values, one row
+            per account. Matrices must have the columns in the order of
+            model.columns.
+
+    Returns:
+        Tuple[numpy.ndarray, numpy.ndarray]: Class of every account (see
+            predict) and the N x n_classes matrix of class probabilities.
+    """
+    proba = model.classifier.predict_proba(_feature_matrix(model, fts))
+    return model.classifier.classes_[proba.argmax(axis=1)], proba
 
 
-def predict(classifier, fts: pd.DataFrame) -> int:
+def predict(
+    model: modelstore.Model, fts: Union[pd.DataFrame, np.ndarray]
+) -> np.ndarray:
     """Predict class for feature values.
 
     Args:
-        classifier ([type]): Classifier object.
-        fts ([type]): Feature values.
+        model (modelstore.Model): Fitted classifier and scaler.
+        fts (Union[pandas.DataFrame, numpy.ndarray]): Feature values, one row
+            per account.
 
     Returns:
-        [type]: Possible values:
+        numpy.ndarray: Class of every account. Possible values:
 
             * 0: Human.
             * 1: Traditional Bot.
             * 2: Social Bot.
     """
-    fts = StandardScaler().fit_transform(fts)
-    return classifier.predict(fts)
+    return predict_proba(model, fts)[0]
 
 
-def setup_classifier(
-    debug: bool = False,
-) -> sklearn.ensemble.RandomForestClassifier:
-    """Setup classifier.
+def predict_fast_path(
+    model: modelstore.Model, fts: Union[pd.DataFrame, np.ndarray]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Predict classes from the account features only.
+
+    Args:
+        model (modelstore.Model): Model with a fast path.
+        fts (Union[pandas.DataFrame, numpy.ndarray]): Feature values, one row
+            per account. Matrices must have the columns in the order of
+            model.fast_path.columns.
 
     Returns:
-        [type]: [description]
+        Tuple[numpy.ndarray, numpy.ndarray]: Class of every account and
+            whether the decision is confident enough to skip the timeline.
     """
-    global here
-    df = pd.read_csv(here / "complete_data.csv")
-    df = filter_removed_accounts(filter_columns(df)).dropna()
-
-    X_header = list(df.columns)[1:-1]
-    X, y = df[X_header], df["result"]
-    X = StandardScaler().fit_transform(X)
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.25, random_state=42
+    labels, proba = predict_proba(model.fast_path, fts)
+    return labels, proba.max(axis=1) >= model.threshold
+
+
+def _fast_path_class(
+    model: modelstore.Model, features: dict
+) -> Union[None, int]:
+    """:returns: class of the account with the given features if the fast path is confident, else None"""
+    if model.fast_path is None:
+        return None
+    row = [features[c] for c in model.fast_path.columns]
+    if any(pd.isnull(v) for v in row):
+        return None
+    labels, confident = predict_fast_path(model, np.asarray([row], dtype=np.float64))
+    return int(labels[0]) if confident[0] else None
+
+
+def lacks_timeline(model: modelstore.Model, features: dict) -> bool:
+    """:returns: whether tweet-based features model needs are missing, i.e. the timeline was skipped or could not be fetched"""
+    return any(
+        pd.isnull(features[c]) for c in model.columns if c in const.TWEET_FEATURES
     )
 
-    # Logistic Regression Algorithm tries to find best linear
-    # separating hyperplane.
-    #
-    # cls_ = LogisticRegression()
 
-    # Classifiers with complete memory of training
-    # data set.
-    #
-    # cls_ = KNeighborsClassifier(n_neighbors=1)
-    cls_ = RandomForestClassifier()
+def early_class(
+    model: modelstore.Model,
+    features: dict,
+    fast_path_class: Union[None, int] = None,
+) -> Union[None, int]:
+    """Decide the class of an account without the classifier if there is no need for it.
+
+    This is the policy of classify_account, classify_accounts and the
+    classification service alike: protected and verified accounts are
+    humans, and accounts lacking their timeline (see lacks_timeline) get the
+    class of the fast path or -1 ("Error"). Other missing values, e.g. the
+    friends_followers_ratio of accounts without followers, are left to the
+    classifier, which routes them like scikit-learn does.
+
+    Args:
+        model (modelstore.Model): Model the account is classified with.
+        features (dict): Feature values of the account.
+        fast_path_class (Union[None, int]): Class the fast path is confident
+            about, if any.
+
+    Returns:
+        Union[None, int]: Class or None if the classifier has to predict it.
+    """
+    if features["is_protected"] or features["is_verified"]:
+        return 0
+    if lacks_timeline(model, features):
+        return -1 if fast_path_class is None else fast_path_class
+    return None
+
+
+def timeline_needed(model: modelstore.Model, account_features: dict) -> bool:
+    """Decide whether an account has to be classified from its timeline.
+
+    Shared by classify_account, classify_accounts and the classification
+    service: the timeline is neither needed for protected and verified
+    accounts nor if model uses no tweet-based features. Otherwise the fast
+    path is asked first and the timeline is only fetched if it is not
+    confident.
+
+    Args:
+        model (modelstore.Model): Model the account is classified with.
+        account_features (dict): Features computed without the timeline.
+    """
+    return early_class(model, account_features) == -1
+
+
+def _calibrate_threshold(
+    confidence: np.ndarray, correct: np.ndarray, target: float
+) -> float:
+    """Find the lowest confidence at which decisions are at least as accurate as target.
+
+    Args:
+        confidence (numpy.ndarray): Top class probability of every decision.
+        correct (numpy.ndarray): Whether every decision is correct.
+        target (float): Required accuracy of the accepted decisions.
+
+    Returns:
+        float: Threshold, infinity if no threshold reaches target.
+    """
+    order = np.argsort(-confidence, kind="stable")
+    confidence = confidence[order]
+    accuracy = np.cumsum(correct[order]) / np.arange(1, confidence.size + 1)
+    # Decisions with equal confidence are accepted or rejected together.
+    last = np.append(confidence[1:] != confidence[:-1], True)
+    candidates = np.flatnonzero(last & (accuracy >= target))
+    if candidates.size == 0:
+        return float("inf")
+    return float(confidence[candidates[-1]])
+
+
+def get_training_data_path() -> pathlib.Path:
+    """:returns: feature store, if one was written, else complete_data.csv"""
+    global here
+    if featurestore.exists():
+        return featurestore.get_store_dir()
+    return here / "complete_data.csv"
+
+
+def hash_training_data(path: Union[str, pathlib.Path]) -> str:
+    """:returns: hash of the training data in path, a feature store or a CSV file"""
+    if featurestore.exists(path):
+        return featurestore.fingerprint(path)
+    return modelstore.hash_file(path)
+
+
+def read_training_table(
+    path: Union[None, str, pathlib.Path] = None,
+) -> pd.DataFrame:
+    """Read the usable rows of the training table.
+
+    Args:
+        path (Union[None, str, pathlib.Path]): Training data, a feature store
+            or a CSV file. Defaults to get_training_data_path().
+
+    Returns:
+        pandas.DataFrame: "id", "test_set" if the training data has it, the
+            feature columns and "result".
+    """
+    if path is None:
+        path = get_training_data_path()
+    if featurestore.exists(path):
+        df = featurestore.read_training_table(path)
+    else:
+        df = filter_columns(pd.read_csv(path))
+    df = filter_removed_accounts(df)
+    # Feature columns nobody computed yet, e.g. added after the training data
+    # was enriched, are left out instead of dropping every row.
+    return df.dropna(axis=1, how="all").dropna()
+
+
+def feature_header(df: pd.DataFrame) -> List[str]:
+    """:returns: feature columns of a table returned by read_training_table"""
+    return [c for c in list(df.columns)[1:-1] if c != "test_set"]
+
+
+def read_training_data(
+    path: Union[None, str, pathlib.Path] = None,
+) -> Tuple[List[str], np.ndarray, pd.Series]:
+    """Read the training table.
+
+    Args:
+        path (Union[None, str, pathlib.Path]): Training data, a feature store
+            or a CSV file. Defaults to get_training_data_path().
+
+    Returns:
+        Tuple[List[str], numpy.ndarray, pandas.Series]: Feature columns,
+            feature matrix and classes of the usable rows.
+    """
+    df = read_training_table(path)
+    X_header = feature_header(df)
+    return X_header, df[X_header].to_numpy(dtype=np.float64), df["result"]
+
+
+def setup_classifier(
+    debug: bool = False,
+    path: Union[None, str, pathlib.Path] = None,
+    estimator=None,
+) -> modelstore.Model:
+    """Setup classifier.
+
+    Args:
+        debug (bool): Print classification reports for the test and the
+            training split.
+        path (Union[None, str, pathlib.Path]): Training data. Defaults to
+            get_training_data_path().
+        estimator: Unfitted scikit-learn classifier, e.g. the winner of
+            selection.search. Defaults to a RandomForestClassifier.
+
+    Returns:
+        modelstore.Model: Fitted classifier, fitted scaler and feature columns.
+    """
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.metrics import confusion_matrix, classification_report
+    from sklearn.preprocessing import StandardScaler
+
+    if path is None:
+        path = get_training_data_path()
+    df = read_training_table(path)
+    X_header = feature_header(df)
+    X, y = df[X_header].to_numpy(dtype=np.float64), df["result"]
+    # Accounts of the test sets of the dataset files are held out, and no
+    # account is both trained and tested on.
+    train, test = dataset.split_train_test(df, test_size=0.25, random_state=42)
+    X_raw_train, X_raw_test = X[train], X[test]
+    y_train, y_test = y.iloc[train], y.iloc[test]
+    # Test accounts do not leak into the scaling statistics either.
+    scaler = StandardScaler()
+    scaler.fit(X_raw_train)
+    X_train, X_test = scaler.transform(X_raw_train), scaler.transform(X_raw_test)
+
+    # Other model families and their hyperparameters are compared by
+    # selection.search.
+    cls_ = RandomForestClassifier() if estimator is None else estimator
     classifier = cls_.fit(X_train, y_train)
 
     if debug:
         y_pred = classifier.predict(X_test)
         report = classification_report(y_test, y_pred)
         conf_matrix = confusion_matrix(y_test, y_pred)
-        print(df.shape)
+        print(X.shape)
         print(X_train.shape)
         print(y_train.shape)
         print(X_test.shape)
@@ -440,40 +861,144 @@ def setup_classifier(
         print(report)
         print(conf_matrix)
 
-    return classifier
+    data_hash = hash_training_data(path)
+    model = modelstore.Model(
+        classifier=classifier,
+        scaler=scaler,
+        columns=X_header,
+        data_hash=data_hash,
+    )
+
+    # The fast path decides from the account features of one get_user call.
+    # Its threshold is chosen so that the decisions it accepts on the test
+    # split are at least as accurate as the full classifier.
+    fast_idx = [i for i, c in enumerate(X_header) if c in const.ACCOUNT_FEATURES]
+    if fast_idx:
+        fast_scaler = StandardScaler().fit(X_raw_train[:, fast_idx])
+        fast_classifier = RandomForestClassifier().fit(
+            fast_scaler.transform(X_raw_train[:, fast_idx]), y_train
+        )
+        model.fast_path = modelstore.Model(
+            classifier=fast_classifier,
+            scaler=fast_scaler,
+            columns=[X_header[i] for i in fast_idx],
+            data_hash=data_hash,
+        )
+        labels, proba = predict_proba(model.fast_path, X_raw_test[:, fast_idx])
+        target = np.mean(classifier.predict(X_test) == y_test)
+        model.threshold = _calibrate_threshold(
+            proba.max(axis=1), labels == y_test.to_numpy(), target
+        )
+        if debug:
+            early = np.mean(proba.max(axis=1) >= model.threshold)
+            print(f"fast path threshold={model.threshold} early exits={early:.1%}")
+    return model
+
+
+def load_classifier(
+    debug: bool = False,
+) -> Union[modelstore.Model, inference.InferenceModel]:
+    """Load the stored classifier, retraining only if the training data changed.
+
+    The arrays exported for inference.py are preferred over the model
+    artifact, loading them does not import scikit-learn.
+
+    Args:
+        debug (bool): Print classification reports if retraining is
+            necessary.
+
+    Returns:
+        Union[modelstore.Model, inference.InferenceModel]: Fitted classifier,
+            fitted scaler and feature columns.
+    """
+    data_hash = hash_training_data(get_training_data_path())
+    with instrumentation.span("model.load"):
+        model = modelstore.load_inference()
+        if model is None or model.data_hash != data_hash:
+            model = modelstore.load()
+    if model is None or model.data_hash != data_hash:
+        instrumentation.incr("model_retrains")
+        with instrumentation.span("model.fit"):
+            model = setup_classifier(debug=debug)
+        modelstore.save(model)
+    return model
+
+
+def get_cache() -> cache.Cache:
+    """:returns: cache of API payloads and features shared by all classifications, opened on first use"""
+    global api_cache
+    if api_cache is None:
+        api_cache = cache.Cache()
+    return api_cache
+
+
+def _timeline_watermark(cache_: cache.Cache, user_id: int) -> Union[None, list]:
+    """:returns: newest tweet id and fetch time of the cached timeline of user_id, None if there is none"""
+    entry = cache_.get_entry("timeline", user_id)
+    return None if entry is None else [entry[0].get("newest_id"), entry[1]]
+
+
+def _cached_features(
+    cache_: cache.Cache, user_id: int, watermark: Union[None, list]
+) -> Union[None, dict]:
+    """:returns: cached features of user_id if they were computed from the timeline with watermark"""
+    cached = cache_.get("features", user_id)
+    if (
+        watermark is None
+        or not isinstance(cached, dict)
+        or cached.get("watermark") != watermark
+        # Cached before feature columns were added.
+        or any(c not in cached["values"] for c in const.FEATURE_COLUMNS)
+    ):
+        return None
+    return cached["values"]
 
 
 def _get_features_and_user_id(
-    username: str, api: tweepy.API
-) -> pd.DataFrame:
-    feature_dir = definitions.get_out_dir() / "features"
-    if not pathutil.is_dir(feature_dir):
-        osutil.mkdir(feature_dir)
-    path_features = feature_dir / f"{username}_account_features.csv"
-    if not pathutil.is_file(path_features):
-        acc = api.get_user(screen_name=username)
-        user_id = acc.id
-        columns = [
-            "is_protected",
-            "time_of_existence",
-            "average_daily_tweets",
-            "inactive_days",
-            "has_default_image",
-            "bio_is_empty",
-            "friends_followers_ratio",
-            "is_verified",
-        ]
-        d = {"id": user_id}
-        for c in columns:
-            d[c] = [None]
-        fts, changed = compute_row(
-            pd.DataFrame(data=d, index=[user_id]), user_id, api
-        )
-        fts = fts[columns]
-        fts.to_csv(path_features, index=False)
+    username: str,
+    api: tweepy.API,
+    cache_: Union[None, cache.Cache] = None,
+    account_only: bool = False,
+) -> Tuple[pd.DataFrame, int]:
+    """Compute the features of an account.
+
+    Cached features are keyed to the watermark of the timeline they were
+    computed from, so they are recomputed whenever fetcher.summarize_timeline
+    refreshes the timeline.
+
+    :returns: features and id of the account; unless the cached timeline is
+        fresh, tweet-based features are None if account_only"""
+    if cache_ is None:
+        cache_ = get_cache()
+    acc = fetcher.fetch_user_by_screen_name(api, username, cache_=cache_)
+    user_id = acc.id
+    columns = const.FEATURE_COLUMNS
+    if account_only:
+        watermark = _timeline_watermark(cache_, user_id)
+        if (
+            watermark is not None
+            and cache_.clock() - watermark[1] >= fetcher.REFRESH_AFTER
+        ):
+            # The timeline is due for a refresh, so are the features.
+            watermark = None
+        values = _cached_features(cache_, user_id, watermark)
+        if values is None:
+            values = compute_features(acc)
     else:
-        fts = pd.read_csv(path_features)
-        user_id = 0
+        tl = None
+        if not acc.protected:
+            tl = fetcher.summarize_timeline(api, user_id, cache_=cache_)
+        watermark = None if tl is None else _timeline_watermark(cache_, user_id)
+        values = _cached_features(cache_, user_id, watermark)
+        if values is None:
+            values = dict.fromkeys(columns)
+            with instrumentation.span("features.compute_row"):
+                compute_row_values(values, user_id, api, account=acc, timeline_=tl)
+            if watermark is not None:
+                cache_.put(
+                    "features", user_id, {"values": values, "watermark": watermark}
+                )
+    fts = pd.DataFrame({c: [values[c]] for c in columns}, index=[user_id])
     return fts, user_id
 
 
@@ -488,41 +1013,262 @@ def classify_account(username: str, api: tweepy.API) -> str:
     Returns:
         str: "Human", "Traditional Bot" or "Social Bot".
     """
-    global here
-    global classifier
-    map_ = {0: "Human", 1: "Traditional Bot", 2: "Social Bot", -1: "Error"}
-    if classifier is None:
-        classifier = setup_classifier(debug=True)
+    global model
+    map_ = CLASS_NAMES
+    if model is None:
+        model = load_classifier()
     try:
-        fts, user_id = _get_features_and_user_id(username, api)
+        fts, user_id = _get_features_and_user_id(username, api, account_only=True)
     except tweepy.errors.TweepyException:
         # Raised if user could not be found by Twitter API connector.
         return map_[-1]
-    if fts["is_protected"][user_id] or fts["is_verified"][user_id]:
-        return map_[0]
-    class_ = predict(classifier, fts)[0]
+    if timeline_needed(model, fts.loc[user_id]):
+        with instrumentation.span("classify.fast_path"):
+            class_ = _fast_path_class(model, fts.loc[user_id])
+        if class_ is not None:
+            instrumentation.incr("fast_path", outcome="early_exit")
+            return map_[class_]
+        instrumentation.incr("fast_path", outcome="timeline")
+        # The account is cached, only the timeline is fetched.
+        fts, user_id = _get_features_and_user_id(username, api)
+    class_ = early_class(model, fts.loc[user_id])
+    if class_ is None:
+        with instrumentation.span("classify.predict"):
+            class_ = predict(model, fts)[0]
     return map_[class_]
 
 
+def _init_worker(instrumented: bool = False) -> None:
+    """Load the stored classifier once per worker process, recording spans and counters if instrumented."""
+    global model
+    # Forked workers start with a copy of the parent's spans and counters,
+    # which must not be sent back to it.
+    instrumentation.registry.reset()
+    if instrumented:
+        instrumentation.enable()
+    model = modelstore.load_inference()
+    if model is None:
+        model = modelstore.load()
+
+
+def _classify_chunk(rows):
+    """Compute features and classes of fetched accounts in a worker process.
+
+    :returns: list of result dictionaries, one per row of (username, records.AccountRecord, timeline state),
+        and the spans and counters the worker recorded for them"""
+    results = []
+    matrix = []
+    to_predict = []
+    for username, acc, state in rows:
+        tl = None if state is None else timeline.TimelineAccumulator.from_dict(state)
+        with instrumentation.span("classify.features"):
+            fts = compute_features(acc, tl)
+        result = {"username": username, "id": acc.id}
+        results.append(result)
+        # The timeline was skipped because the fast path is confident, or it
+        # could not be fetched.
+        fast_path_class = (
+            _fast_path_class(model, fts) if lacks_timeline(model, fts) else None
+        )
+        class_ = early_class(model, fts, fast_path_class)
+        if class_ is None:
+            matrix.append([fts[c] for c in model.columns])
+            to_predict.append(result)
+        else:
+            result["class"] = CLASS_NAMES[class_]
+    if matrix:
+        with instrumentation.span("classify.predict"):
+            classes = predict(model, np.asarray(matrix, dtype=np.float64))
+        for result, class_ in zip(to_predict, classes):
+            result["class"] = CLASS_NAMES[int(class_)]
+    return results, instrumentation.drain()
+
+
+def classify_accounts(
+    usernames: Iterable[str],
+    api: tweepy.API,
+    max_workers: int = 16,
+    processes: Union[None, int] = None,
+    chunk_size: int = 16,
+    cache_: Union[None, cache.Cache] = None,
+) -> Iterator[dict]:
+    """Classify many Twitter accounts.
+
+    Accounts are fetched concurrently on a thread pool. Timelines are only
+    fetched for accounts the fast path of the model is not confident about.
+    Features and classes are computed in chunks on a process pool with one
+    process per core by default.
+
+    Args:
+        usernames (Iterable[str]): Usernames of accounts.
+        api (tweepy.api.API): Twitter API connector.
+        max_workers (int): Number of accounts fetched at once.
+        processes (Union[None, int]): Number of worker processes. Defaults to
+            the number of cores.
+        chunk_size (int): Number of accounts classified per batch.
+        cache_ (Union[None, cache.Cache]): Cache of API payloads. Defaults to
+            get_cache().
+
+    Yields:
+        dict: "username", "id" and "class" of every account in the order
+            they are finished. "class" is one of the values of CLASS_NAMES.
+    """
+    # Make sure an up to date model artifact exists before the workers load it.
+    model_ = load_classifier()
+    if cache_ is None:
+        cache_ = get_cache()
+    fetcher_ = fetcher.Fetcher(api, max_workers=max_workers, cache_=cache_)
+    outcomes = {"early_exit": 0, "timeline": 0}
+    lock = threading.Lock()
+
+    def needs_timeline(acc: records.AccountRecord) -> bool:
+        fts = compute_features(acc)
+        if not timeline_needed(model_, fts):
+            return False
+        with instrumentation.span("classify.fast_path"):
+            class_ = _fast_path_class(model_, fts)
+        outcome = "timeline" if class_ is None else "early_exit"
+        instrumentation.incr("fast_path", outcome=outcome)
+        with lock:
+            outcomes[outcome] += 1
+        return class_ is None
+
+    def chunk_results(future: concurrent.futures.Future) -> List[dict]:
+        results, recorded = future.result()
+        instrumentation.merge(recorded)
+        return results
+
+    with concurrent.futures.ProcessPoolExecutor(
+        processes,
+        initializer=_init_worker,
+        initargs=(instrumentation.is_enabled(),),
+    ) as pool:
+        pending = set()
+        chunk = []
+        for username, acc, tl in fetcher_.fetch_many_by_screen_name(
+            usernames, needs_timeline
+        ):
+            if acc is None:
+                # User could not be found by Twitter API connector.
+                yield {"username": username, "id": None, "class": CLASS_NAMES[-1]}
+            else:
+                chunk.append(
+                    (username, acc, None if tl is None else tl.to_dict())
+                )
+            if len(chunk) >= chunk_size:
+                pending.add(pool.submit(_classify_chunk, chunk))
+                chunk = []
+            done = {f for f in pending if f.done()}
+            pending -= done
+            for future in done:
+                yield from chunk_results(future)
+        if chunk:
+            pending.add(pool.submit(_classify_chunk, chunk))
+        for future in concurrent.futures.as_completed(pending):
+            yield from chunk_results(future)
+    n = outcomes["early_exit"] + outcomes["timeline"]
+    if n:
+        log.info(
+            "fast path: %d of %d accounts (%.1f%%) classified without timeline",
+            outcomes["early_exit"],
+            n,
+            100 * outcomes["early_exit"] / n,
+        )
+
+
+def _read_usernames(path: str) -> Iterator[str]:
+    """:returns: generator of the usernames in path, one per line; "-" reads from stdin"""
+    lines = sys.stdin if path == "-" else fileutil.iterlines(path)
+    for line in lines:
+        username = line.strip()
+        if username:
+            yield username
+
+
 def _create_out_dir() -> None:
     out_dir = definitions.get_prj_root() / "out"
     if not pathutil.is_dir(out_dir):
         osutil.mkdir(out_dir)
 
 
-def main() -> int:
+def _run(args: argparse.Namespace) -> int:
     _create_out_dir()
     api = api_setup(
         const.CONSUMER_KEY,
         const.CONSUMER_SECRET,
         const.ACCESS_TOKEN,
         const.ACCESS_TOKEN_SECRET,
+        wait_on_rate_limit=args.input is None,
     )
+    if args.input is not None:
+        for result in classify_accounts(
+            _read_usernames(args.input),
+            api,
+            max_workers=args.workers,
+            processes=args.processes,
+        ):
+            instrumentation.incr("accounts_classified", class_=result["class"])
+            print(json.dumps(result), flush=True)
+        return 0
     for user in const.TEST_SET:
         class_ = classify_account(user, api)
+        instrumentation.incr("accounts_classified", class_=class_)
         print(f"Class of user '{user}': {class_}.")
     return 0
 
 
+def main(argv: Union[None, List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Classify Twitter accounts.")
+    parser.add_argument(
+        "--input",
+        help="File with one username per line, '-' for stdin. Results are "
+        "written to stdout as JSON lines while they complete.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=16,
+        help="Number of accounts fetched at once.",
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=None,
+        help="Number of worker processes, defaults to the number of cores.",
+    )
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        action="count",
+        default=0,
+        help="Log progress to stderr, -vv also logs every computed feature.",
+    )
+    parser.add_argument(
+        "--metrics",
+        help="Record timing spans and counters and write them to this file, "
+        "in the Prometheus text format if it ends with .prom, else as JSON.",
+    )
+    parser.add_argument(
+        "--profile",
+        help="Run under cProfile and write the statistics to this file.",
+    )
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=[logging.WARNING, logging.INFO, logging.DEBUG][min(args.verbose, 2)],
+        format="%(asctime)s %(name)s %(levelname)s %(message)s",
+    )
+    if args.metrics:
+        instrumentation.enable()
+    try:
+        if args.profile:
+            with instrumentation.profile(args.profile):
+                return _run(args)
+        return _run(args)
+    finally:
+        if args.metrics:
+            instrumentation.write(args.metrics)
+
+
 if __name__ == "__main__":
     sys.exit(main())
@@ -0,0 +1,205 @@
+"""
+Persistent storage of the trained classifier.
+
+A model artifact bundles the fitted classifier, the fitted scaler and the
+order of the feature columns, together with a hash of the training data it
+was fitted on. Artifacts are written with joblib. Loading one unpickles the
+estimators, which copies their arrays (e.g. the node arrays of the trees of a
+random forest) into memory.
+
+Next to the artifact, save exports the model as plain arrays for
+inference.py, which predicts without importing scikit-learn. joblib itself
+is only imported when the artifact is written or read. The exported arrays
+are only written if they predict the same class probabilities as the model,
+unless the forest is deliberately pruned on export.
+
+A model may carry a fast path: a second model fitted on the account
+features only, whose decisions are accepted without fetching the timeline
+if its top class probability reaches the stored threshold.
+"""
+
+import hashlib
+import logging
+import pathlib
+from typing import Any, Dict, List, Optional, Union
+
+from bothunting import definitions
+from bothunting.core import inference
+from bothunting.utils import fileutil
+from bothunting.utils import osutil
+from bothunting.utils import pathutil
+
+
+log = logging.getLogger(__name__)
+
+# Increase whenever the layout of the stored artifact changes.
+FORMAT_VERSION = 2
+
+
+class Model:
+    """Fitted classifier together with everything needed for inference.
+
+    Attributes:
+        classifier: Fitted classifier.
+        scaler: Scaler fitted on the training features.
+        columns (List[str]): Feature columns in the order the classifier
+            expects them.
+        data_hash (str): Hash of the training data.
+        fast_path (Optional[Model]): Model fitted on the account features
+            only or None.
+        threshold (Optional[float]): Minimum probability of the top class of
+            fast_path to accept its decision.
+    """
+
+    __slots__ = (
+        "classifier",
+        "scaler",
+        "columns",
+        "data_hash",
+        "fast_path",
+        "threshold",
+    )
+
+    def __init__(
+        self,
+        classifier: Any,
+        scaler: Any,
+        columns: List[str],
+        data_hash: str,
+        fast_path: Optional["Model"] = None,
+        threshold: Optional[float] = None,
+    ):
+        self.classifier = classifier
+        self.scaler = scaler
+        self.columns = list(columns)
+        self.data_hash = data_hash
+        self.fast_path = fast_path
+        self.threshold = threshold
+
+
+def _to_artifact(model: Model) -> Dict[str, Any]:
+    return {
+        "classifier": model.classifier,
+        "scaler": model.scaler,
+        "columns": model.columns,
+        "data_hash": model.data_hash,
+        "fast_path": (
+            None if model.fast_path is None else _to_artifact(model.fast_path)
+        ),
+        "threshold": model.threshold,
+    }
+
+
+def _from_artifact(artifact: Dict[str, Any]) -> Model:
+    fast_path = artifact["fast_path"]
+    return Model(
+        classifier=artifact["classifier"],
+        scaler=artifact["scaler"],
+        columns=artifact["columns"],
+        data_hash=artifact["data_hash"],
+        fast_path=None if fast_path is None else _from_artifact(fast_path),
+        threshold=artifact["threshold"],
+    )
+
+
+def hash_file(path: Union[str, pathlib.Path]) -> str:
+    """Compute SHA-256 hex digest of file content, memory-mapped instead of read in chunks."""
+    with fileutil.open_mmap(path) as m:
+        return hashlib.sha256(m).hexdigest()
+
+
+def get_model_path() -> pathlib.Path:
+    return definitions.get_out_dir() / "models" / "classifier.joblib"
+
+
+def get_inference_path(
+    path: Optional[Union[str, pathlib.Path]] = None,
+) -> pathlib.Path:
+    """:returns: file of the arrays exported for inference.py next to the artifact in path, get_model_path() by default"""
+    if path is None:
+        path = get_model_path()
+    return pathutil.str_to_path(path).with_suffix(".npz")
+
+
+def save(
+    model: Model,
+    path: Optional[Union[str, pathlib.Path]] = None,
+    max_depth: Optional[int] = None,
+    max_trees: Optional[int] = None,
+) -> None:
+    """Save model artifact and, if the classifier can be exported, its arrays for inference.py.
+
+    Args:
+        model (Model): Model to save.
+        path (Optional[Union[str, pathlib.Path]]): Target file. Defaults to
+            get_model_path().
+        max_depth (Optional[int]): Prune the exported random forests to this
+            depth, see inference.export. The artifact is not pruned.
+        max_trees (Optional[int]): Export only this many trees of random
+            forests.
+    """
+    if path is None:
+        path = get_model_path()
+    path = pathutil.str_to_path(path)
+    if not pathutil.is_dir(path.parent):
+        osutil.mkdir(path.parent)
+    artifact = _to_artifact(model)
+    artifact["format_version"] = FORMAT_VERSION
+    import joblib
+
+    # Uncompressed whatever the suffix of path: the artifact is read whenever
+    # the model is loaded, and decompressing it would only add to that.
+    with fileutil.atomic_write(path, "wb", compression=None) as f:
+        joblib.dump(artifact, f)
+    arrays = inference.export(model, max_depth=max_depth, max_trees=max_trees)
+    if arrays is not None and max_depth is None and max_trees is None:
+        deviation = inference.deviation(model, arrays)
+        if deviation > inference.MAX_DEVIATION:
+            log.warning(
+                "exported model deviates from the model by %g, not exporting it",
+                deviation,
+            )
+            arrays = None
+    inference_path = get_inference_path(path)
+    if arrays is not None:
+        inference.save(arrays, inference_path)
+    elif pathutil.is_file(inference_path):
+        # Never leave arrays of an older model next to the new artifact.
+        inference_path.unlink()
+
+
+def load(
+    path: Optional[Union[str, pathlib.Path]] = None,
+) -> Optional[Model]:
+    """Load model artifact.
+
+    Args:
+        path (Optional[Union[str, pathlib.Path]]): Artifact file. Defaults to
+            get_model_path().
+
+    Returns:
+        Optional[Model]: Stored model or None if there is no artifact or it
+            was written in an outdated format.
+    """
+    if path is None:
+        path = get_model_path()
+    if not pathutil.is_file(path):
+        return None
+    import joblib
+
+    artifact = joblib.load(path)
+    if artifact.get("format_version") != FORMAT_VERSION:
+        return None
+    return _from_artifact(artifact)
+
+
+def load_inference(
+    path: Optional[Union[str, pathlib.Path]] = None,
+) -> Optional[inference.InferenceModel]:
+    """Load the arrays exported for the artifact in path, get_model_path() by default.
+
+    Returns:
+        Optional[inference.InferenceModel]: Exported model or None if the
+            classifier could not be exported or there is no artifact.
+    """
+    return inference.load(get_inference_path(path))
@@ -0,0 +1,258 @@
+"""
+Compact internal representation of accounts and tweets.
+
+The feature functions only read a handful of attributes of an account and
+only the creation time and text of tweets. Instead of full tweepy models,
+which carry the whole raw JSON payload, accounts are held in an
+AccountRecord with ``__slots__`` and tweets in a TweetBatch of NumPy arrays.
+"""
+
+from __future__ import annotations
+
+import datetime
+import email.utils
+from typing import Any, Dict, Iterable, Mapping, Optional
+
+import numpy as np
+
+from bothunting.core import textfeatures
+from bothunting.utils import importutil
+
+# Only the null checks of account attributes need pandas.
+pd = importutil.lazy_import("pandas")
+
+EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+SECONDS_PER_DAY = 24 * 3600
+
+
+def parse_created_at(value: Any) -> Optional[datetime.datetime]:
+    """Parse a creation date of the Twitter API or the datasets to an aware UTC datetime.
+
+    Accepts datetime objects, Twitter's "Tue Jun 11 11:20:35 +0000 2013"
+    format and epoch milliseconds with an optional trailing "L".
+    """
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is None:
+            return value.replace(tzinfo=datetime.timezone.utc)
+        return value
+    value = str(value)
+    millis = value.rstrip("L")
+    if millis.isdigit():
+        return datetime.datetime.fromtimestamp(
+            int(millis) / 1000, tz=datetime.timezone.utc
+        )
+    return email.utils.parsedate_to_datetime(value)
+
+
+def _flag(value: Any) -> bool:
+    if value is None or pd.isnull(value):
+        return False
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true")
+    return bool(value)
+
+
+def _text(value: Any) -> str:
+    if value is None or pd.isnull(value):
+        return ""
+    return str(value)
+
+
+def _count(value: Any) -> int:
+    if value is None or pd.isnull(value):
+        return 0
+    return int(value)
+
+
+class AccountRecord:
+    """Account attributes the feature functions read.
+
+    Attribute names match the ones of tweepy's User model, so feature
+    functions accept either.
+    """
+
+    __slots__ = (
+        "id",
+        "screen_name",
+        "created_at",
+        "protected",
+        "verified",
+        "geo_enabled",
+        "description",
+        "profile_image_url",
+        "default_profile_image",
+        "followers_count",
+        "friends_count",
+        "statuses_count",
+    )
+
+    def __init__(
+        self,
+        id: int,
+        screen_name: str = "",
+        created_at: Optional[datetime.datetime] = None,
+        protected: bool = False,
+        verified: bool = False,
+        geo_enabled: bool = False,
+        description: str = "",
+        profile_image_url: str = "",
+        default_profile_image: bool = False,
+        followers_count: int = 0,
+        friends_count: int = 0,
+        statuses_count: int = 0,
+    ):
+        self.id = id
+        self.screen_name = screen_name
+        self.created_at = created_at
+        self.protected = protected
+        self.verified = verified
+        self.geo_enabled = geo_enabled
+        self.description = description
+        self.profile_image_url = profile_image_url
+        self.default_profile_image = default_profile_image
+        self.followers_count = followers_count
+        self.friends_count = friends_count
+        self.statuses_count = statuses_count
+
+    def __repr__(self) -> str:
+        return f"AccountRecord(id={self.id}, screen_name={self.screen_name!r})"
+
+    @classmethod
+    def from_mapping(cls, d: Mapping[str, Any]) -> "AccountRecord":
+        """Create record from an API payload, a dataset row or the result of to_dict."""
+        return cls(
+            id=int(d["id"]),
+            screen_name=_text(d.get("screen_name")),
+            created_at=parse_created_at(d.get("created_at")),
+            protected=_flag(d.get("protected")),
+            verified=_flag(d.get("verified")),
+            geo_enabled=_flag(d.get("geo_enabled")),
+            description=_text(d.get("description")),
+            profile_image_url=_text(d.get("profile_image_url")),
+            default_profile_image=_flag(d.get("default_profile_image")),
+            followers_count=_count(d.get("followers_count")),
+            friends_count=_count(d.get("friends_count")),
+            statuses_count=_count(d.get("statuses_count")),
+        )
+
+    @classmethod
+    def from_json(cls, payload: Mapping[str, Any]) -> "AccountRecord":
+        """Create record from the raw JSON payload of the get_user endpoint."""
+        return cls.from_mapping(payload)
+
+    @classmethod
+    def from_csv_row(
+        cls, row: Mapping[str, Any], user_id: Optional[int] = None
+    ) -> "AccountRecord":
+        """Create record from a row of a dataset file.
+
+        Args:
+            row (Mapping[str, Any]): Row, e.g. a pandas.Series of a dataset
+                read with read_dataset.
+            user_id (Optional[int]): Account id if it is the index of the
+                dataset instead of a column.
+        """
+        if user_id is not None:
+            row = dict(row)
+            row["id"] = user_id
+        return cls.from_mapping(row)
+
+    @classmethod
+    def from_tweepy(cls, user: Any) -> "AccountRecord":
+        """Create record from a tweepy User model."""
+        return cls(
+            id=int(user.id),
+            screen_name=user.screen_name,
+            created_at=parse_created_at(user.created_at),
+            protected=bool(user.protected),
+            verified=bool(user.verified),
+            geo_enabled=bool(user.geo_enabled),
+            description=user.description or "",
+            profile_image_url=user.profile_image_url or "",
+            default_profile_image=bool(
+                getattr(user, "default_profile_image", False)
+            ),
+            followers_count=user.followers_count,
+            friends_count=user.friends_count,
+            statuses_count=getattr(user, "statuses_count", 0),
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        d = {name: getattr(self, name) for name in self.__slots__}
+        if self.created_at is not None:
+            d["created_at"] = self.created_at.strftime("%a %b %d %H:%M:%S %z %Y")
+        return d
+
+
+class TweetBatch:
+    """Columnar batch of tweets.
+
+    Attributes:
+        ids (numpy.ndarray): Tweet ids, int64.
+        timestamps (numpy.ndarray): Creation times in seconds since the epoch
+            (UTC), int64.
+        link_counts (numpy.ndarray): Number of links per tweet, int32.
+        mention_counts (numpy.ndarray): Number of mentions per tweet, int32.
+        hashtag_counts (numpy.ndarray): Number of hashtags per tweet, int32.
+        text_hashes (numpy.ndarray): Hash of the text without links per
+            tweet, uint32, see textfeatures.analyze.
+        domains (numpy.ndarray): Domains of all links of the batch.
+    """
+
+    __slots__ = (
+        "ids",
+        "timestamps",
+        "link_counts",
+        "mention_counts",
+        "hashtag_counts",
+        "text_hashes",
+        "domains",
+    )
+
+    def __init__(
+        self,
+        ids: np.ndarray,
+        timestamps: np.ndarray,
+        link_counts: np.ndarray,
+        mention_counts: Optional[np.ndarray] = None,
+        hashtag_counts: Optional[np.ndarray] = None,
+        text_hashes: Optional[np.ndarray] = None,
+        domains: Optional[np.ndarray] = None,
+    ):
+        n = ids.size
+        self.ids = ids
+        self.timestamps = timestamps
+        self.link_counts = link_counts
+        self.mention_counts = (
+            np.zeros(n, dtype=np.int32) if mention_counts is None else mention_counts
+        )
+        self.hashtag_counts = (
+            np.zeros(n, dtype=np.int32) if hashtag_counts is None else hashtag_counts
+        )
+        self.text_hashes = (
+            np.zeros(n, dtype=np.uint32) if text_hashes is None else text_hashes
+        )
+        self.domains = np.array([], dtype=object) if domains is None else domains
+
+    def __len__(self) -> int:
+        return int(self.ids.size)
+
+    @classmethod
+    def from_statuses(cls, statuses: Iterable[Any]) -> "TweetBatch":
+        """Create batch from tweepy Status models, e.g. a page of user_timeline."""
+        statuses = list(statuses)
+        n = len(statuses)
+        ids = np.empty(n, dtype=np.int64)
+        timestamps = np.empty(n, dtype=np.int64)
+        texts = []
+        for i, status in enumerate(statuses):
+            ids[i] = status.id
+            timestamps[i] = parse_created_at(status.created_at).timestamp()
+            texts.append(textfeatures.get_text(status))
+        return cls(ids, timestamps, **textfeatures.analyze(texts))
+
+    def day_ordinals(self) -> np.ndarray:
+        """Day ordinal (UTC) of every tweet."""
+        return self.timestamps // SECONDS_PER_DAY + EPOCH_ORDINAL
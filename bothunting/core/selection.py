@@ -0,0 +1,309 @@
+"""
+Model selection by cross-validated hyperparameter search.
+
+Every candidate, a model family together with one combination of its
+hyperparameters, is fitted and scored on every fold of a stratified k-fold
+split. All rows of an account fall into the same fold, and the accounts
+setup_classifier tests on (see dataset.split_train_test) are left out of the
+search, so the selected model is never tuned on them. The folds are scaled
+once up front and shared by all candidates, and the (candidate, fold) fits
+run in parallel on all cores with joblib.
+
+Run from the project root:
+
+    python -m bothunting.core.selection [--folds 5] [--jobs -1]
+                                        [--families random_forest ...]
+                                        [--max-latency-ms 5] [--no-save]
+
+The report, accuracy against fit time and single account inference latency
+of every candidate, is written as JSON to out/selection. The most accurate
+candidate within the latency budget is refitted like setup_classifier does
+and stored with modelstore.
+"""
+
+import argparse
+import datetime
+import json
+import pathlib
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import joblib
+import numpy as np
+from sklearn.base import clone
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import ParameterGrid, StratifiedGroupKFold
+from sklearn.neighbors import KNeighborsClassifier
+from sklearn.preprocessing import StandardScaler
+
+from bothunting import definitions
+from bothunting.core import dataset
+from bothunting.core import master
+from bothunting.core import modelstore
+from bothunting.utils import fileutil
+from bothunting.utils import osutil
+from bothunting.utils import pathutil
+
+
+# Estimator of every model family and the hyperparameter grid searched.
+# Estimators are single threaded, the search itself runs on all cores.
+FAMILIES = {
+    "random_forest": (
+        RandomForestClassifier(n_jobs=1, random_state=42),
+        {
+            "n_estimators": [50, 100, 200],
+            "max_depth": [None, 10, 20],
+            "min_samples_leaf": [1, 5],
+        },
+    ),
+    "logistic_regression": (
+        LogisticRegression(max_iter=1000),
+        {"C": [0.01, 0.1, 1.0, 10.0]},
+    ),
+    "k_neighbors": (
+        KNeighborsClassifier(n_jobs=1),
+        {"n_neighbors": [1, 5, 15, 31], "weights": ["uniform", "distance"]},
+    ),
+}
+
+Fold = Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+
+
+def iter_candidates(
+    families: Optional[List[str]] = None,
+) -> List[Tuple[str, Dict[str, Any]]]:
+    """:returns: (family, hyperparameters) of every candidate of the given families, all by default"""
+    if families is None:
+        families = list(FAMILIES)
+    return [
+        (family, params)
+        for family in families
+        for params in ParameterGrid(FAMILIES[family][1])
+    ]
+
+
+def make_estimator(family: str, params: Dict[str, Any]) -> Any:
+    """:returns: unfitted estimator of family with the given hyperparameters"""
+    return clone(FAMILIES[family][0]).set_params(**params)
+
+
+def scale_folds(
+    X: np.ndarray,
+    y: np.ndarray,
+    groups: Optional[np.ndarray] = None,
+    k: int = 5,
+    seed: int = 42,
+) -> List[Fold]:
+    """Split X and y into k stratified folds and scale each of them.
+
+    Rows of the same group, e.g. the account id, are kept in one fold. The
+    scaler of a fold is fitted on its training part only.
+
+    Returns:
+        List[Fold]: Scaled training features, training classes, scaled test
+            features and test classes of every fold.
+    """
+    folds = []
+    if groups is None:
+        groups = np.arange(len(X))
+    splitter = StratifiedGroupKFold(n_splits=k, shuffle=True, random_state=seed)
+    for train, test in splitter.split(X, y, groups):
+        scaler = StandardScaler().fit(X[train])
+        folds.append(
+            (scaler.transform(X[train]), y[train], scaler.transform(X[test]), y[test])
+        )
+    return folds
+
+
+def _single_row_latency(predict: Callable, X: np.ndarray, repeat: int = 20) -> float:
+    """:returns: median seconds to predict one row of X"""
+    times = np.empty(repeat)
+    for i in range(repeat):
+        row = X[i % len(X)].reshape(1, -1)
+        start = time.perf_counter()
+        predict(row)
+        times[i] = time.perf_counter() - start
+    return float(np.median(times))
+
+
+def evaluate(
+    family: str, params: Dict[str, Any], fold: Fold
+) -> Dict[str, float]:
+    """Fit and score a candidate on one fold.
+
+    Returns:
+        Dict[str, float]: Accuracy, fit time, batch prediction time per row
+            and single row prediction latency, times in seconds.
+    """
+    X_train, y_train, X_test, y_test = fold
+    estimator = make_estimator(family, params)
+    start = time.perf_counter()
+    estimator.fit(X_train, y_train)
+    fit_s = time.perf_counter() - start
+    start = time.perf_counter()
+    y_pred = estimator.predict(X_test)
+    predict_s = time.perf_counter() - start
+    return {
+        "accuracy": float(np.mean(y_pred == y_test)),
+        "fit_s": fit_s,
+        "predict_row_s": predict_s / len(X_test),
+        "latency_s": _single_row_latency(estimator.predict, X_test),
+    }
+
+
+def search(
+    X: np.ndarray,
+    y: np.ndarray,
+    families: Optional[List[str]] = None,
+    k: int = 5,
+    n_jobs: int = -1,
+    seed: int = 42,
+    groups: Optional[np.ndarray] = None,
+) -> List[Dict[str, Any]]:
+    """Cross-validate all candidates of the given model families in parallel.
+
+    Args:
+        X (numpy.ndarray): Unscaled feature matrix.
+        y (numpy.ndarray): Classes.
+        families (Optional[List[str]]): Keys of FAMILIES. Defaults to all.
+        k (int): Number of folds.
+        n_jobs (int): Number of processes, -1 for one per core.
+        seed (int): Seed of the fold split.
+        groups (Optional[numpy.ndarray]): Group of every row, e.g. the account
+            id. Rows of a group are never split across folds.
+
+    Returns:
+        List[Dict[str, Any]]: Family, hyperparameters and the fold means of
+            the metrics of evaluate of every candidate, most accurate first.
+    """
+    folds = scale_folds(X, np.asarray(y), groups=groups, k=k, seed=seed)
+    candidates = iter_candidates(families)
+    # joblib memory-maps the fold arrays, so they are shared by the worker
+    # processes instead of being pickled for every task.
+    scores = joblib.Parallel(n_jobs=n_jobs)(
+        joblib.delayed(evaluate)(family, params, fold)
+        for family, params in candidates
+        for fold in folds
+    )
+    results = []
+    for i, (family, params) in enumerate(candidates):
+        fold_scores = scores[i * k:(i + 1) * k]
+        result = {"family": family, "params": params}
+        for metric in fold_scores[0]:
+            result[metric] = float(np.mean([s[metric] for s in fold_scores]))
+        result["accuracy_std"] = float(
+            np.std([s["accuracy"] for s in fold_scores])
+        )
+        results.append(result)
+    results.sort(key=lambda r: (-r["accuracy"], r["latency_s"]))
+    return results
+
+
+def select(
+    results: List[Dict[str, Any]], max_latency_s: Optional[float] = None
+) -> Dict[str, Any]:
+    """:returns: most accurate result whose single row latency is within max_latency_s"""
+    within = [
+        r
+        for r in results
+        if max_latency_s is None or r["latency_s"] <= max_latency_s
+    ]
+    if not within:
+        raise ValueError(f"No candidate predicts within {max_latency_s}s.")
+    return max(within, key=lambda r: (r["accuracy"], -r["latency_s"]))
+
+
+def format_report(results: List[Dict[str, Any]]) -> str:
+    lines = [
+        f"{'family':<20} {'accuracy':>14} {'fit':>9} {'latency':>10}  params"
+    ]
+    for r in results:
+        lines.append(
+            f"{r['family']:<20} "
+            f"{r['accuracy']:.4f}±{r['accuracy_std']:.4f} "
+            f"{r['fit_s']:8.3f}s "
+            f"{r['latency_s'] * 1e3:8.3f}ms  "
+            f"{json.dumps(r['params'], sort_keys=True)}"
+        )
+    return "\n".join(lines)
+
+
+def _default_output() -> pathlib.Path:
+    stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    return definitions.get_out_dir() / "selection" / f"selection-{stamp}.json"
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Select the classifier by cross-validation."
+    )
+    parser.add_argument("--data", help="Training data, see setup_classifier.")
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument(
+        "--jobs", type=int, default=-1, help="Processes, -1 for all cores."
+    )
+    parser.add_argument(
+        "--families",
+        nargs="+",
+        choices=list(FAMILIES),
+        help="Model families to search, all by default.",
+    )
+    parser.add_argument(
+        "--max-latency-ms",
+        type=float,
+        help="Only select candidates predicting a single account this fast.",
+    )
+    parser.add_argument("--output", help="JSON file to write the report to.")
+    parser.add_argument(
+        "--no-save", action="store_true", help="Do not store the winner."
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    path = args.data or master.get_training_data_path()
+    df = master.read_training_table(path)
+    # Hold out the same accounts as setup_classifier.
+    train, _ = dataset.split_train_test(df, test_size=0.25, random_state=42)
+    df = df.iloc[train]
+    X = df[master.feature_header(df)].to_numpy(dtype=np.float64)
+    results = search(
+        X,
+        df["result"].to_numpy(),
+        families=args.families,
+        k=args.folds,
+        n_jobs=args.jobs,
+        seed=args.seed,
+        groups=df["id"].to_numpy(),
+    )
+    print(format_report(results))
+    max_latency_s = (
+        None if args.max_latency_ms is None else args.max_latency_ms / 1e3
+    )
+    winner = select(results, max_latency_s)
+    print(f"Selected {winner['family']} {json.dumps(winner['params'])}.")
+
+    output = pathutil.str_to_path(args.output or _default_output())
+    if not pathutil.is_dir(output.parent):
+        osutil.mkdir(output.parent)
+    with fileutil.atomic_write(output) as f:
+        json.dump(
+            {"folds": args.folds, "winner": winner, "results": results},
+            f,
+            indent=2,
+        )
+    print(f"Wrote report to '{output}'.")
+
+    if not args.no_save:
+        model = master.setup_classifier(
+            path=path,
+            estimator=make_estimator(winner["family"], winner["params"]),
+        )
+        modelstore.save(model)
+        print(f"Stored model in '{modelstore.get_model_path()}'.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
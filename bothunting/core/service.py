@@ -0,0 +1,462 @@
+"""
+Long-running classification service.
+
+The service loads the classifier once and keeps it in memory, together with
+the API cache and the rate limit scheduler, so a request costs the API calls
+for the account and nothing else. Every request is handled on its own
+thread. Its feature rows are collected for a few milliseconds along with
+those of concurrent requests, and the whole batch is scored with a single
+vectorized predict call.
+
+Endpoints:
+
+    POST /classify  {"username": "..."} or {"usernames": ["...", ...]}
+    GET  /classify?username=...
+    GET  /health    model, uptime and number of requests
+    GET  /latency   percentiles of the request, batch and prediction spans
+    GET  /metrics   all spans and counters in the Prometheus text format
+
+Run from the project root:
+
+    python -m bothunting.core.service [--host 127.0.0.1] [--port 8000]
+                                      [--socket PATH] [--window-ms 5]
+
+``--socket`` serves on a Unix socket instead of TCP, e.g. for
+``curl --unix-socket PATH http://localhost/health``. The service works with
+any API connector offering ``get_user`` and ``user_timeline``, so it can be
+run offline against benchmarks.synthetic.StubAPI.
+"""
+
+from __future__ import annotations
+
+import argparse
+import concurrent.futures
+import http.server
+import json
+import logging
+import os
+import queue
+import socketserver
+import sys
+import threading
+import time
+import urllib.parse
+from typing import Any, Callable, Dict, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from bothunting.core import cache
+from bothunting.core import constants as const
+from bothunting.core import fetcher
+from bothunting.core import inference
+from bothunting.core import instrumentation
+from bothunting.core import master
+from bothunting.core import modelstore
+from bothunting.core import records
+
+
+log = logging.getLogger(__name__)
+
+# Time the first request of a batch waits for others to join it.
+DEFAULT_WINDOW_S = 0.005
+DEFAULT_MAX_BATCH = 64
+
+
+class MicroBatcher:
+    """Collect items submitted by many threads and process them in batches.
+
+    A batch is closed window_s seconds after its first item arrived or once
+    it holds max_batch items, whichever comes first.
+
+    Args:
+        fn (Callable[[List[Any]], List[Any]]): Processes a batch of items and
+            returns one result per item.
+        name (str): Name of the batcher in spans and counters.
+        window_s (float): Maximum time an item waits for others.
+        max_batch (int): Maximum number of items per batch.
+    """
+
+    def __init__(
+        self,
+        fn: Callable[[List[Any]], List[Any]],
+        name: str,
+        window_s: float = DEFAULT_WINDOW_S,
+        max_batch: int = DEFAULT_MAX_BATCH,
+    ):
+        self.fn = fn
+        self.name = name
+        self.window_s = window_s
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(
+            target=self._run, name=f"batcher-{name}", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, item: Any) -> Any:
+        """Add item to the next batch and wait for its result."""
+        future = concurrent.futures.Future()
+        self._queue.put((item, future))
+        return future.result()
+
+    def close(self) -> None:
+        """Process the pending items and stop."""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            deadline = time.perf_counter() + self.window_s
+            stop = False
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    entry = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if entry is None:
+                    stop = True
+                    break
+                batch.append(entry)
+            self._process(batch)
+            if stop:
+                return
+
+    def _process(self, batch: List[Any]) -> None:
+        items = [item for item, _ in batch]
+        try:
+            with instrumentation.span(f"service.batch.{self.name}"):
+                results = self.fn(items)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        instrumentation.incr("batches", batcher=self.name)
+        instrumentation.incr("batched_items", len(batch), batcher=self.name)
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+
+class ClassificationService:
+    """Classifier, caches and batchers shared by all requests.
+
+    Args:
+        api (tweepy.API): Twitter API connector or a stand-in with the same
+            get_user and user_timeline methods.
+        model (Union[None, modelstore.Model, inference.InferenceModel]):
+            Classifier. Defaults to master.load_classifier().
+        cache_ (Union[None, cache.Cache]): Cache of API payloads. Defaults to
+            master.get_cache().
+        window_s (float): Time a feature row waits for others to be scored
+            with.
+        max_batch (int): Maximum number of rows scored at once.
+        max_workers (int): Number of accounts of a multi-account request
+            fetched at once.
+    """
+
+    def __init__(
+        self,
+        api: Any,
+        model: Union[None, modelstore.Model, inference.InferenceModel] = None,
+        cache_: Union[None, cache.Cache] = None,
+        window_s: float = DEFAULT_WINDOW_S,
+        max_batch: int = DEFAULT_MAX_BATCH,
+        max_workers: int = 16,
+    ):
+        self.model = master.load_classifier() if model is None else model
+        self.cache = master.get_cache() if cache_ is None else cache_
+        self.fetcher = fetcher.Fetcher(
+            api, max_workers=max_workers, cache_=self.cache
+        )
+        self.started = time.time()
+        self.n_requests = 0
+        self._lock = threading.Lock()
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers)
+        self._predict = MicroBatcher(
+            self._predict_batch, "predict", window_s, max_batch
+        )
+        self._fast_path = MicroBatcher(
+            self._fast_path_batch, "fast_path", window_s, max_batch
+        )
+
+    def close(self) -> None:
+        self._predict.close()
+        self._fast_path.close()
+        self._pool.shutdown()
+
+    def _predict_batch(self, rows: List[List[float]]) -> List[int]:
+        with instrumentation.span("classify.predict"):
+            classes = master.predict(self.model, np.asarray(rows, dtype=np.float64))
+        return [int(class_) for class_ in classes]
+
+    def _fast_path_batch(self, rows: List[List[float]]) -> List[Optional[int]]:
+        with instrumentation.span("classify.fast_path"):
+            labels, confident = master.predict_fast_path(
+                self.model, np.asarray(rows, dtype=np.float64)
+            )
+        return [
+            int(label) if ok else None
+            for label, ok in zip(labels.tolist(), confident.tolist())
+        ]
+
+    def _fast_path_class(self, fts: Dict[str, Any]) -> Optional[int]:
+        """:returns: class of the account with the given features if the fast path is confident, else None"""
+        if self.model.fast_path is None:
+            return None
+        row = [fts[c] for c in self.model.fast_path.columns]
+        if any(pd.isnull(v) for v in row):
+            return None
+        return self._fast_path.submit(row)
+
+    def classify(self, username: str) -> Dict[str, Any]:
+        """Classify a Twitter account.
+
+        Returns:
+            Dict[str, Any]: "username", "id" and "class", one of the values
+                of master.CLASS_NAMES.
+        """
+        with self._lock:
+            self.n_requests += 1
+        with instrumentation.span("service.classify"):
+            fast_path = {}
+
+            def needs_timeline(acc: records.AccountRecord) -> bool:
+                fts = master.compute_features(acc)
+                if not master.timeline_needed(self.model, fts):
+                    return False
+                class_ = fast_path[acc.id] = self._fast_path_class(fts)
+                outcome = "timeline" if class_ is None else "early_exit"
+                instrumentation.incr("fast_path", outcome=outcome)
+                return class_ is None
+
+            _, acc, tl = self.fetcher.fetch_by_screen_name(username, needs_timeline)
+            if acc is None:
+                # User could not be found by Twitter API connector.
+                class_ = -1
+            else:
+                fts = master.compute_features(acc, tl)
+                # The fast path was confident, or the timeline could not be
+                # fetched.
+                class_ = master.early_class(self.model, fts, fast_path.get(acc.id))
+                if class_ is None:
+                    class_ = self._predict.submit(
+                        [fts[c] for c in self.model.columns]
+                    )
+        instrumentation.incr("accounts_classified", class_=master.CLASS_NAMES[class_])
+        return {
+            "username": username,
+            "id": None if acc is None else acc.id,
+            "class": master.CLASS_NAMES[class_],
+        }
+
+    def classify_many(self, usernames: List[str]) -> List[Dict[str, Any]]:
+        """Classify accounts concurrently, see classify."""
+        return list(self._pool.map(self.classify, usernames))
+
+    def health(self) -> Dict[str, Any]:
+        return {
+            "status": "ok",
+            "model": type(self.model.classifier).__name__,
+            "data_hash": self.model.data_hash,
+            "uptime_s": time.time() - self.started,
+            "requests": self.n_requests,
+            "cache_hits": self.cache.hits,
+            "cache_misses": self.cache.misses,
+        }
+
+    def latency(self) -> Dict[str, Dict[str, float]]:
+        """:returns: count and percentiles in milliseconds of every span"""
+        spans = instrumentation.snapshot()["spans"]
+        return {
+            name: {
+                "count": stats["count"],
+                "p50_ms": stats["p50_s"] * 1e3,
+                "p90_ms": stats["p90_s"] * 1e3,
+                "p99_ms": stats["p99_s"] * 1e3,
+                "max_ms": stats["max_s"] * 1e3,
+            }
+            for name, stats in spans.items()
+        }
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "bothunting"
+
+    @property
+    def service(self) -> ClassificationService:
+        return self.server.service
+
+    def log_message(self, format: str, *args: Any) -> None:
+        # The client address is empty on Unix sockets.
+        log.debug("%s", format % args)
+
+    def _send(self, status: int, body: bytes, content_type: str) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status: int, value: Any) -> None:
+        self._send(status, json.dumps(value).encode(), "application/json")
+
+    def _classify(self, payload: Dict[str, Any]) -> None:
+        username, usernames = payload.get("username"), payload.get("usernames")
+        if not isinstance(username, str) and not isinstance(usernames, list):
+            self._send_json(400, {"error": "Pass 'username' or 'usernames'."})
+            return
+        try:
+            if isinstance(username, str):
+                result = self.service.classify(username)
+            else:
+                result = self.service.classify_many([str(u) for u in usernames])
+        except Exception as e:
+            log.exception("Classification failed")
+            self._send_json(500, {"error": str(e)})
+            return
+        self._send_json(200, result)
+
+    def do_GET(self) -> None:
+        url = urllib.parse.urlsplit(self.path)
+        with instrumentation.span("service.request"):
+            if url.path == "/classify":
+                query = urllib.parse.parse_qs(url.query)
+                self._classify({"username": query.get("username", [None])[0]})
+            elif url.path == "/health":
+                self._send_json(200, self.service.health())
+            elif url.path == "/latency":
+                self._send_json(200, self.service.latency())
+            elif url.path == "/metrics":
+                self._send(
+                    200,
+                    instrumentation.to_prometheus().encode(),
+                    "text/plain; version=0.0.4",
+                )
+            else:
+                self._send_json(404, {"error": f"Unknown path '{url.path}'."})
+
+    def do_POST(self) -> None:
+        url = urllib.parse.urlsplit(self.path)
+        with instrumentation.span("service.request"):
+            length = int(self.headers.get("Content-Length", 0))
+            try:
+                payload = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError:
+                self._send_json(400, {"error": "Body is not valid JSON."})
+                return
+            if url.path != "/classify":
+                self._send_json(404, {"error": f"Unknown path '{url.path}'."})
+            elif not isinstance(payload, dict):
+                self._send_json(400, {"error": "Body must be a JSON object."})
+            else:
+                self._classify(payload)
+
+
+class HTTPServer(http.server.ThreadingHTTPServer):
+    """Threaded HTTP server of a ClassificationService on a TCP port."""
+
+    daemon_threads = True
+
+    def __init__(self, address, service: ClassificationService):
+        self.service = service
+        super().__init__(address, _Handler)
+
+
+class UnixHTTPServer(socketserver.ThreadingUnixStreamServer):
+    """Threaded HTTP server of a ClassificationService on a Unix socket."""
+
+    daemon_threads = True
+
+    def __init__(self, path: str, service: ClassificationService):
+        self.service = service
+        if os.path.exists(path):
+            os.unlink(path)
+        super().__init__(path, _Handler)
+
+    def server_close(self) -> None:
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+
+def make_server(
+    service: ClassificationService,
+    host: str = "127.0.0.1",
+    port: int = 8000,
+    socket_path: Optional[str] = None,
+) -> socketserver.BaseServer:
+    """:returns: server of service on socket_path if given, else on host:port; port 0 picks a free port"""
+    if socket_path is not None:
+        return UnixHTTPServer(socket_path, service)
+    return HTTPServer((host, port), service)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Serve account classifications over HTTP."
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--socket", help="Serve on this Unix socket instead.")
+    parser.add_argument(
+        "--window-ms",
+        type=float,
+        default=DEFAULT_WINDOW_S * 1e3,
+        help="Time a request waits for others to be scored with.",
+    )
+    parser.add_argument(
+        "--max-batch",
+        type=int,
+        default=DEFAULT_MAX_BATCH,
+        help="Maximum number of accounts scored at once.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=16,
+        help="Accounts of a multi-account request fetched at once.",
+    )
+    parser.add_argument("-v", "--verbose", action="count", default=0)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=[logging.WARNING, logging.INFO, logging.DEBUG][min(args.verbose, 2)],
+        format="%(asctime)s %(name)s %(levelname)s %(message)s",
+    )
+    instrumentation.enable()
+    api = master.api_setup(
+        const.CONSUMER_KEY,
+        const.CONSUMER_SECRET,
+        const.ACCESS_TOKEN,
+        const.ACCESS_TOKEN_SECRET,
+        wait_on_rate_limit=False,
+    )
+    service = ClassificationService(
+        api,
+        window_s=args.window_ms / 1e3,
+        max_batch=args.max_batch,
+        max_workers=args.workers,
+    )
+    server = make_server(service, args.host, args.port, args.socket)
+    where = args.socket or "http://%s:%d" % server.server_address[:2]
+    print(f"Serving on {where}.", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,176 @@
+"""
+Streaming summary of a user's timeline.
+
+A TimelineAccumulator is fed the timeline page by page and keeps only what
+the tweet-based features need: the number of tweets per day, tweet, link,
+mention and hashtag counts, the link domains and text hashes seen and the
+range of tweet ids seen. Pages can be dropped as soon as they are
+accumulated; the memory needed per account is bounded by the 3,200 tweets
+the API returns at most.
+
+A stored summary is brought up to date by feeding it only the tweets newer
+than newest_id (see fetcher.summarize_timeline). The activity features are
+computed from the merged day counts, so they never need the full history
+again. Deleted tweets stay counted.
+"""
+
+from typing import Any, Dict, Iterable, Optional, Union
+
+import numpy as np
+
+from bothunting.core import activity
+from bothunting.core import records
+
+
+# Increase whenever the layout of to_dict changes, cached states of other
+# versions are discarded.
+STATE_VERSION = 2
+
+
+class TimelineAccumulator:
+    """Running summary of a timeline.
+
+    Attributes:
+        day_counts (Dict[int, int]): Number of tweets per day ordinal.
+        n_tweets (int): Number of tweets seen.
+        n_links (int): Number of links in the tweets seen.
+        n_link_tweets (int): Number of tweets with at least one link.
+        n_mentions (int): Number of mentions in the tweets seen.
+        n_hashtags (int): Number of hashtags in the tweets seen.
+        domains (Set[str]): Domains of the links seen.
+        text_hashes (Set[int]): Hashes of the texts seen, see
+            textfeatures.analyze.
+        newest_id (Optional[int]): Id of the newest tweet seen.
+        oldest_id (Optional[int]): Id of the oldest tweet seen.
+    """
+
+    __slots__ = (
+        "day_counts",
+        "n_tweets",
+        "n_links",
+        "n_link_tweets",
+        "n_mentions",
+        "n_hashtags",
+        "domains",
+        "text_hashes",
+        "newest_id",
+        "oldest_id",
+    )
+
+    def __init__(self):
+        self.day_counts = {}
+        self.n_tweets = 0
+        self.n_links = 0
+        self.n_link_tweets = 0
+        self.n_mentions = 0
+        self.n_hashtags = 0
+        self.domains = set()
+        self.text_hashes = set()
+        self.newest_id = None
+        self.oldest_id = None
+
+    def update(
+        self, tweets: Union[records.TweetBatch, Iterable[Any]]
+    ) -> None:
+        """Add a page of tweets, e.g. the result of one user_timeline call.
+
+        Args:
+            tweets (Union[records.TweetBatch, Iterable[Any]]): Batch of tweets
+                or tweepy Status models.
+        """
+        if not isinstance(tweets, records.TweetBatch):
+            tweets = records.TweetBatch.from_statuses(tweets)
+        if len(tweets) == 0:
+            return
+        days, counts = np.unique(tweets.day_ordinals(), return_counts=True)
+        for day, count in zip(days.tolist(), counts.tolist()):
+            self.day_counts[day] = self.day_counts.get(day, 0) + count
+        self.n_tweets += len(tweets)
+        self.n_links += int(tweets.link_counts.sum())
+        self.n_link_tweets += int(np.count_nonzero(tweets.link_counts))
+        self.n_mentions += int(tweets.mention_counts.sum())
+        self.n_hashtags += int(tweets.hashtag_counts.sum())
+        self.domains.update(tweets.domains.tolist())
+        self.text_hashes.update(tweets.text_hashes.tolist())
+        newest, oldest = int(tweets.ids.max()), int(tweets.ids.min())
+        if self.newest_id is None or newest > self.newest_id:
+            self.newest_id = newest
+        if self.oldest_id is None or oldest < self.oldest_id:
+            self.oldest_id = oldest
+
+    def histogram(
+        self,
+        origin: Optional[activity.DateLike] = None,
+        today: Optional[activity.DateLike] = None,
+    ) -> activity.ActivityHistogram:
+        """Build the activity histogram of all tweets seen.
+
+        Args:
+            origin (Optional[DateLike]): First day, e.g. the account's creation
+                date. Defaults to the day of the oldest tweet.
+            today (Optional[DateLike]): Last day. Defaults to today's date.
+        """
+        return activity.ActivityHistogram.from_day_counts(
+            np.fromiter(self.day_counts.keys(), dtype=np.int64),
+            np.fromiter(self.day_counts.values(), dtype=np.int64),
+            origin=None if origin is None else activity.to_ordinal(origin),
+            today=None if today is None else activity.to_ordinal(today),
+        )
+
+    def _ratio(self, n: int) -> float:
+        return n / self.n_tweets if self.n_tweets else 0.0
+
+    @property
+    def link_ratio(self) -> float:
+        """Fraction of tweets with at least one link."""
+        return self._ratio(self.n_link_tweets)
+
+    @property
+    def unique_domains(self) -> int:
+        """Number of distinct domains linked to."""
+        return len(self.domains)
+
+    @property
+    def duplicate_ratio(self) -> float:
+        """Fraction of tweets repeating the text of another tweet, ignoring links and mentions."""
+        return self._ratio(self.n_tweets - len(self.text_hashes))
+
+    @property
+    def mention_rate(self) -> float:
+        """Mentions per tweet."""
+        return self._ratio(self.n_mentions)
+
+    @property
+    def hashtag_rate(self) -> float:
+        """Hashtags per tweet."""
+        return self._ratio(self.n_hashtags)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "version": STATE_VERSION,
+            "day_counts": {str(k): v for k, v in self.day_counts.items()},
+            "n_tweets": self.n_tweets,
+            "n_links": self.n_links,
+            "n_link_tweets": self.n_link_tweets,
+            "n_mentions": self.n_mentions,
+            "n_hashtags": self.n_hashtags,
+            "domains": sorted(self.domains),
+            "text_hashes": sorted(self.text_hashes),
+            "newest_id": self.newest_id,
+            "oldest_id": self.oldest_id,
+        }
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "TimelineAccumulator":
+        accumulator = cls()
+        accumulator.day_counts = {int(k): v for k, v in d["day_counts"].items()}
+        accumulator.n_tweets = d["n_tweets"]
+        accumulator.n_links = d["n_links"]
+        accumulator.n_link_tweets = d["n_link_tweets"]
+        accumulator.n_mentions = d["n_mentions"]
+        accumulator.n_hashtags = d["n_hashtags"]
+        accumulator.domains = set(d["domains"])
+        accumulator.text_hashes = set(d["text_hashes"])
+        accumulator.newest_id = d["newest_id"]
+        accumulator.oldest_id = d["oldest_id"]
+        return accumulator
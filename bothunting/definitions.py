@@ -11,6 +11,10 @@ def get_root_python_package() -> pathlib.Path:
     return get_prj_root() / "bothunting"
 
 
+def get_datasets_dir() -> pathlib.Path:
+    return get_root_python_package() / "datasets" / "original_datasets"
+
+
 def get_out_dir() -> pathlib.Path:
     return get_prj_root() / "out"
 
@@ -1,9 +1,87 @@
+import contextlib
+import gzip
+import mmap
+import os
 import pathlib
-from typing import List, Union
+import uuid
+from typing import IO, Iterable, Iterator, List, Optional, Union
 
 from bothunting.utils import pathutil
 
 
+# Buffer size of files opened by this module.
+DEFAULT_BUFFER_SIZE = 1 << 20
+
+# Compression inferred from the file suffix.
+COMPRESSION_SUFFIXES = {".gz": "gzip", ".zst": "zstd"}
+
+
+def _compression(path: Union[str, pathlib.Path], compression: Optional[str]) -> Optional[str]:
+    """ Resolve compression "infer" from the suffix of path. """
+    if compression == "infer":
+        return COMPRESSION_SUFFIXES.get(pathutil.suffix(path))
+    if compression not in (None, "gzip", "zstd"):
+        raise ValueError(f"Unknown compression '{compression}'.")
+    return compression
+
+
+def _open(
+    path: Union[str, pathlib.Path],
+    mode: str,
+    compression: Optional[str],
+    encoding: str,
+    newline: Optional[str],
+    buffering: int,
+    level: Optional[int] = None,
+) -> IO:
+    """ Open file, compressed or not, in text or binary mode. """
+    kwargs = {} if "b" in mode else {"encoding": encoding, "newline": newline}
+    if compression is None:
+        return open(path, mode, buffering=buffering, **kwargs)
+    if compression == "gzip":
+        if "b" not in mode and "t" not in mode:
+            mode += "t"
+        return gzip.open(path, mode, compresslevel=9 if level is None else level, **kwargs)
+    try:
+        import zstandard
+    except ImportError as e:
+        raise ImportError("zstd compression requires the zstandard package.") from e
+    cctx = None
+    if "w" in mode or "a" in mode:
+        cctx = zstandard.ZstdCompressor(level=3 if level is None else level)
+    return zstandard.open(path, mode.replace("t", ""), cctx=cctx, **kwargs)
+
+
+def open_file(
+    path: Union[str, pathlib.Path],
+    mode: str = "r",
+    encoding: str = "utf-8",
+    compression: Optional[str] = "infer",
+    buffering: int = DEFAULT_BUFFER_SIZE,
+) -> IO:
+    """ Open file for reading, decompressing gzip (.gz) and zstd (.zst) files. """
+    if mode not in ("r", "rt", "rb"):
+        raise ValueError(f"open_file reads, use atomic_write to write (mode '{mode}').")
+    return _open(path, mode, _compression(path, compression), encoding, None, buffering)
+
+
+def iterlines(
+    path: Union[str, pathlib.Path],
+    encoding="utf-8",
+    lstrip=False,
+    rstrip=False,
+    compression: Optional[str] = "infer",
+) -> Iterator[str]:
+    """ Lazily iterate over lines of file, stripping each line as it is read. """
+    with open_file(path, encoding=encoding, compression=compression) as f:
+        for line in f:
+            if lstrip:
+                line = line.lstrip()
+            if rstrip:
+                line = line.rstrip()
+            yield line
+
+
 def readlines(
     path: Union[str, pathlib.Path],
     encoding="utf-8",
@@ -11,27 +89,85 @@ def readlines(
     rstrip=False,
 ) -> List[str]:
     """ Retrieve lines from file. """
-    with open(path, "r", encoding=encoding) as f:
-        lines = f.readlines()
-    if lstrip:
-        lines = [x.lstrip() for x in lines]
-    if rstrip:
-        lines = [x.rstrip() for x in lines]
-    return lines
+    return list(iterlines(path, encoding=encoding, lstrip=lstrip, rstrip=rstrip))
+
+
+@contextlib.contextmanager
+def open_mmap(path: Union[str, pathlib.Path]) -> Iterator[Union[mmap.mmap, bytes]]:
+    """ Memory-map file read-only; empty files give b"". """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b""
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            yield m
+
+
+@contextlib.contextmanager
+def atomic_write(
+    path: Union[str, pathlib.Path],
+    mode: str = "w",
+    encoding: str = "utf-8",
+    newline: Optional[str] = None,
+    buffering: int = DEFAULT_BUFFER_SIZE,
+    compression: Optional[str] = "infer",
+    level: Optional[int] = None,
+    fsync: bool = False,
+) -> Iterator[IO]:
+    """Write a file through a temporary file that replaces it once the block succeeds.
+
+    A crash or an exception inside the block leaves path as it was: the
+    content is written to a temporary file next to path and renamed to path
+    at the end.
+
+    Args:
+        path (Union[str, pathlib.Path]): Target file.
+        mode (str): "w" for text, "wb" for bytes.
+        encoding (str): Encoding in text mode.
+        newline (Optional[str]): Newline translation in text mode, see open.
+            Pass "" when writing CSV.
+        buffering (int): Buffer size of uncompressed files in bytes.
+        compression (Optional[str]): "gzip", "zstd" (requires the zstandard
+            package), None or "infer" from the suffix (.gz, .zst) of path.
+        level (Optional[int]): Compression level.
+        fsync (bool): Flush the content to disk before the rename.
+
+    Yields:
+        IO: File object to write to.
+    """
+    if mode not in ("w", "wt", "wb"):
+        raise ValueError(f"atomic_write only writes, not mode '{mode}'.")
+    path = pathutil.str_to_path(path)
+    compression = _compression(path, compression)
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        with _open(tmp, mode, compression, encoding, newline, buffering, level) as f:
+            yield f
+        if fsync:
+            fd = os.open(tmp, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        os.replace(tmp, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(tmp)
+        raise
 
 
 def writelines(
     path: Union[str, pathlib.Path],
-    lines: List[str],
+    lines: Iterable[str],
     append_newlines=False,
     append_data=False
 ) -> None:
-    """ Write lines to file. """
+    """ Write lines to file, atomically unless data is appended. """
     if append_newlines:
-        lines = [x + "\n" for x in lines]
-
-    mode = "w"
+        lines = (x + "\n" for x in lines)
     if append_data:
-        mode = "a"
-    with open(path, mode=mode) as f:
+        with open(path, mode="a", buffering=DEFAULT_BUFFER_SIZE) as f:
+            f.writelines(lines)
+        return
+    with atomic_write(path, compression=None) as f:
         f.writelines(lines)
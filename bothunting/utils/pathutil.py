@@ -1,6 +1,10 @@
+import collections
+import concurrent.futures
+import fnmatch
+import os
 import pathlib
 
-from typing import List, Union, Tuple
+from typing import Callable, Iterable, Iterator, List, Optional, Union, Tuple
 
 
 def path_to_str(path: Union[str, pathlib.Path]) -> str:
@@ -53,32 +57,107 @@ def is_dir(path: Union[str, pathlib.Path]) -> bool:
     return path.is_dir()
 
 
-def walk(
-    root: Union[str, pathlib.Path], depth: int = -1
-) -> Tuple[List[pathlib.Path], List[pathlib.Path], List[pathlib.Path]]:
-    """ Traverse directory tree recursively and return files and directories. """
-    root = str_to_path(root)
+def _scandir(path: str) -> List[os.DirEntry]:
+    """ List entries of directory, none if it cannot be read. """
+    try:
+        with os.scandir(path) as it:
+            return list(it)
+    except OSError:
+        # e.g. permission denied or removed while walking
+        return []
+
+
+def iter_walk(
+    root: Union[str, pathlib.Path],
+    depth: int = -1,
+    pattern: Optional[str] = None,
+    suffixes: Optional[Iterable[str]] = None,
+    files_only: bool = False,
+    max_workers: Optional[int] = None,
+) -> Iterator[os.DirEntry]:
+    """Traverse directory tree breadth first and yield its entries lazily.
+
+    Entries are os.DirEntry objects, whose is_file and is_dir reuse the file
+    type read with the directory instead of calling stat per entry.
+
+    Args:
+        root (Union[str, pathlib.Path]): Directory to traverse. Not yielded.
+        depth (int): Number of directory levels to list, -1 for all. 1
+            lists the entries of root only.
+        pattern (Optional[str]): Only yield files whose name matches this
+            glob pattern, e.g. "*.csv".
+        suffixes (Optional[Iterable[str]]): Only yield files with one of
+            these suffixes, e.g. [".json", ".npy"].
+        files_only (bool): Do not yield directories.
+        max_workers (Optional[int]): List directories on this many threads.
+            Entries are then yielded in no particular order. Defaults to
+            listing them one by one in the calling thread.
+    """
+    root = path_to_str(root)
+    if not os.path.isdir(root):
+        return
+    suffixes = None if suffixes is None else tuple(suffixes)
+
+    def visit(
+        entries: List[os.DirEntry], level: int, scan: Callable[[str, int], None]
+    ) -> Iterator[os.DirEntry]:
+        descend = depth == -1 or level + 1 < depth
+        for entry in entries:
+            if entry.is_file():
+                if pattern is not None and not fnmatch.fnmatch(entry.name, pattern):
+                    continue
+                if suffixes is not None and not entry.name.endswith(suffixes):
+                    continue
+                yield entry
+            elif entry.is_dir():
+                if descend:
+                    scan(entry.path, level + 1)
+                if not files_only:
+                    yield entry
+
+    if max_workers is None or max_workers <= 1:
+        queue = collections.deque([(root, 0)])
+
+        def enqueue(path: str, level: int) -> None:
+            queue.append((path, level))
+
+        while queue:
+            path, level = queue.popleft()
+            yield from visit(_scandir(path), level, enqueue)
+        return
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as pool:
+        pending = {}
+
+        def submit(path: str, level: int) -> None:
+            pending[pool.submit(_scandir, path)] = level
+
+        submit(root, 0)
+        while pending:
+            done, _ = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                yield from visit(future.result(), pending.pop(future), submit)
 
-    files = []
-    dirs = []
-    dirs_new = []
 
+def walk(
+    root: Union[str, pathlib.Path],
+    depth: int = -1,
+    pattern: Optional[str] = None,
+    suffixes: Optional[Iterable[str]] = None,
+    max_workers: Optional[int] = None,
+) -> Tuple[List[pathlib.Path], List[pathlib.Path]]:
+    """ Traverse directory tree recursively and return files and directories, root first; see iter_walk. """
     if not is_dir(root):
-        return [], [], []
-    dirs.append(root)
-    dirs_new.append(root)
-    while dirs_new:
-        dir_ = dirs_new.pop(0)
-        if depth != -1:
-            relpath = dir_.relative_to(root)
-            parts_ = relpath.parts
-            if len(parts_) >= depth:
-                break
-
-        for x in dir_.iterdir():
-            if is_file(x):
-                files.append(x)
-            elif is_dir(x):
-                dirs.append(x)
-                dirs_new.append(x)
+        return [], []
+    files = []
+    dirs = [str_to_path(root)]
+    for entry in iter_walk(
+        root, depth, pattern=pattern, suffixes=suffixes, max_workers=max_workers
+    ):
+        if entry.is_dir():
+            dirs.append(pathlib.Path(entry.path))
+        else:
+            files.append(pathlib.Path(entry.path))
     return files, dirs
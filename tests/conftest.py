@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+
+from benchmarks import synthetic
+from bothunting.core import instrumentation
+from bothunting.core import master
+from bothunting.core import modelstore
+
+
+@pytest.fixture(scope="session")
+def stored_model(tmp_path_factory):
+    """Classifier trained on a synthetic table and stored in a temporary directory."""
+    root = tmp_path_factory.mktemp("model")
+    data = root / "complete_data.csv"
+    synthetic.make_training_table(np.random.default_rng(0), 2000).to_csv(
+        data, index=False
+    )
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(modelstore, "get_model_path", lambda: root / "classifier.joblib")
+        mp.setattr(master, "get_training_data_path", lambda: data)
+        yield master.load_classifier()
+
+
+@pytest.fixture
+def instrumented():
+    """Enable instrumentation with an empty registry for one test."""
+    instrumentation.registry.reset()
+    instrumentation.enable()
+    yield instrumentation.registry
+    instrumentation.disable()
+    instrumentation.registry.reset()
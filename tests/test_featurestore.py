@@ -0,0 +1,28 @@
+import json
+
+import numpy as np
+import pytest
+
+from benchmarks import synthetic
+from bothunting.core import featurestore
+
+
+@pytest.fixture
+def table():
+    return synthetic.make_training_table(np.random.default_rng(0), 100)
+
+
+def test_write_replaces_a_store_of_an_outdated_format(table, tmp_path):
+    featurestore.write(table, tmp_path, format="npy")
+    schema_path = tmp_path / featurestore.SCHEMA_FILE
+    schema = json.loads(schema_path.read_text())
+    schema["format_version"] = featurestore.FORMAT_VERSION - 1
+    schema_path.write_text(json.dumps(schema))
+    with pytest.raises(ValueError):
+        featurestore.load_schema(tmp_path)
+
+    featurestore.write(table.iloc[:50], tmp_path, format="npy")
+    assert featurestore.load_schema(tmp_path)["partitions"] == {
+        featurestore.DEFAULT_PARTITION: {"rows": 50}
+    }
+    assert len(featurestore.read(tmp_path)) == 50
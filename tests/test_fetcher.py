@@ -0,0 +1,104 @@
+import time
+import types
+
+import pytest
+import tweepy
+
+from benchmarks import synthetic
+from bothunting.core import fetcher
+
+
+class FakeClock:
+    """Monotonic clock that only advances when sleep is called."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.slept = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+def too_many_requests(reset_in: float) -> tweepy.errors.TooManyRequests:
+    response = types.SimpleNamespace(
+        status_code=429,
+        reason="Too Many Requests",
+        headers={"x-rate-limit-reset": str(time.time() + reset_in)},
+    )
+    return tweepy.errors.TooManyRequests(response, response_json={})
+
+
+def test_token_bucket_hands_out_capacity_then_waits_for_refill():
+    clock = FakeClock()
+    bucket = fetcher.TokenBucket(2, 10.0, clock=clock, sleep=clock.sleep)
+    assert bucket.acquire() == 0.0
+    assert bucket.acquire() == 0.0
+    assert bucket.try_acquire() == pytest.approx(5.0)
+    assert bucket.acquire() == pytest.approx(5.0)
+    assert clock.now == pytest.approx(5.0)
+
+
+def test_token_bucket_refills_up_to_capacity_only():
+    clock = FakeClock()
+    bucket = fetcher.TokenBucket(2, 10.0, clock=clock, sleep=clock.sleep)
+    bucket.acquire()
+    bucket.acquire()
+    clock.now += 1000.0
+    assert bucket.acquire() == 0.0
+    assert bucket.acquire() == 0.0
+    assert bucket.try_acquire() > 0.0
+
+
+def test_token_bucket_block_for_starts_refill_after_the_block():
+    clock = FakeClock()
+    bucket = fetcher.TokenBucket(10, 10.0, clock=clock, sleep=clock.sleep)
+    bucket.block_for(30.0)
+    assert bucket.try_acquire() == pytest.approx(30.0)
+    clock.now = 30.0
+    # No token accrues while blocked.
+    assert bucket.try_acquire() == pytest.approx(1.0)
+    clock.now = 31.0
+    assert bucket.try_acquire() == 0.0
+
+
+def test_scheduler_retries_after_the_reported_reset():
+    clock = FakeClock()
+    scheduler = fetcher.RateLimitScheduler(
+        {"get_user": (10, 10.0)}, clock=clock, sleep=clock.sleep
+    )
+    outcomes = [too_many_requests(60.0), "user"]
+
+    def call():
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    assert scheduler.call("get_user", call) == "user"
+    assert not outcomes
+    assert clock.now == pytest.approx(61.0, abs=1.0)
+    assert scheduler.waited == pytest.approx(clock.now)
+
+
+def test_fetch_many_calls_the_api_once_per_user_and_timeline_page():
+    api = synthetic.StubAPI(n_tweets=fetcher.PAGE_SIZE)
+    fetcher_ = fetcher.Fetcher(api, max_workers=4)
+    results = list(fetcher_.fetch_many(range(1, 21)))
+    assert sorted(user_id for user_id, _, _ in results) == list(range(1, 21))
+    summaries = [tl for _, acc, tl in results if not acc.protected]
+    assert all(tl is not None and tl.n_tweets > 0 for tl in summaries)
+    # One get_user call per user, one full and one empty page per timeline.
+    assert api.calls == 20 + 2 * len(summaries)
+
+
+def test_fetch_by_screen_name_reports_unknown_users():
+    fetcher_ = fetcher.Fetcher(synthetic.StubAPI())
+    assert fetcher_.fetch_by_screen_name("missing_user") == (
+        "missing_user",
+        None,
+        None,
+    )
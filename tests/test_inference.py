@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+from sklearn.preprocessing import StandardScaler
+
+from benchmarks import synthetic
+from bothunting.core import constants as const
+from bothunting.core import inference
+from bothunting.core import modelstore
+
+
+def fit_model(classifier, missing: float = 0.0) -> modelstore.Model:
+    rng = np.random.default_rng(0)
+    table = synthetic.make_training_table(rng, 2000)
+    X = table[const.FEATURE_COLUMNS].to_numpy(dtype=np.float64)
+    scaler = StandardScaler().fit(X)
+    X = scaler.transform(X)
+    X[rng.random(X.shape) < missing] = np.nan
+    return modelstore.Model(
+        classifier=classifier.fit(X, table["result"]),
+        scaler=scaler,
+        columns=const.FEATURE_COLUMNS,
+        data_hash="test",
+    )
+
+
+def rows(n: int, missing: float = 0.0, seed: int = 1) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n, len(const.FEATURE_COLUMNS)))
+    X[rng.random(X.shape) < missing] = np.nan
+    return X
+
+
+def exported(model, tmp_path, **kwargs) -> inference.InferenceModel:
+    path = tmp_path / "model.npz"
+    inference.save(inference.export(model, **kwargs), path)
+    return inference.load(path)
+
+
+@pytest.fixture(scope="module")
+def forest():
+    # Trained with missing values, so the trees learn where to send them.
+    return fit_model(
+        RandomForestClassifier(n_estimators=20, random_state=0), missing=0.1
+    )
+
+
+def test_forest_matches_predict_proba(forest, tmp_path):
+    X = rows(500)
+    expected = forest.classifier.predict_proba(X)
+    actual = exported(forest, tmp_path).classifier.predict_proba(X)
+    np.testing.assert_allclose(actual, expected, rtol=0, atol=inference.MAX_DEVIATION)
+
+
+def test_forest_sends_missing_values_like_scikit_learn(forest, tmp_path):
+    X = rows(500, missing=0.3)
+    expected = forest.classifier.predict_proba(X)
+    actual = exported(forest, tmp_path).classifier.predict_proba(X)
+    np.testing.assert_allclose(actual, expected, rtol=0, atol=inference.MAX_DEVIATION)
+
+
+def test_forest_single_rows_match_batch(forest, tmp_path):
+    classifier = exported(forest, tmp_path).classifier
+    X = rows(50, missing=0.2)
+    batch = classifier.predict_proba(X)
+    single = np.vstack([classifier.predict_proba(x.reshape(1, -1)) for x in X])
+    np.testing.assert_array_equal(single, batch)
+
+
+def test_deviation_of_export_is_within_tolerance(forest):
+    assert inference.deviation(forest, inference.export(forest)) <= inference.MAX_DEVIATION
+
+
+def test_deviation_detects_pruned_forest(forest):
+    pruned = inference.export(forest, max_depth=2)
+    assert inference.deviation(forest, pruned) > inference.MAX_DEVIATION
+
+
+def test_linear_matches_predict_proba(tmp_path):
+    model = fit_model(LogisticRegression(max_iter=1000))
+    X = rows(200)
+    np.testing.assert_allclose(
+        exported(model, tmp_path).classifier.predict_proba(X),
+        model.classifier.predict_proba(X),
+        rtol=0,
+        atol=inference.MAX_DEVIATION,
+    )
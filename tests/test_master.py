@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from benchmarks import synthetic
+from bothunting.core import cache
+from bothunting.core import constants as const
+from bothunting.core import master
+from bothunting.core import modelstore
+
+USERNAMES = [f"user{i}" for i in range(40)] + ["missing_user"]
+
+
+def counter_totals(snapshot):
+    totals = {}
+    for counter in snapshot["counters"]:
+        totals[counter["name"]] = totals.get(counter["name"], 0) + counter["value"]
+    return totals
+
+
+def test_process_pool_counts_every_call_once(stored_model, instrumented):
+    api = synthetic.StubAPI()
+    results = list(
+        master.classify_accounts(
+            USERNAMES, api, processes=2, chunk_size=4, cache_=cache.Cache(":memory:")
+        )
+    )
+    found = [r for r in results if r["id"] is not None]
+    assert len(found) == 40
+    snapshot = instrumented.snapshot()
+    totals = counter_totals(snapshot)
+    # The stub counts the calls it serves one by one.
+    assert totals["api_calls"] == api.calls
+    accounts = [api.get_user(screen_name=r["username"]) for r in found]
+    # Only accounts with an accessible timeline ask the fast path.
+    asked = [a for a in accounts if not (a.verified or a.protected)]
+    assert totals["fast_path"] == len(asked)
+    assert snapshot["spans"]["classify.features"]["count"] == len(found)
+    assert snapshot["spans"]["model.load"]["count"] == 1
+
+
+@pytest.fixture
+def account_only_model(tmp_path, monkeypatch):
+    """Classifier trained without tweet-based features, like the one of the bundled datasets."""
+    table = synthetic.make_training_table(np.random.default_rng(0), 2000)
+    table[const.TWEET_FEATURES] = np.nan
+    data = tmp_path / "complete_data.csv"
+    table.to_csv(data, index=False)
+    monkeypatch.setattr(modelstore, "get_model_path", lambda: tmp_path / "m.joblib")
+    monkeypatch.setattr(master, "get_training_data_path", lambda: data)
+    monkeypatch.setattr(master, "model", None)
+    model = master.load_classifier()
+    assert not set(model.columns) & set(const.TWEET_FEATURES)
+    return model
+
+
+def test_account_only_model_fetches_no_timelines(account_only_model, monkeypatch):
+    api = synthetic.StubAPI()
+    results = list(
+        master.classify_accounts(
+            USERNAMES, api, processes=2, cache_=cache.Cache(":memory:")
+        )
+    )
+    # One get_user call per account and none to user_timeline.
+    assert api.calls == len(USERNAMES)
+    assert all(r["class"] != master.CLASS_NAMES[-1] for r in results if r["id"])
+
+    api = synthetic.StubAPI()
+    monkeypatch.setattr(master, "api_cache", cache.Cache(":memory:"))
+    for name in USERNAMES[:-1]:
+        assert master.classify_account(name, api) != master.CLASS_NAMES[-1]
+    assert api.calls == len(USERNAMES) - 1
+
+
+def test_process_pool_classifies_like_classify_account(stored_model, monkeypatch):
+    monkeypatch.setattr(master, "model", None)
+    api = synthetic.StubAPI()
+    batch = {
+        r["username"]: r["class"]
+        for r in master.classify_accounts(
+            USERNAMES, api, processes=2, cache_=cache.Cache(":memory:")
+        )
+    }
+    monkeypatch.setattr(master, "api_cache", cache.Cache(":memory:"))
+    single = {name: master.classify_account(name, api) for name in USERNAMES[:-1]}
+    assert {name: batch[name] for name in single} == single
+    assert batch["missing_user"] == master.CLASS_NAMES[-1]
@@ -0,0 +1,170 @@
+import concurrent.futures
+import http.client
+import json
+import threading
+
+import pytest
+
+from benchmarks import synthetic
+from bothunting.core import cache
+from bothunting.core import master
+from bothunting.core import service
+
+# Long enough for all items of a test to join the first batch.
+WINDOW_S = 0.5
+
+
+def make_service(model, window_s=service.DEFAULT_WINDOW_S):
+    return service.ClassificationService(
+        synthetic.StubAPI(),
+        model=model,
+        cache_=cache.Cache(":memory:"),
+        window_s=window_s,
+    )
+
+
+@pytest.fixture
+def classifier(stored_model):
+    service_ = make_service(stored_model)
+    yield service_
+    service_.close()
+
+
+@pytest.fixture
+def server(classifier):
+    server_ = service.make_server(classifier, port=0)
+    thread = threading.Thread(
+        target=server_.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True
+    )
+    thread.start()
+    yield server_
+    server_.shutdown()
+    server_.server_close()
+
+
+def request(server, method, path, body=None):
+    host, port = server.server_address[:2]
+    connection = http.client.HTTPConnection(host, port)
+    try:
+        connection.request(method, path, body=body)
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        connection.close()
+
+
+def counter(snapshot, name, **labels):
+    labels = {k: str(v) for k, v in labels.items()}
+    return sum(
+        c["value"]
+        for c in snapshot["counters"]
+        if c["name"] == name and c["labels"] == labels
+    )
+
+
+def test_micro_batcher_processes_concurrent_items_in_one_batch():
+    batches = []
+
+    def double(items):
+        batches.append(len(items))
+        return [2 * item for item in items]
+
+    batcher = service.MicroBatcher(double, "test", window_s=WINDOW_S)
+    try:
+        with concurrent.futures.ThreadPoolExecutor(8) as pool:
+            results = list(pool.map(batcher.submit, range(8)))
+    finally:
+        batcher.close()
+    assert results == [2 * i for i in range(8)]
+    assert batches == [8]
+
+
+def test_micro_batcher_closes_full_batches():
+    batches = []
+
+    def identity(items):
+        batches.append(len(items))
+        return items
+
+    batcher = service.MicroBatcher(identity, "test", window_s=WINDOW_S, max_batch=3)
+    try:
+        with concurrent.futures.ThreadPoolExecutor(7) as pool:
+            assert list(pool.map(batcher.submit, range(7))) == list(range(7))
+    finally:
+        batcher.close()
+    assert sum(batches) == 7
+    assert max(batches) == 3
+
+
+def test_micro_batcher_passes_errors_to_every_item():
+    def fail(items):
+        raise RuntimeError("batch failed")
+
+    batcher = service.MicroBatcher(fail, "test", window_s=0.0)
+    try:
+        with pytest.raises(RuntimeError):
+            batcher.submit(1)
+    finally:
+        batcher.close()
+
+
+def test_concurrent_requests_share_one_prediction_batch(stored_model, instrumented):
+    usernames = [f"user{i}" for i in range(16)]
+    classifier = make_service(stored_model, window_s=WINDOW_S)
+    try:
+        results = classifier.classify_many(usernames)
+    finally:
+        classifier.close()
+    assert [r["username"] for r in results] == usernames
+    snapshot = instrumented.snapshot()
+    predicted = counter(snapshot, "batched_items", batcher="predict")
+    assert predicted > 1
+    assert counter(snapshot, "batches", batcher="predict") == 1
+
+
+def test_health(server):
+    request(server, "GET", "/classify?username=user1")
+    status, health = request(server, "GET", "/health")
+    assert status == 200
+    assert health["status"] == "ok"
+    assert health["requests"] == 1
+    assert health["model"] == "RandomForestClassifier"
+
+
+def test_latency_reports_request_spans(server, instrumented):
+    request(server, "GET", "/classify?username=user1")
+    status, latency = request(server, "GET", "/latency")
+    assert status == 200
+    assert latency["service.classify"]["count"] == 1
+    assert latency["service.request"]["p50_ms"] > 0
+
+
+@pytest.mark.parametrize("body", [b"{not json", b"[1, 2]", b'{"user": "x"}'])
+def test_malformed_body_is_rejected(server, body):
+    status, response = request(server, "POST", "/classify", body)
+    assert status == 400
+    assert "error" in response
+
+
+def test_unknown_path(server):
+    assert request(server, "GET", "/nope")[0] == 404
+
+
+def test_missing_user_is_classified_as_error(server):
+    status, result = request(server, "GET", "/classify?username=missing_user")
+    assert status == 200
+    assert result == {
+        "username": "missing_user",
+        "id": None,
+        "class": master.CLASS_NAMES[-1],
+    }
+
+
+def test_classify_many_over_http(server):
+    usernames = ["user1", "missing_user", "user2"]
+    status, results = request(
+        server, "POST", "/classify", json.dumps({"usernames": usernames})
+    )
+    assert status == 200
+    assert [r["username"] for r in results] == usernames
+    assert results[1]["class"] == master.CLASS_NAMES[-1]
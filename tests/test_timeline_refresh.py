@@ -0,0 +1,83 @@
+from benchmarks import synthetic
+from bothunting.core import cache
+from bothunting.core import constants as const
+from bothunting.core import fetcher
+from bothunting.core import master
+
+USER_ID = 7
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1e9
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def summarize(api, cache_):
+    return fetcher.summarize_timeline(api, USER_ID, cache_=cache_)
+
+
+def test_fresh_summary_is_served_from_the_cache():
+    api = synthetic.StubAPI()
+    cache_ = cache.Cache(":memory:", clock=FakeClock())
+    first = summarize(api, cache_)
+    calls = api.calls
+    second = summarize(api, cache_)
+    assert api.calls == calls
+    assert second.to_dict() == first.to_dict()
+
+
+def test_stale_summary_fetches_only_newer_tweets():
+    api = synthetic.StubAPI()
+    clock = FakeClock()
+    cache_ = cache.Cache(":memory:", clock=clock)
+    first = summarize(api, cache_)
+    tweet = api.post(USER_ID, "new #tag http://t.co/y")
+    clock.now += fetcher.REFRESH_AFTER + 1
+    calls = api.calls
+    refreshed = summarize(api, cache_)
+    # One page with the new tweet and the empty page ending the timeline.
+    assert api.calls == calls + 2
+    assert refreshed.n_tweets == first.n_tweets + 1
+    assert refreshed.newest_id == tweet.id
+
+
+def test_refreshed_summary_equals_a_full_fetch():
+    api = synthetic.StubAPI()
+    clock = FakeClock()
+    cache_ = cache.Cache(":memory:", clock=clock)
+    summarize(api, cache_)
+    api.post(USER_ID, "@user hello")
+    api.post(USER_ID, "http://t.co/z")
+    clock.now += fetcher.REFRESH_AFTER + 1
+    refreshed = summarize(api, cache_)
+    full = summarize(api, None)
+    assert refreshed.to_dict() == full.to_dict()
+
+
+def test_cached_features_follow_the_refreshed_timeline():
+    api = synthetic.StubAPI()
+    clock = FakeClock()
+    cache_ = cache.Cache(":memory:", clock=clock)
+    username = next(
+        f"user{i}"
+        for i in range(100)
+        if not api.get_user(screen_name=f"user{i}").protected
+    )
+    first, user_id = master._get_features_and_user_id(username, api, cache_)
+    calls = api.calls
+    cached, _ = master._get_features_and_user_id(username, api, cache_)
+    assert api.calls == calls
+    assert cached.equals(first)
+
+    for _ in range(50):
+        api.post(user_id, "http://t.co/x http://t.co/x")
+    clock.now += fetcher.REFRESH_AFTER + 1
+    stale, _ = master._get_features_and_user_id(
+        username, api, cache_, account_only=True
+    )
+    assert stale[list(const.TWEET_FEATURES)].isna().all(axis=None)
+    refreshed, _ = master._get_features_and_user_id(username, api, cache_)
+    assert refreshed.at[user_id, "link_ratio"] > first.at[user_id, "link_ratio"]